@@ -1,18 +1,10 @@
 import streamlit as st
 from PIL import Image
-import pytesseract
 import pandas as pd
-import re
 
-import cv2
-import numpy as np
-
-def preprocess_image(pil_image):
-    img = np.array(pil_image.convert("L"))  # Convert to grayscale
-    img = cv2.resize(img, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
-    img = cv2.GaussianBlur(img, (5, 5), 0)
-    _, img = cv2.threshold(img, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-    return Image.fromarray(img)
+from operating_point import preprocess_for
+from extraction import extract_values
+from ocr_backends import TESSERACT_LANG, run_tesseract_with_confidence
 
 
 st.set_page_config(page_title="Extract Report", layout="centered")
@@ -22,37 +14,20 @@ st.markdown("Upload or photograph a lab report: the app will extract **Test Name
 
 uploaded_file = st.file_uploader("📷 Upload image (JPG/PNG)", type=["jpg", "jpeg", "png"])
 
-def extract_values(text):
-    lines = text.split("\n")
-    results = []
-    pattern = r"([A-Za-z0-9 #\(\)/%µ\^\-]+?)\s+([\d.,]+)\s*([a-zA-Z/µ^%³]+)?"
-    
-    for line in lines:
-        match = re.match(pattern, line.strip())
-        if match:
-            test, value, unit = match.groups()
-            try:
-                value_float = float(value.replace(",", "."))
-                results.append({
-                    "Test": test.strip(),
-                    "Value": value_float,
-                    "Unit": unit or ""
-                })
-            except:
-                continue
-    return results
-
     
 if uploaded_file:
     image = Image.open(uploaded_file).convert("RGB")
     st.image(image, caption="Uploaded Report", use_container_width=True)
 
-    image = preprocess_image(Image.open(uploaded_file))
+    image = preprocess_for(Image.open(uploaded_file), "tesseract")
 
     
     with st.spinner("📖 Extracting values..."):
-        text = pytesseract.image_to_string(image, lang="eng+ita")
+        # Engines stay loaded across uploads, so only the first one pays for loading the languages
+        text, confidences = run_tesseract_with_confidence(image, lang=TESSERACT_LANG)
         st.subheader("📝 Raw OCR Text")
+        if confidences:
+            st.caption(f"Mean word confidence: {sum(confidences) / len(confidences):.0f}%")
         st.text_area("Recognized Text", text, height=200)
         data = extract_values(text)
 
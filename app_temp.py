@@ -1,22 +1,14 @@
 import streamlit as st
 from PIL import Image
 import io
+import logging
 from ollama_utils import OllamaClient
 
-from ollama_ocr import OCRProcessor
-import tempfile
+from ocr_backends import run_ollama_ocr
 
-import cv2
-import numpy as np
-
-
-def preprocess_image(pil_image):
-    img = np.array(pil_image.convert("L"))  # Convert to grayscale
-    img = cv2.resize(img, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
-    img = cv2.GaussianBlur(img, (5, 5), 0)
-    _, img = cv2.threshold(img, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-    return Image.fromarray(img)
+from preprocessing import preprocess_image
 
+logger = logging.getLogger(__name__)
 
 # Page configuration
 st.set_page_config(
@@ -111,18 +103,12 @@ with col2:
                 # result = client.analyze_image(image, custom_prompt)
 
                 ##### TEST
-                # Save uploaded PIL image to a temp file
-                with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as tmp:
-                    image.save(tmp.name)
-                    temp_path = tmp.name
-
-                ocr = OCRProcessor(model_name="llama3.2-vision:11b")  # llama3.2-vision:11b #gemma3:4b
-
-                result = ocr.process_image(
-                    image_path=temp_path,
-                    format_type="markdown",  # Options: markdown, text, json, structured, key_value
+                # The preprocessed image goes to Ollama-OCR in memory, no temp file
+                result = run_ollama_ocr(
+                    image,
+                    model_name="llama3.2-vision:11b",  # llama3.2-vision:11b #gemma3:4b
                     # language="eng",
-                    custom_prompt="""Using default prompt: Extract all blood count values content from this image in en **exactly as it appears**, without modification, summarization, or omission.
+                    prompt="""Using default prompt: Extract all blood count values content from this image in en **exactly as it appears**, without modification, summarization, or omission.
                                 Format the output in markdown:
                                 - output always test name, value and unit (if present)
                                 - Use headers (#, ##, ###) **only if they appear in the image**
@@ -132,8 +118,7 @@ with col2:
 """
                 )
 
-                print('#####################')
-                print(result)
+                logger.debug("Recognized text:\n%s", result)
 
                 ####
 
@@ -0,0 +1,311 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from typing import AsyncIterator, Iterable, Optional, Union
+
+import aiohttp
+from PIL import Image
+
+import telemetry
+from ollama_scheduler import INTERACTIVE, OllamaScheduler, Slot
+from ollama_utils import encode_image
+from operating_point import is_lossless
+from structured_output import LAB_SCHEMA, IncrementalRowParser, is_complete_row, rows_from_document
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class OllamaError(Exception):
+    """Raised when Ollama returns an error or cannot be reached after all retries."""
+
+
+class OllamaResponseError(OllamaError):
+    """Raised when a line of Ollama's stream is not the JSON object it should be."""
+
+
+class AsyncOllamaClient:
+    """
+    Asynchronous Ollama client with a pooled HTTP session and streaming output.
+
+    A single aiohttp session is reused for every request. At most
+    max_in_flight generations run at once; further calls wait for a slot.
+    Connection errors and retryable HTTP statuses are retried with
+    exponential backoff, but only until the first token has been received
+    so a stream is never duplicated.
+
+    With a scheduler (see ollama_scheduler.get_scheduler), every generation
+    also waits for a scheduler slot, so clients of different sessions share
+    one queue that groups requests by model and serves interactive ones first.
+
+    Use as an async context manager, or call close() when done.
+    """
+
+    def __init__(
+            self,
+            base_url: str = "http://localhost:11434",
+            max_in_flight: int = 4,
+            timeout: float = 300.0,
+            connect_timeout: float = 10.0,
+            max_retries: int = 3,
+            backoff: float = 0.5,
+            scheduler: Optional[OllamaScheduler] = None,
+            priority: int = INTERACTIVE
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.scheduler = scheduler
+        self.priority = priority
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    async def __aenter__(self) -> "AsyncOllamaClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # Created lazily so the client can be constructed outside a running event loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_in_flight, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+        return self._session
+
+    def _request_timeout(self, timeout: Optional[float]) -> aiohttp.ClientTimeout:
+        return aiohttp.ClientTimeout(total=timeout or self.timeout, connect=self.connect_timeout)
+
+    async def _sleep_before_retry(self, attempt: int) -> None:
+        delay = self.backoff * (2 ** attempt)
+        await asyncio.sleep(delay + random.uniform(0, delay / 2))
+
+    async def stream_generate(
+            self,
+            model: str,
+            prompt: str,
+            images: Optional[list[str]] = None,
+            options: Optional[dict] = None,
+            timeout: Optional[float] = None,
+            format: Optional[Union[str, dict]] = None,
+            priority: Optional[int] = None
+    ) -> AsyncIterator[str]:
+        """
+        Stream response tokens from /api/generate as they are produced.
+
+        Args:
+            model: Ollama model name
+            prompt: Prompt text
+            images: Optional list of base64-encoded images
+            options: Optional Ollama generation options
+            timeout: Total seconds allowed for this request, defaults to the client timeout
+            format: "json" or a JSON schema to constrain the output
+            priority: Scheduler priority, defaults to the client's
+
+        Yields:
+            str: Response fragments in generation order
+        """
+        session = self._get_session()
+        payload = {"model": model, "prompt": prompt, "stream": True}
+        if images:
+            payload["images"] = images
+        if options:
+            payload["options"] = options
+        if format:
+            payload["format"] = format
+        # Serialized once rather than by aiohttp on every retry; this also gives the request size
+        body = json.dumps(payload).encode()
+
+        async with self._slots:
+            if self.scheduler is None:
+                async for token in self._traced_stream(session, body, model, timeout, None):
+                    yield token
+                return
+            priority = self.priority if priority is None else priority
+            async with self.scheduler.aslot(model, cost=len(body), priority=priority) as slot:
+                async for token in self._traced_stream(session, body, model, timeout, slot):
+                    yield token
+
+    async def _traced_stream(
+            self,
+            session: aiohttp.ClientSession,
+            body: bytes,
+            model: str,
+            timeout: Optional[float],
+            slot: Optional[Slot]
+    ) -> AsyncIterator[str]:
+        with telemetry.span("ollama_generate", model=model, bytes_sent=len(body)) as trace:
+            started = time.perf_counter()
+            first_token = True
+            outcome = "error"
+            try:
+                async for token in self._post_stream(session, body, model, timeout, slot):
+                    if first_token:
+                        first_token = False
+                        ttft = time.perf_counter() - started
+                        trace.set("ttft_ms", round(ttft * 1000, 1))
+                        telemetry.observe("labsnap_ollama_ttft_seconds", ttft, model=model)
+                    if slot is not None:
+                        slot.add_work()
+                    yield token
+                outcome = "ok"
+            finally:
+                telemetry.inc("labsnap_ollama_requests_total", model=model, outcome=outcome)
+
+    async def _post_stream(
+            self,
+            session: aiohttp.ClientSession,
+            body: bytes,
+            model: str,
+            timeout: Optional[float],
+            slot: Optional[Slot] = None
+    ) -> AsyncIterator[str]:
+        """Send one serialized generate request, retrying until the first token (see stream_generate)."""
+        attempt = 0
+        while True:
+            received = False
+            telemetry.inc("labsnap_ollama_bytes_sent_total", len(body), model=model)
+            try:
+                async with session.post(
+                        f"{self.base_url}/api/generate",
+                        data=body,
+                        headers={"Content-Type": "application/json"},
+                        timeout=self._request_timeout(timeout)
+                ) as response:
+                    if slot is not None and (response.status == 429 or response.status >= 500):
+                        # Ollama is overloaded at the current concurrency
+                        slot.overload()
+                    if response.status in RETRY_STATUSES and attempt < self.max_retries:
+                        await response.release()
+                        await self._sleep_before_retry(attempt)
+                        attempt += 1
+                        continue
+                    if response.status >= 400:
+                        error = await response.text()
+                        raise OllamaError(f"Ollama returned HTTP {response.status}: {error}")
+
+                    # Ollama streams one JSON object per line
+                    async for line in response.content:
+                        if not line.strip():
+                            continue
+                        try:
+                            chunk = json.loads(line)
+                        except json.JSONDecodeError as e:
+                            raise OllamaResponseError(f"Malformed line in Ollama's stream: {line[:200]!r}") from e
+                        if not isinstance(chunk, dict):
+                            raise OllamaResponseError(f"Unexpected line in Ollama's stream: {line[:200]!r}")
+                        if "error" in chunk:
+                            raise OllamaError(chunk["error"])
+                        token = chunk.get("response", "")
+                        if token:
+                            received = True
+                            yield token
+                        if chunk.get("done"):
+                            return
+                    return
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if received or attempt >= self.max_retries:
+                    raise OllamaError(f"Error communicating with Ollama: {e!r}") from e
+                await self._sleep_before_retry(attempt)
+                attempt += 1
+
+    async def generate(
+            self,
+            model: str,
+            prompt: str,
+            images: Optional[list[str]] = None,
+            options: Optional[dict] = None,
+            timeout: Optional[float] = None,
+            format: Optional[Union[str, dict]] = None,
+            priority: Optional[int] = None
+    ) -> str:
+        """Collect a streamed generation into a single string."""
+        parts = []
+        async for token in self.stream_generate(model, prompt, images, options, timeout, format, priority):
+            parts.append(token)
+        return "".join(parts)
+
+    async def stream_rows(
+            self,
+            image: Image.Image,
+            prompt: str,
+            model: str = "gemma3:4b",
+            schema: Optional[dict] = None,
+            timeout: Optional[float] = None
+    ) -> AsyncIterator[dict]:
+        """
+        Structured-output extraction that yields each row as soon as it is complete.
+
+        The schema (LAB_SCHEMA by default) constrains the model's output. If the
+        stream breaks off, the rows received so far are kept and the repaired
+        remainder is yielded; OllamaError is only raised when nothing usable arrived.
+        """
+        parser = IncrementalRowParser()
+        emitted = 0
+        images = [encode_image(image, is_lossless(f"ollama:{model}"))]
+        try:
+            async for token in self.stream_generate(
+                    model, prompt, images=images, options={"temperature": 0},
+                    timeout=timeout, format=schema or LAB_SCHEMA
+            ):
+                for row in parser.feed(token):
+                    if is_complete_row(row):
+                        emitted += 1
+                        yield row
+        except OllamaError as e:
+            if not emitted and not rows_from_document(parser.repair()):
+                raise
+            logger.warning("Structured output cut short, keeping the rows received so far: %s", e)
+        if not parser.complete:
+            for row in rows_from_document(parser.repair())[emitted:]:
+                yield row
+
+    def stream_image(
+            self,
+            image: Image.Image,
+            prompt: str,
+            model: str = "gemma3:4b",
+            timeout: Optional[float] = None,
+            priority: Optional[int] = None
+    ) -> AsyncIterator[str]:
+        """Stream the model's answer about a PIL image token by token."""
+        images = [encode_image(image, is_lossless(f"ollama:{model}"))]
+        return self.stream_generate(model, prompt, images=images, timeout=timeout, priority=priority)
+
+    async def analyze_image(
+            self,
+            image: Image.Image,
+            prompt: str,
+            model: str = "gemma3:4b",
+            timeout: Optional[float] = None,
+            priority: Optional[int] = None
+    ) -> str:
+        images = [encode_image(image, is_lossless(f"ollama:{model}"))]
+        return await self.generate(model, prompt, images=images, timeout=timeout, priority=priority)
+
+    async def analyze_many(
+            self,
+            images: Iterable[Image.Image],
+            prompt: str,
+            model: str = "gemma3:4b"
+    ) -> list:
+        """
+        Analyze many images concurrently, bounded by max_in_flight.
+
+        Returns:
+            list: One response string per image, or the OllamaError raised for it
+        """
+        tasks = [self.analyze_image(image, prompt, model) for image in images]
+        return await asyncio.gather(*tasks, return_exceptions=True)
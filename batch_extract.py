@@ -0,0 +1,412 @@
+#in terminal: python batch_extract.py "sample/labvalues sample" -o lab_values.csv
+
+import argparse
+import functools
+import glob
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Callable, Optional
+
+import pandas as pd
+from PIL import Image
+
+from extraction import extract_values
+from layout import DEFAULT_LAYOUT, LayoutConfig
+from ingestion import is_document, process_document
+from normalization import normalize_frame
+from ollama_scheduler import BATCH
+from ocr_backends import (
+    LAB_PROMPT,
+    TESSERACT_LANG,
+    OCRResult,
+    OCRRouter,
+    OllamaOCRBackend,
+    TesseractBackend,
+    run_ollama_ocr,
+    run_tesseract,
+    score_result
+)
+from operating_point import preprocess_for
+from result_cache import DEFAULT_CACHE_PATH, ResultCache
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff", ".pdf")
+
+
+def collect_inputs(inputs: list[str]) -> list[str]:
+    """Expand directories and glob patterns into a sorted, de-duplicated list of image and document paths."""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            candidates = [os.path.join(item, name) for name in os.listdir(item)]
+        else:
+            candidates = glob.glob(item, recursive=True)
+        paths.extend(
+            path for path in candidates
+            if os.path.isfile(path) and path.lower().endswith(IMAGE_EXTENSIONS)
+        )
+    return sorted(set(paths))
+
+
+def _portable_error(e: Exception) -> RuntimeError:
+    # Some library exceptions (e.g. TesseractNotFoundError) cannot be unpickled
+    # and would break the whole process pool, so only the message crosses over
+    return RuntimeError(f"{type(e).__name__}: {e}")
+
+
+def _tesseract_job(path: str, lang: str) -> tuple[str, float]:
+    """Process-pool worker: decode, preprocess and OCR one image with Tesseract."""
+    start = time.perf_counter()
+    try:
+        with Image.open(path) as image:
+            text = run_tesseract(preprocess_for(image, "tesseract"), lang=lang)
+    except Exception as e:
+        raise _portable_error(e) from None
+    return text, time.perf_counter() - start
+
+
+def _preprocess_job(path: str, backend: str) -> tuple[str, tuple[int, int], bytes, float]:
+    """
+    Process-pool worker: decode and preprocess one image at the backend's operating point.
+
+    Returns the raw pixels rather than an encoded file, so the image is only
+    encoded once, in memory, right before it is sent to the model.
+    """
+    start = time.perf_counter()
+    try:
+        with Image.open(path) as image:
+            processed = preprocess_for(image, backend)
+    except Exception as e:
+        raise _portable_error(e) from None
+    return processed.mode, processed.size, processed.tobytes(), time.perf_counter() - start
+
+
+def _ollama_job(
+        pixels: tuple[str, tuple[int, int], bytes],
+        model_name: str,
+        prompt: Optional[str],
+        cache: Optional[ResultCache],
+        layout: Optional[LayoutConfig] = None
+) -> tuple[str, float]:
+    """Thread-pool worker: send one preprocessed image to the Ollama vision model."""
+    start = time.perf_counter()
+    image = Image.frombuffer(*pixels, "raw", pixels[0], 0, 1)
+    text = run_ollama_ocr(image, model_name=model_name, prompt=prompt, cache=cache, layout=layout, priority=BATCH)
+    return text, time.perf_counter() - start
+
+
+def _auto_job(path: str, lang: str) -> tuple[str, tuple[int, int], bytes, OCRResult]:
+    """
+    Process-pool worker for routed OCR: preprocess and run the cheap Tesseract pass.
+
+    The pixels are returned too, so the image can be escalated without
+    preprocessing it again. A Tesseract failure is reported in the result
+    rather than raised, so the router can still escalate.
+    """
+    start = time.perf_counter()
+    try:
+        with Image.open(path) as image:
+            # Prepared for the Tesseract pass; escalated pages reuse the same image
+            processed = preprocess_for(image, "tesseract")
+    except Exception as e:
+        raise _portable_error(e) from None
+    prep_seconds = time.perf_counter() - start
+    try:
+        result = TesseractBackend(lang).recognize(processed)
+    except Exception as e:
+        result = OCRResult("tesseract", "", 0.0, error=f"{type(e).__name__}: {e}")
+    result.seconds += prep_seconds
+    return processed.mode, processed.size, processed.tobytes(), result
+
+
+def _document_job(path: str, recognize: Callable[[Image.Image], str], backend: str) -> tuple[list[dict], dict]:
+    """
+    Worker for PDFs and multi-page TIFFs: stream pages through OCR one at a time.
+
+    Only the current page (plus one rasterized ahead) is held in memory, so
+    long documents cost no more than a single image.
+
+    Returns:
+        tuple: Value rows with a Page column, and a status entry for the whole document
+    """
+    rows, errors, seconds, pages = [], [], 0.0, 0
+    try:
+        preprocess = functools.partial(preprocess_for, backend=backend)
+        for result in process_document(path, recognize, preprocess=preprocess):
+            pages += 1
+            seconds += result.seconds
+            if result.error:
+                errors.append(f"page {result.number}: {result.error}")
+            rows.extend({"File": path, "Page": result.number, **value} for value in result.values)
+    except Exception as e:
+        raise _portable_error(e) from None
+    status = "error" if pages and len(errors) == pages else "ok" if rows else "empty"
+    return rows, {"Status": status, "Rows": len(rows), "Seconds": round(seconds, 3), "Error": "; ".join(errors)}
+
+
+def _escalate_job(router: OCRRouter, pixels: tuple[str, tuple[int, int], bytes], first: OCRResult):
+    """Thread-pool worker: continue routing an image past the Tesseract pass."""
+    image = Image.frombuffer(*pixels, "raw", pixels[0], 0, 1)
+    return router.route(image, first=first)
+
+
+def _record(
+        path: str,
+        text: str,
+        seconds: float,
+        rows: list[dict],
+        statuses: list[dict],
+        backend: str = ""
+) -> None:
+    values = extract_values(text)
+    for value in values:
+        rows.append({"File": path, "Page": 1, **value})
+    statuses.append({
+        "File": path,
+        "Status": "ok" if values else "empty",
+        "Backend": backend,
+        "Rows": len(values),
+        "Seconds": round(seconds, 3),
+        "Error": ""
+    })
+
+
+def _record_error(path: str, error: Exception, statuses: list[dict]) -> None:
+    statuses.append({
+        "File": path,
+        "Status": "error",
+        "Backend": "",
+        "Rows": 0,
+        "Seconds": 0.0,
+        "Error": str(error) if isinstance(error, RuntimeError) else f"{type(error).__name__}: {error}"
+    })
+
+
+def run_document_batch(
+        paths: list[str],
+        pool,
+        recognize: Callable[[Image.Image], str],
+        backend: str
+) -> tuple[list[dict], list[dict]]:
+    """
+    Run every PDF/TIFF through _document_job on the given pool.
+
+    Tesseract documents go to a process pool (recognize must be picklable),
+    Ollama and routed documents to a thread pool.
+    """
+    rows, statuses = [], []
+    futures = {pool.submit(_document_job, path, recognize, backend): path for path in paths}
+    for future in as_completed(futures):
+        path = futures[future]
+        try:
+            document_rows, status = future.result()
+        except Exception as e:
+            _record_error(path, e, statuses)
+            continue
+        rows.extend(document_rows)
+        statuses.append({"File": path, "Backend": backend, **status})
+    return rows, statuses
+
+
+def run_tesseract_batch(paths: list[str], workers: Optional[int], lang: str) -> tuple[list[dict], list[dict]]:
+    """Run preprocessing and Tesseract for every path in a process pool."""
+    rows, statuses = [], []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(_tesseract_job, path, lang): path for path in paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                text, seconds = future.result()
+            except Exception as e:
+                _record_error(path, e, statuses)
+                continue
+            _record(path, text, seconds, rows, statuses, "tesseract")
+    return rows, statuses
+
+
+def run_ollama_batch(
+        paths: list[str],
+        workers: Optional[int],
+        model_name: str,
+        prompt: Optional[str],
+        concurrency: int,
+        cache: Optional[ResultCache] = None,
+        layout: Optional[LayoutConfig] = None
+) -> tuple[list[dict], list[dict]]:
+    """
+    Preprocess in a process pool and send images to Ollama with bounded concurrency.
+
+    The CPU-bound stage and the model calls overlap: each image is handed to the
+    Ollama pool as soon as its preprocessing finishes.
+    """
+    rows, statuses = [], []
+    with ProcessPoolExecutor(max_workers=workers) as cpu_pool, \
+            ThreadPoolExecutor(max_workers=concurrency) as llm_pool:
+        prepared = {cpu_pool.submit(_preprocess_job, path, f"ollama:{model_name}"): path for path in paths}
+        pending = {}
+        for future in as_completed(prepared):
+            path = prepared[future]
+            try:
+                mode, size, data, prep_seconds = future.result()
+            except Exception as e:
+                _record_error(path, e, statuses)
+                continue
+            pending[llm_pool.submit(_ollama_job, (mode, size, data), model_name, prompt, cache, layout)] = (path, prep_seconds)
+
+        for future in as_completed(pending):
+            path, prep_seconds = pending[future]
+            try:
+                text, seconds = future.result()
+            except Exception as e:
+                _record_error(path, e, statuses)
+                continue
+            _record(path, text, prep_seconds + seconds, rows, statuses, f"ollama:{model_name}")
+    return rows, statuses
+
+
+def run_auto_batch(
+        paths: list[str],
+        workers: Optional[int],
+        lang: str,
+        router: OCRRouter,
+        concurrency: int
+) -> tuple[list[dict], list[dict]]:
+    """
+    Tesseract first for every image; only low-confidence pages go to the next backends.
+
+    The first router backend must be Tesseract: it runs in the process pool,
+    and the router continues from its result in the thread pool.
+    """
+    rows, statuses = [], []
+    with ProcessPoolExecutor(max_workers=workers) as cpu_pool, \
+            ThreadPoolExecutor(max_workers=concurrency) as llm_pool:
+        first_pass = {cpu_pool.submit(_auto_job, path, lang): path for path in paths}
+        escalated = {}
+        for future in as_completed(first_pass):
+            path = first_pass[future]
+            try:
+                mode, size, data, first = future.result()
+            except Exception as e:
+                _record_error(path, e, statuses)
+                continue
+            # Scored once here; the router reuses the score if the image is escalated
+            if router.is_good(score_result(first)):
+                _record(path, first.text, first.seconds, rows, statuses, first.backend)
+                continue
+            escalated[llm_pool.submit(_escalate_job, router, (mode, size, data), first)] = path
+
+        for future in as_completed(escalated):
+            path = escalated[future]
+            try:
+                routed = future.result()
+            except Exception as e:
+                _record_error(path, e, statuses)
+                continue
+            if routed.result.error:
+                _record_error(path, RuntimeError(routed.result.error), statuses)
+                continue
+            seconds = sum(attempt.seconds for attempt in routed.attempts)
+            _record(path, routed.result.text, seconds, rows, statuses, routed.result.backend)
+    return rows, statuses
+
+
+def write_table(df: pd.DataFrame, path: str) -> None:
+    """Write a DataFrame as Parquet or CSV depending on the file extension."""
+    if path.lower().endswith(".parquet"):
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Extract lab values from many report images.")
+    parser.add_argument("inputs", nargs="+", help="Image/PDF/TIFF files, directories or glob patterns")
+    parser.add_argument("-o", "--output", default="lab_values.csv", help="Combined output (.csv or .parquet)")
+    parser.add_argument("--status", help="Per-file status output (defaults to <output>_status.csv)")
+    parser.add_argument("--backend", choices=["tesseract", "ollama", "auto"], default="tesseract",
+                        help="auto runs Tesseract and escalates low-confidence pages to Ollama")
+    parser.add_argument("--threshold", type=float, default=0.6, help="Confidence needed to skip escalation (auto)")
+    parser.add_argument("--workers", type=int, default=None, help="Processes for preprocessing/Tesseract")
+    parser.add_argument("--lang", default=TESSERACT_LANG, help="Tesseract languages")
+    parser.add_argument("--model", default="llama3.2-vision:11b", help="Ollama vision model")
+    parser.add_argument("--prompt", choices=["default", "lab"], default="lab", help="Ollama prompt")
+    parser.add_argument("--concurrency", type=int, default=2, help="Max in-flight Ollama requests")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="Result cache for Ollama output")
+    parser.add_argument("--no-cache", action="store_true", help="Always call the model")
+    parser.add_argument("--near-duplicates", action="store_true",
+                        help="Reuse cached results for re-photographed or re-compressed copies of a page")
+    parser.add_argument("--tile", action="store_true",
+                        help="Crop pages to their text and send tall pages to Ollama as overlapping strips")
+    parser.add_argument("--normalize", action="store_true",
+                        help="Add canonical test codes and values converted to canonical units")
+    parser.add_argument("--history", metavar="DIR",
+                        help="Also append the values to this history store (partitioned Parquet)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Log routing decisions and timings")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format="%(message)s")
+
+    paths = collect_inputs(args.inputs)
+    if not paths:
+        print("No images found.", file=sys.stderr)
+        return 1
+
+    start = time.perf_counter()
+    documents = [path for path in paths if is_document(path)]
+    images = [path for path in paths if not is_document(path)]
+    prompt = LAB_PROMPT if args.prompt == "lab" else None
+    cache = None if args.no_cache or args.backend == "tesseract" else ResultCache(args.cache, near_duplicates=args.near_duplicates)
+    layout = DEFAULT_LAYOUT if args.tile else None
+    if args.backend == "tesseract":
+        rows, statuses = run_tesseract_batch(images, args.workers, args.lang)
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            recognize = functools.partial(run_tesseract, lang=args.lang)
+            document_rows, document_statuses = run_document_batch(documents, pool, recognize, "tesseract")
+    elif args.backend == "ollama":
+        rows, statuses = run_ollama_batch(images, args.workers, args.model, prompt, args.concurrency, cache, layout)
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            recognize = functools.partial(
+                run_ollama_ocr, model_name=args.model, prompt=prompt, cache=cache, layout=layout, priority=BATCH
+            )
+            document_rows, document_statuses = run_document_batch(documents, pool, recognize, f"ollama:{args.model}")
+    else:
+        router = OCRRouter(
+            [TesseractBackend(args.lang), OllamaOCRBackend(args.model, prompt, cache, layout, BATCH)],
+            threshold=args.threshold
+        )
+        rows, statuses = run_auto_batch(images, args.workers, args.lang, router, args.concurrency)
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            recognize = lambda image: router.route(image).result.text
+            document_rows, document_statuses = run_document_batch(documents, pool, recognize, "auto")
+    rows.extend(document_rows)
+    statuses.extend(document_statuses)
+    if cache is not None:
+        print(f"Cache: {cache.stats()}")
+        cache.close()
+    elapsed = time.perf_counter() - start
+
+    values_df = pd.DataFrame(rows, columns=["File", "Page", "Test", "Value", "Unit", "Reference", "Flag"])
+    write_table(normalize_frame(values_df) if args.normalize else values_df, args.output)
+    status_path = args.status or f"{os.path.splitext(args.output)[0]}_status.csv"
+    status_df = pd.DataFrame(statuses, columns=["File", "Status", "Backend", "Rows", "Seconds", "Error"])
+    write_table(status_df.sort_values("File"), status_path)
+    if args.history:
+        from history_store import HistoryStore
+
+        backends = status_df.drop_duplicates("File").set_index("File")["Backend"]
+        store = HistoryStore(args.history)
+        stored = store.append(values_df.assign(Model=values_df["File"].map(backends)))
+        # A batch is a good moment to merge the month files, which keeps per-patient queries fast
+        store.compact()
+        print(f"History: {stored} values appended to {args.history}")
+
+    failed = int((status_df["Status"] == "error").sum())
+    print(f"{len(paths)} files, {len(rows)} values, {failed} errors in {elapsed:.1f}s")
+    print(f"Values: {args.output}")
+    print(f"Status: {status_path}")
+    return 1 if failed == len(paths) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
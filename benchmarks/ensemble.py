@@ -0,0 +1,50 @@
+#in terminal: python -m benchmarks.ensemble
+
+import argparse
+import asyncio
+
+from PIL import Image
+
+from async_ollama import AsyncOllamaClient
+from benchmarks.service import _serve
+from ensemble import run_ensemble_async
+from fake_ollama import DEFAULT_RESPONSE, create_app
+
+# Three models of very different speed; the third is the slow, large one
+DELAYS = {"gemma3:4b": 0.01, "qwen2.5vl:7b": 0.02, "llama3.2-vision:11b": 0.08}
+# The second model misreads MCV, so the slow model has to break the tie
+DISAGREEING = {"qwen2.5vl:7b": DEFAULT_RESPONSE.replace("| MCV | 88 | fL |", "| MCV | 86 | fL |")}
+
+
+async def scenario(name: str, responses: dict, quorum: int) -> None:
+    app = create_app(models=tuple(DELAYS), model_delays=DELAYS, model_responses=responses)
+    runner, url = await _serve(app)
+    image = Image.new("L", (256, 256), 255)
+    try:
+        async with AsyncOllamaClient(url, max_in_flight=len(DELAYS)) as client:
+            result = await run_ensemble_async(image, list(DELAYS), quorum=quorum, client=client)
+        # The server only notices the closed connection on its next write
+        await asyncio.sleep(2 * max(DELAYS.values()))
+        agreed = sum(row["Agreed"] for row in result.values)
+        print(f"{name}: {result.seconds:.2f} s, early exit: {result.early_exit}, "
+              f"{agreed}/{len(result.values)} rows agreed, {app['stats']['cancelled']} request(s) cancelled")
+        for row in result.report():
+            print(f"    {row['Model']:<22} {row['Status']:<10} {row['Seconds']:6.2f} s  agreement {row['Agreement']}")
+    finally:
+        await runner.cleanup()
+
+
+async def run(quorum: int) -> None:
+    await scenario("models agree   ", {}, quorum)
+    await scenario("models disagree", DISAGREEING, quorum)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Ensemble latency with early exit against the fake Ollama server.")
+    parser.add_argument("--quorum", type=int, default=2)
+    args = parser.parse_args()
+    asyncio.run(run(args.quorum))
+
+
+if __name__ == "__main__":
+    main()
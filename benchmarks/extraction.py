@@ -0,0 +1,82 @@
+#in terminal: python -m benchmarks.extraction
+
+import argparse
+import random
+import re
+import time
+
+from extraction import extract_values
+
+LEGACY_PATTERN = r"([A-Za-z0-9 #\(\)/%µ\^\-]+?)\s+([\d.,]+)\s*([a-zA-Z/µ^%³]+)?"
+
+TESTS = [
+    ("Hemoglobin", "g/dL", 13.5), ("Emoglobina", "g/dL", 13.5), ("WBC", "10^3/µL", 6.2),
+    ("Platelets", "10^3/µL", 250), ("MCV", "fL", 88), ("Neutrophils", "%", 62.1),
+    ("Lymphocytes", "%", 30.4), ("Glucosio", "mg/dL", 95), ("Creatinina", "mg/dL", 0.9)
+]
+
+
+def legacy_extract_values(text: str) -> list[dict]:
+    """The original per-line re.match implementation, kept for comparison."""
+    results = []
+    for line in text.split("\n"):
+        match = re.match(LEGACY_PATTERN, line.strip())
+        if match:
+            test, value, unit = match.groups()
+            try:
+                results.append({"Test": test.strip(), "Value": float(value.replace(",", ".")), "Unit": unit or ""})
+            except ValueError:
+                continue
+    return results
+
+
+def synthetic_report(lines: int, seed: int = 0) -> str:
+    """Mix of markdown table rows, plain text, key/value lines and OCR noise."""
+    rng = random.Random(seed)
+    out = ["| Test | Value | Unit | Reference |", "|---|---|---|---|"]
+    for i in range(lines):
+        name, unit, value = rng.choice(TESTS)
+        value = f"{value * rng.uniform(0.7, 1.3):.1f}"
+        kind = i % 5
+        if kind == 0:
+            out.append(f"| {name} | {value} | {unit} | 10-20 |")
+        elif kind == 1:
+            out.append(f"{name} {value.replace('.', ',')} {unit} 10,0 - 20,0 H")
+        elif kind == 2:
+            out.append(f"- **{name}**: {value} {unit}")
+        elif kind == 3:
+            out.append(f"{name} = {value} {unit} (10-20)")
+        else:
+            # Noise: long runs of words without a value stress the legacy lazy pattern
+            out.append(" ".join(rng.choice(["Referto", "Laboratorio", "Analisi", "del", "sangue"]) for _ in range(40)))
+    return "\n".join(out)
+
+
+def timed(func, text: str, repeats: int) -> tuple[float, int]:
+    best = float("inf")
+    rows = 0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        rows = len(func(text))
+        best = min(best, time.perf_counter() - start)
+    return best, rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Micro-benchmark extract_values on synthetic OCR output.")
+    parser.add_argument("--lines", type=int, default=20000)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    text = synthetic_report(args.lines)
+    print(f"{args.lines} lines, {len(text) / 1e6:.1f} MB")
+    for name, func in (("legacy", legacy_extract_values), ("parser", extract_values)):
+        seconds, rows = timed(func, text, args.repeats)
+        print(
+            f"{name:>7}: {seconds * 1000:8.1f} ms, {args.lines / seconds:10.0f} lines/s, "
+            f"{rows} rows ({rows / seconds:8.0f} rows/s)"
+        )
+
+
+if __name__ == "__main__":
+    main()
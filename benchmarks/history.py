@@ -0,0 +1,102 @@
+#in terminal: python -m benchmarks.history --rows 10000000
+
+import argparse
+import shutil
+import statistics
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.normalization import make_rows
+from history_store import HistoryStore
+
+MODELS = np.array(["tesseract", "gemma3:4b", "llama3.2-vision:11b"], dtype=object)
+
+
+def make_batch(rows: int, seed: int, patients: int, start: pd.Timestamp, days: int) -> pd.DataFrame:
+    df = make_rows(rows, seed)
+    rng = np.random.default_rng(seed)
+    df["Patient"] = pd.Categorical.from_codes(rng.integers(0, patients, size=rows),
+                                              [f"P{i:06d}" for i in range(patients)]).astype(str)
+    df["Timestamp"] = start + pd.to_timedelta(rng.integers(0, days * 86400, size=rows), unit="s")
+    df["Model"] = MODELS[rng.integers(0, len(MODELS), size=rows)]
+    df["ImageHash"] = [f"{h:016x}" for h in rng.integers(0, 2 ** 63, size=rows)]
+    df["Source"] = "benchmark"
+    return df
+
+
+def timed_ms(fn, repeats: int) -> tuple[float, int]:
+    times, rows = [], 0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        rows = len(fn())
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000, rows
+
+
+def run_queries(store: HistoryStore, repeats: int) -> None:
+    queries = {
+        "one test, all time": lambda: store.query(["HGB"], columns=["ts", "value", "unit"]),
+        "one test, one month": lambda: store.query(["Emoglobina"], start="2025-06-01", end="2025-06-30"),
+        "one patient, all tests": lambda: store.query(patient="P000042"),
+        "trend: patient + test": lambda: store.trend("Glucose", patient="P000042"),
+        "all tests, one week": lambda: store.query(start="2025-09-01", end="2025-09-07", columns=["code", "value"]),
+    }
+    for name, fn in queries.items():
+        ms, rows = timed_ms(fn, repeats)
+        print(f"  {name:<24} {ms:8.1f} ms  {rows:>9,} rows")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="History store ingest rate and query latency.")
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--batch", type=int, default=500_000, help="Rows per append")
+    parser.add_argument("--patients", type=int, default=100_000)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--dir", help="Store directory, defaults to a temporary one that is removed afterwards")
+    args = parser.parse_args()
+
+    root = args.dir or tempfile.mkdtemp(prefix="labsnap-history-")
+    store = HistoryStore(root)
+    start = pd.Timestamp("2024-10-01", tz="UTC")
+    try:
+        batches = [make_batch(min(args.batch, args.rows - i), i, args.patients, start, 730)
+                   for i in range(0, args.rows, args.batch)]
+        t0 = time.perf_counter()
+        for batch in batches:
+            store.append(batch)
+        ingest = time.perf_counter() - t0
+        stats = store.stats()
+        print(f"ingest: {args.rows:,} rows in {ingest:.1f} s ({args.rows / ingest / 1e6:.2f} M rows/s), "
+              f"{stats['files']} files, {stats['bytes'] / 2 ** 20:.0f} MiB ({stats['bytes'] / args.rows:.1f} B/row)")
+
+        # The app appends one report of about 25 values at a time
+        # A new image every day, so the lookup for an already stored report is part of every append
+        report = batches[0].head(25).drop(columns=["Patient", "Timestamp", "ImageHash"])
+        times = []
+        for day in range(1, 29):
+            t0 = time.perf_counter()
+            store.append(report, patient="P000042", image_hash=f"report-{day:02d}", timestamp=f"2025-06-{day:02d}")
+            times.append(time.perf_counter() - t0)
+        print(f"single-report appends: median {statistics.median(times) * 1000:.1f} ms, "
+              f"max {max(times) * 1000:.0f} ms (includes merging small files)")
+
+        print("queries:")
+        run_queries(store, args.repeats)
+
+        t0 = time.perf_counter()
+        removed = store.compact()
+        stats = store.stats()
+        print(f"compact: {removed} files merged in {time.perf_counter() - t0:.1f} s, "
+              f"{stats['files']} files, {stats['bytes'] / 2 ** 20:.0f} MiB")
+        print("queries after compaction:")
+        run_queries(store, args.repeats)
+    finally:
+        if not args.dir:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#in terminal: python -m benchmarks.image_handoff
+
+import base64
+import glob
+import os
+import tempfile
+import time
+
+from PIL import Image
+
+from image_io import encode_image_bytes, in_memory_path, resolve_encoded
+from preprocessing import preprocess_image
+
+SAMPLE_GLOB = "sample/*/*"
+
+
+def legacy_handoff(image: Image.Image) -> tuple[str, int]:
+    """Temp-file path used before: PNG to disk, read back, base64."""
+    copied = 0
+    with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as tmp:
+        image.save(tmp.name)
+        temp_path = tmp.name
+    size = os.path.getsize(temp_path)
+    copied += size  # encoder output written to the file
+    with open(temp_path, "rb") as image_file:
+        data = image_file.read()
+    copied += len(data)  # read back into memory
+    encoded = base64.b64encode(data)
+    payload = encoded.decode("utf-8")
+    copied += len(encoded) + len(payload)
+    os.remove(temp_path)  # the app never did this; removed here to keep the benchmark clean
+    return payload, copied
+
+
+def in_memory_handoff(image: Image.Image) -> tuple[str, int]:
+    """Current path: fast PNG into a buffer, base64 from a memoryview, pseudo path lookup."""
+    buffer = encode_image_bytes(image)
+    encoded = base64.b64encode(buffer)
+    payload = encoded.decode("ascii")
+    copied = buffer.nbytes + len(encoded) + len(payload)
+    with in_memory_path(payload) as path:
+        payload = resolve_encoded(path)
+    return payload, copied
+
+
+def main() -> None:
+    images = [preprocess_image(Image.open(path)) for path in sorted(glob.glob(SAMPLE_GLOB))]
+    for name, handoff in (("temp file", legacy_handoff), ("in memory", in_memory_handoff)):
+        copied = 0
+        payload_bytes = 0
+        start = time.perf_counter()
+        for image in images:
+            payload, request_copied = handoff(image)
+            copied += request_copied
+            payload_bytes += len(payload)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{name:>9}: {elapsed / len(images) * 1000:6.1f} ms/request, "
+            f"{copied / len(images) / 1024:7.0f} KiB copied/request, "
+            f"{payload_bytes / len(images) / 1024:6.0f} KiB base64 payload"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#in terminal: python -m benchmarks.image_hash --entries 1000000
+
+import argparse
+import glob
+import time
+
+import numpy as np
+from PIL import Image
+
+from image_hash import HashIndex, dhash, phash
+from preprocessing import preprocess_image
+
+SAMPLE_GLOB = "sample/*/*"
+
+
+def random_hashes(rng: np.random.Generator, n: int) -> np.ndarray:
+    return rng.integers(0, 2 ** 64, size=n, dtype=np.uint64)
+
+
+def clustered_hashes(rng: np.random.Generator, n: int, templates: int = 1000, flips: int = 8) -> np.ndarray:
+    # Scans of the same few lab templates hash close together, which fills some buckets far more than others
+    centers = random_hashes(rng, templates)[rng.integers(0, templates, size=n)]
+    return flip_bits(rng, centers, flips)
+
+
+def flip_bits(rng: np.random.Generator, hashes: np.ndarray, bits: int) -> np.ndarray:
+    out = hashes.copy()
+    for _ in range(bits):
+        out ^= np.left_shift(np.uint64(1), rng.integers(0, 64, size=len(out), dtype=np.uint64))
+    return out
+
+
+def build(phashes: np.ndarray, dhashes: np.ndarray) -> tuple[HashIndex, float]:
+    refs = np.zeros((len(phashes), 32), dtype=np.uint8)
+    refs[:, :8] = np.arange(len(phashes), dtype=np.uint64).view(np.uint8).reshape(-1, 8)
+    index = HashIndex()
+    start = time.perf_counter()
+    for chunk in range(0, len(phashes), 100_000):
+        end = chunk + 100_000
+        index.add_many(phashes[chunk:end], dhashes[chunk:end], np.zeros(len(phashes[chunk:end]), np.uint32), refs[chunk:end])
+    return index, time.perf_counter() - start
+
+
+def lookup_us(index: HashIndex, queries: np.ndarray, dqueries: np.ndarray) -> tuple[np.ndarray, int]:
+    times, found = [], 0
+    for p, d in zip(queries.tolist(), dqueries.tolist()):
+        start = time.perf_counter()
+        found += index.search(p, d) is not None
+        times.append(time.perf_counter() - start)
+    return np.array(times) * 1e6, found
+
+
+def sample_distances() -> None:
+    print(f"{'sample':<28} {'pHash d':>8} {'dHash d':>8}   (JPEG q50 copy, 80% rescale)")
+    for path in sorted(glob.glob(SAMPLE_GLOB)):
+        image = Image.open(path).convert("RGB")
+        page = preprocess_image(image)
+        copy = preprocess_image(image.resize((int(image.width * 0.8), int(image.height * 0.8))))
+        p_dist = (phash(page) ^ phash(copy)).bit_count()
+        d_dist = (dhash(page) ^ dhash(copy)).bit_count()
+        print(f"{path.split('/')[-1][:28]:<28} {p_dist:8d} {d_dist:8d}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Near-duplicate index build time, lookup latency and memory.")
+    parser.add_argument("--entries", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    sample_distances()
+    print()
+    for name, make in (("random", random_hashes), ("clustered", clustered_hashes)):
+        phashes, dhashes = make(rng, args.entries), random_hashes(rng, args.entries)
+        index, seconds = build(phashes, dhashes)
+        picked = rng.integers(0, args.entries, size=args.queries)
+        near, near_found = lookup_us(index, flip_bits(rng, phashes[picked], 3), dhashes[picked])
+        miss, _ = lookup_us(index, make(rng, args.queries), random_hashes(rng, args.queries))
+        print(
+            f"{name:>9}: {args.entries:,} entries built in {seconds:.2f} s, "
+            f"{index.nbytes / 2 ** 20:.0f} MiB ({index.nbytes / args.entries:.0f} B/entry incl. spare capacity)"
+        )
+        for label, times in (("near-duplicate", near), ("no match", miss)):
+            print(f"           {label:<15} p50 {np.median(times):7.1f} us  p99 {np.percentile(times, 99):7.1f} us")
+        print(f"           found {near_found}/{args.queries} copies 3 bits away")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+#in terminal: python -m benchmarks.layout
+
+import glob
+import os
+import time
+
+from PIL import Image
+
+from image_io import encode_image_b64
+from layout import DEFAULT_LAYOUT, split_regions
+from preprocessing import preprocess_image
+
+SAMPLE_GLOB = "sample/*/*"
+
+
+def main() -> None:
+    totals = {"full": [0, 0, 0.0], "regions": [0, 0, 0.0]}
+    print(f"{'sample':<28} {'full px':>10} {'sent px':>10} {'full KiB':>9} {'sent KiB':>9} strips")
+    for path in sorted(glob.glob(SAMPLE_GLOB)):
+        page = preprocess_image(Image.open(path))
+
+        start = time.perf_counter()
+        full_bytes = len(encode_image_b64(page))
+        totals["full"][2] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        regions = split_regions(page, DEFAULT_LAYOUT)
+        region_bytes = sum(len(encode_image_b64(region)) for region in regions)
+        totals["regions"][2] += time.perf_counter() - start
+
+        full_px = page.width * page.height
+        region_px = sum(region.width * region.height for region in regions)
+        totals["full"][0] += full_px
+        totals["full"][1] += full_bytes
+        totals["regions"][0] += region_px
+        totals["regions"][1] += region_bytes
+        print(
+            f"{os.path.basename(path)[:28]:<28} {full_px:>10,} {region_px:>10,} "
+            f"{full_bytes / 1024:>9.0f} {region_bytes / 1024:>9.0f} {len(regions):>6}"
+        )
+
+    full, regions = totals["full"], totals["regions"]
+    print(
+        f"pixels sent: {regions[0] / full[0]:.0%} of the full page, "
+        f"payload: {regions[1] / full[1]:.0%}, "
+        f"prep+encode: {full[2] * 1000:.0f} ms -> {regions[2] * 1000:.0f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#in terminal: python -m benchmarks.mutabnet
+
+import argparse
+import glob
+import time
+
+import cv2
+import torch
+from torch import nn
+
+from mutabnet_wrapper import MuTAbNet, letterbox, quantize_for_cpu
+
+SAMPLE_GLOB = "sample/labvalues sample/*"
+
+
+class StandInTableModel(nn.Module):
+    """Small conv backbone with a linear head, roughly shaped like a table-structure model."""
+
+    def __init__(self):
+        super().__init__()
+        self.backbone = nn.Sequential(
+            nn.Conv2d(3, 16, 3, stride=4, padding=1), nn.ReLU(),
+            nn.Conv2d(16, 32, 3, stride=2, padding=1), nn.ReLU(),
+            nn.Conv2d(32, 64, 3, stride=2, padding=1), nn.ReLU(),
+            nn.AdaptiveAvgPool2d((8, 8))
+        )
+        self.head = nn.Sequential(nn.Flatten(), nn.Linear(64 * 64, 1024), nn.ReLU(), nn.Linear(1024, 256))
+
+    def forward(self, x):
+        return self.head(self.backbone(x))
+
+
+def single_image_loop(model: nn.Module, images: list) -> None:
+    """Previous predict(): one image per forward pass, autograd enabled."""
+    for img in images:
+        tensor = torch.from_numpy(img).permute(2, 0, 1).unsqueeze(0).float() / 255.0
+        model(tensor)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="CPU throughput of MuTAbNet inference with a stand-in model.")
+    parser.add_argument("--images", type=int, default=32, help="Images per run (samples are repeated)")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--size", type=int, nargs=2, default=(1024, 768), metavar=("HEIGHT", "WIDTH"),
+                        help="Input size of every run")
+    args = parser.parse_args()
+
+    decoded = [cv2.imread(path) for path in sorted(glob.glob(SAMPLE_GLOB))]
+    # Every run gets the same letterboxed inputs, so only batching, inference mode and precision differ
+    size = tuple(args.size)
+    samples = [letterbox(cv2.cvtColor(img, cv2.COLOR_BGR2RGB), size)[0] for img in decoded if img is not None]
+    images = [samples[i % len(samples)] for i in range(args.images)]
+
+    torch.manual_seed(0)
+    model = StandInTableModel()
+    fp32 = MuTAbNet(model, "cpu", num_threads=args.threads)
+    int8 = MuTAbNet(quantize_for_cpu(StandInTableModel()), "cpu", num_threads=args.threads)
+    print(f"{len(images)} images at {size[0]}x{size[1]}, torch threads: {torch.get_num_threads()}")
+
+    runs = (
+        ("single, no inference_mode", lambda: single_image_loop(fp32.model, images)),
+        ("batched fp32", lambda: fp32.infer_batch(images, size, batch_size=args.batch_size)),
+        ("batched int8", lambda: int8.infer_batch(images, size, batch_size=args.batch_size))
+    )
+    for name, run in runs:
+        run()  # warm-up
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        print(f"{name:>26}: {len(images) / elapsed:7.1f} images/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#in terminal: python -m benchmarks.preprocessing
+
+import argparse
+import glob
+import json
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+from preprocessing import ADAPTIVE_CONFIG, DEFAULT_CONFIG, BatchPreprocessor, preprocess_array
+
+SAMPLE_GLOB = "sample/*/*"
+CONFIGS = {"default": DEFAULT_CONFIG, "adaptive": ADAPTIVE_CONFIG}
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is reported in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_variant(variant: str, repeats: int) -> dict:
+    """Time one pipeline variant over the sample images; meant to run in a fresh process."""
+    images = [Image.open(path).convert("RGB") for path in sorted(glob.glob(SAMPLE_GLOB))]
+    for image in images:
+        image.load()
+    baseline_rss = _peak_rss_mb()
+
+    timings = []
+    pixels_out = 0
+    if variant == "batch":
+        with BatchPreprocessor(ADAPTIVE_CONFIG) as batch:
+            for _ in range(repeats):
+                start = time.perf_counter()
+                outputs = batch.run(images)
+                timings.append(time.perf_counter() - start)
+        pixels_out = sum(output.size[0] * output.size[1] for output in outputs)
+    else:
+        config = CONFIGS[variant]
+        for _ in range(repeats):
+            start = time.perf_counter()
+            outputs = [preprocess_array(image, config) for image in images]
+            timings.append(time.perf_counter() - start)
+        pixels_out = sum(output.size for output in outputs)
+
+    return {
+        "variant": variant,
+        "images": len(images),
+        "median_s": float(np.median(timings)),
+        "min_s": float(np.min(timings)),
+        "peak_rss_delta_mb": round(_peak_rss_mb() - baseline_rss, 1),
+        "output_megapixels": round(pixels_out / 1e6, 2)
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark preprocessing pipelines on the sample images.")
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--variant", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        print(json.dumps(run_variant(args.variant, args.repeats)))
+        return
+
+    # Each variant runs in its own interpreter so peak RSS is not shared between them
+    for variant in ("default", "adaptive", "batch"):
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.preprocessing", "--variant", variant, "--repeats", str(args.repeats)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        result = json.loads(output)
+        print(
+            f"{result['variant']:>8}: {result['median_s'] * 1000:8.1f} ms median "
+            f"({result['images']} images), peak RSS +{result['peak_rss_delta_mb']} MB, "
+            f"{result['output_megapixels']} MP out"
+        )
+
+
+if __name__ == "__main__":
+    main()
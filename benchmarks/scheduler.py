@@ -0,0 +1,90 @@
+#in terminal: python -m benchmarks.scheduler
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from typing import Optional
+
+from async_ollama import AsyncOllamaClient
+from benchmarks.service import _serve
+from fake_ollama import create_app
+from ollama_scheduler import BATCH, INTERACTIVE, PRIORITY_NAMES, OllamaScheduler
+
+MODELS = ("gemma3:4b", "llama3.2-vision:11b")
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[int(q * (len(values) - 1))] if values else 0.0
+
+
+async def workload(args, scheduler: Optional[OllamaScheduler]) -> None:
+    app = create_app(
+        models=MODELS,
+        token_delay=args.token_delay,
+        load_seconds=args.load_seconds,
+        max_loaded_models=1,
+        num_parallel=args.num_parallel,
+        parallel_slowdown=args.parallel_slowdown
+    )
+    runner, url = await _serve(app)
+    rng = random.Random(args.seed)
+    latencies = {INTERACTIVE: [], BATCH: []}
+    try:
+        # Without a scheduler every request goes straight to Ollama, as the app did before
+        async with AsyncOllamaClient(url, max_in_flight=1000, scheduler=scheduler) as client:
+            async def request(model: str, priority: int, delay: float) -> None:
+                await asyncio.sleep(delay)
+                start = time.perf_counter()
+                await client.generate(model, "read the report", priority=priority)
+                latencies[priority].append(time.perf_counter() - start)
+
+            # Two bulk jobs, one per model, submitted at once; interactive uploads keep arriving meanwhile
+            requests = [request(MODELS[i % 2], BATCH, 0.0) for i in range(args.batch)]
+            requests += [
+                request(rng.choice(MODELS), INTERACTIVE, (i + 1) * args.interval) for i in range(args.interactive)
+            ]
+            start = time.perf_counter()
+            await asyncio.gather(*requests)
+            total = time.perf_counter() - start
+    finally:
+        await runner.cleanup()
+
+    stats = app["stats"]
+    label = "scheduled  " if scheduler is not None else "unscheduled"
+    print(f"{label}: {total:6.1f} s total, {stats['loads']:3d} model loads, "
+          f"max {stats['max_in_flight']} requests in Ollama")
+    for priority, values in latencies.items():
+        print(f"    {PRIORITY_NAMES[priority]:<12} p50 {statistics.median(values):6.2f} s  "
+              f"p95 {percentile(values, 0.95):6.2f} s  max {max(values):6.2f} s")
+    if scheduler is not None:
+        summary = scheduler.stats()
+        for model, state in summary["models"].items():
+            print(f"    {model:<22} limit {state['limit']}, tokens/s by limit {state['rates']}")
+        waits = summary["waits"]
+        print("    scheduler wait: " + ", ".join(
+            f"{name} p50 {w['p50']:.2f} s p95 {w['p95']:.2f} s" for name, w in waits.items()))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Ollama scheduler against a fake server that charges for model loads.")
+    parser.add_argument("--batch", type=int, default=48, help="Bulk requests, alternating between two models")
+    parser.add_argument("--interactive", type=int, default=12, help="Interactive requests arriving during the bulk")
+    parser.add_argument("--interval", type=float, default=1.0, help="Seconds between interactive requests")
+    parser.add_argument("--load-seconds", type=float, default=2.0, help="Simulated model load time")
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--num-parallel", type=int, default=4, help="Requests Ollama generates at once per model")
+    parser.add_argument("--parallel-slowdown", type=float, default=0.15,
+                        help="Extra token delay per additional concurrent request")
+    parser.add_argument("--switch-after", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    asyncio.run(workload(args, None))
+    asyncio.run(workload(args, OllamaScheduler(max_loaded_models=1, switch_after=args.switch_after)))
+
+
+if __name__ == "__main__":
+    main()
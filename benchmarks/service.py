@@ -0,0 +1,96 @@
+#in terminal: python -m benchmarks.service
+
+import argparse
+import asyncio
+import io
+import time
+
+import aiohttp
+import numpy as np
+from aiohttp import web
+from PIL import Image
+
+from extraction_service import ExtractionService
+from fake_ollama import create_app
+
+
+def synthetic_upload(seed: int, size: tuple[int, int] = (800, 1000)) -> bytes:
+    """A distinct PNG per seed, so every submission is a new job."""
+    rng = np.random.default_rng(seed)
+    pixels = np.full((size[1], size[0]), 255, dtype=np.uint8)
+    for row in range(40, size[1] - 40, 40):
+        start = int(rng.integers(20, 200))
+        pixels[row:row + 12, start:start + int(rng.integers(200, 500))] = 0
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+async def _serve(app: web.Application) -> tuple[web.AppRunner, str]:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+async def run(jobs: int, workers: int, queue_size: int, token_delay: float) -> None:
+    ollama_runner, ollama_url = await _serve(create_app(token_delay=token_delay))
+    service = ExtractionService(ollama_url, workers=workers, queue_size=queue_size, default_model="gemma3:4b")
+    service_runner, service_url = await _serve(service.create_app())
+    uploads = [synthetic_upload(seed) for seed in range(jobs)]
+    rejected = 0
+
+    async with aiohttp.ClientSession() as session:
+        async def submit(data: bytes) -> str:
+            nonlocal rejected
+            while True:
+                async with session.post(f"{service_url}/extract", data=data) as response:
+                    if response.status != 429:
+                        return (await response.json())["id"]
+                rejected += 1
+                await asyncio.sleep(0.2)
+
+        async def wait(job_id: str) -> dict:
+            while True:
+                async with session.get(f"{service_url}/jobs/{job_id}", params={"wait": 10}) as response:
+                    job = await response.json()
+                if job["status"] in ("done", "error"):
+                    return job
+
+        start = time.perf_counter()
+        ids = await asyncio.gather(*(submit(data) for data in uploads))
+        results = await asyncio.gather(*(wait(job_id) for job_id in ids))
+        elapsed = time.perf_counter() - start
+
+        # Resubmitting an identical upload must answer from the existing job
+        async with session.post(f"{service_url}/extract", data=uploads[0]) as response:
+            duplicate_status = response.status
+
+    errors = sum(job["status"] == "error" for job in results)
+    latencies = sorted(job["finished_at"] - job["submitted_at"] for job in results)
+    stats = ollama_runner.app["stats"]
+    print(
+        f"workers={workers}: {jobs / elapsed:5.1f} jobs/s, "
+        f"p50 {latencies[len(latencies) // 2]:.2f}s, p95 {latencies[int(len(latencies) * 0.95) - 1]:.2f}s, "
+        f"{rejected} x 429, {errors} errors, max {stats['max_in_flight']} Ollama requests in flight, "
+        f"duplicate -> HTTP {duplicate_status}"
+    )
+    await service_runner.cleanup()
+    await ollama_runner.cleanup()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Throughput of the extraction service against a fake Ollama.")
+    parser.add_argument("--jobs", type=int, default=40)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--queue-size", type=int, default=8)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    args = parser.parse_args()
+    for workers in args.workers:
+        asyncio.run(run(args.jobs, workers, args.queue_size, args.token_delay))
+
+
+if __name__ == "__main__":
+    main()
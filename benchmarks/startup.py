@@ -0,0 +1,135 @@
+#in terminal: python -m benchmarks.startup --check
+
+import argparse
+import ast
+import json
+import subprocess
+import sys
+from typing import Optional
+
+APP = "streamlit_app.py"
+# Modules that must not be loaded before there is an upload to process
+HEAVY = ("cv2", "numpy", "pandas", "torch", "aiohttp", "pymupdf", "ollama_ocr", "pytesseract", "requests")
+# What the first render may add on top of importing Streamlit
+BUDGET_SECONDS = 0.5
+BUDGET_RSS_MIB = 40.0
+
+_PROBE = """
+import importlib, json, os, resource, sys, time
+start = time.perf_counter()
+missing = []
+for name in {modules!r}:
+    try:
+        importlib.import_module(name)
+    except ImportError:
+        missing.append(name)
+seconds = time.perf_counter() - start
+rss_kib = None
+if os.path.exists("/proc/self/status"):
+    with open("/proc/self/status") as f:
+        rss_kib = next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+else:
+    rss_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // (1024 if sys.platform == "darwin" else 1)
+heavy = sorted(name for name in {heavy!r} if name in sys.modules)
+print(json.dumps({{"seconds": seconds, "rss_mib": rss_kib / 1024, "heavy": heavy, "missing": missing}}))
+"""
+
+_RENDER = """
+import json, time
+from streamlit.testing.v1 import AppTest
+start = time.perf_counter()
+AppTest.from_file({app!r}, default_timeout=60).run()
+print(json.dumps({{"seconds": time.perf_counter() - start}}))
+"""
+
+
+def _module_imports(body: list) -> list[str]:
+    names = []
+    for node in body:
+        if isinstance(node, ast.Import):
+            names.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.append(node.module)
+    return names
+
+
+def app_imports(path: str = APP) -> dict[str, list[str]]:
+    """Imports of the app at module level (first render) and at the top of the upload branch."""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    upload = []
+    for node in tree.body:
+        if isinstance(node, ast.If) and isinstance(node.test, ast.Name) and node.test.id == "uploaded_file":
+            upload = _module_imports(node.body)
+    return {"first_render": _module_imports(tree.body), "upload": upload}
+
+
+def probe(modules: list[str]) -> dict:
+    """Import modules in a fresh interpreter; returns seconds, RSS after import and heavy modules loaded."""
+    code = _PROBE.format(modules=modules, heavy=HEAVY)
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def render_seconds(path: str = APP) -> Optional[float]:
+    """Time a full first run of the app script with Streamlit's AppTest, or None without Streamlit."""
+    out = subprocess.run([sys.executable, "-c", _RENDER.format(app=path)], capture_output=True, text=True)
+    if out.returncode != 0:
+        return None
+    return json.loads(out.stdout.strip().splitlines()[-1])["seconds"]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Startup profile of the Streamlit app: import time, idle RSS, heavy modules.")
+    parser.add_argument("--check", action="store_true", help="Exit 1 if the first render loads heavy modules or exceeds the budgets")
+    parser.add_argument("--budget-seconds", type=float, default=BUDGET_SECONDS, help="First-render import time allowed on top of Streamlit")
+    parser.add_argument("--budget-rss-mib", type=float, default=BUDGET_RSS_MIB, help="First-render RSS allowed on top of Streamlit")
+    parser.add_argument("--render", action="store_true", help="Also time a full script run with streamlit.testing")
+    args = parser.parse_args()
+
+    imports = app_imports()
+    first = [name for name in imports["first_render"] if name != "streamlit"]
+    stages = [
+        ("interpreter", []),
+        ("streamlit", ["streamlit"]),
+        ("first render", imports["first_render"]),
+        ("upload", imports["first_render"] + imports["upload"]),
+        ("service client", ["extraction_service"]),
+        ("streaming", ["async_ollama"]),
+        ("table model", ["mutabnet_wrapper"]),
+        ("torch", ["torch"]),
+    ]
+    results = {}
+    print(f"{'stage':<15} {'import s':>9} {'RSS MiB':>8}  heavy modules loaded")
+    for name, modules in stages:
+        result = results[name] = probe(modules)
+        missing = f"  (not installed: {', '.join(result['missing'])})" if result["missing"] else ""
+        print(f"{name:<15} {result['seconds']:9.3f} {result['rss_mib']:8.1f}  {', '.join(result['heavy']) or '-'}{missing}")
+
+    if args.render:
+        seconds = render_seconds()
+        print(f"first render (AppTest): {seconds:.3f} s" if seconds is not None else "first render: Streamlit not installed")
+
+    # Streamlit itself needs numpy and pandas; only what the app adds on top counts
+    base, app = results["streamlit"], results["first render"]
+    extra_heavy = sorted(set(app["heavy"]) - set(base["heavy"]))
+    extra_seconds = app["seconds"] - base["seconds"]
+    extra_rss = app["rss_mib"] - base["rss_mib"]
+    print(f"\nfirst render adds {extra_seconds:.3f} s and {extra_rss:.1f} MiB over Streamlit "
+          f"(app modules: {', '.join(first)})")
+    if not args.check:
+        return 0
+    failures = []
+    if extra_heavy:
+        failures.append(f"heavy modules imported before an upload: {', '.join(extra_heavy)}")
+    if extra_seconds > args.budget_seconds:
+        failures.append(f"import time {extra_seconds:.3f} s > {args.budget_seconds} s")
+    if extra_rss > args.budget_rss_mib:
+        failures.append(f"RSS {extra_rss:.1f} MiB > {args.budget_rss_mib} MiB")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
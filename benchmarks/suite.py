@@ -0,0 +1,354 @@
+#in terminal: python -m benchmarks.suite --backend recorded -o benchmark.json
+
+import argparse
+import csv
+import glob
+import json
+import os
+import platform
+import re
+import resource
+import statistics
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+from PIL import Image
+
+from extraction import extract_values, parse_number
+from image_io import encode_image_b64
+from ocr_backends import LAB_PROMPT, TESSERACT_LANG, run_ollama_ocr, run_tesseract
+from operating_point import is_lossless, preprocess_for
+
+SAMPLE_GLOBS = ("sample/labvalues sample/*", "sample/handwritten/*")
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+GROUND_TRUTH_DIR = os.path.join(BENCH_DIR, "ground_truth")
+RECORDINGS_DIR = os.path.join(BENCH_DIR, "recordings")
+STAGES = ("decode", "preprocess", "ocr", "extract")
+
+
+def _stem(path: str) -> str:
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def load_ground_truth(path: str) -> Optional[list[dict]]:
+    """Hand-labelled values for a sample, or None when the sample has no (or an empty) ground-truth CSV."""
+    csv_path = os.path.join(GROUND_TRUTH_DIR, f"{_stem(path)}.csv")
+    if not os.path.exists(csv_path):
+        return None
+    with open(csv_path, newline="", encoding="utf-8") as handle:
+        truth = [
+            {"Test": row["Test"], "Value": parse_number(row["Value"]), "Unit": row["Unit"]}
+            for row in csv.DictReader(handle)
+        ]
+    # A header without rows is an unlabelled sample, not one where nothing should be found
+    return truth or None
+
+
+def _ground_truth_markdown(truth: list[dict]) -> str:
+    lines = ["| Test | Value | Unit |", "|---|---|---|"]
+    lines.extend(f"| {row['Test']} | {row['Value']:g} | {row['Unit']} |" for row in truth)
+    return "\n".join(lines)
+
+
+class RecordedBackend:
+    """
+    Offline stand-in for the Ollama backend.
+
+    Replays responses saved with --record from recordings/<model>/<sample>.md.
+    Samples without a recording get their ground truth rendered as a markdown
+    table so the rest of the pipeline can still be run, but they are flagged
+    synthetic: their accuracy is not scored and they are left out of the totals.
+    The image is still encoded, since that is real work (and the bytes that
+    would be sent) on the live path.
+    """
+
+    def __init__(self, model_name: str):
+        self.directory = os.path.join(RECORDINGS_DIR, model_name.replace(":", "_").replace("/", "_"))
+        self.lossless = is_lossless(f"ollama:{model_name}")
+        self.synthetic: set[str] = set()
+
+    def __call__(self, path: str, image: Image.Image) -> tuple[str, int]:
+        sent = len(encode_image_b64(image, self.lossless))
+        recording = os.path.join(self.directory, f"{_stem(path)}.md")
+        if os.path.exists(recording):
+            with open(recording, encoding="utf-8") as handle:
+                return handle.read(), sent
+        self.synthetic.add(path)
+        return _ground_truth_markdown(load_ground_truth(path) or []), sent
+
+
+class OllamaBackend:
+    """Live Ollama-OCR call; optionally saves each response for RecordedBackend."""
+
+    def __init__(self, model_name: str, prompt: Optional[str], record: bool = False):
+        self.model_name = model_name
+        self.prompt = prompt
+        self.record_dir = RecordedBackend(model_name).directory if record else None
+        self.lossless = is_lossless(f"ollama:{model_name}")
+
+    def __call__(self, path: str, image: Image.Image) -> tuple[str, int]:
+        text = run_ollama_ocr(image, self.model_name, self.prompt, lossless=self.lossless)
+        if self.record_dir:
+            os.makedirs(self.record_dir, exist_ok=True)
+            with open(os.path.join(self.record_dir, f"{_stem(path)}.md"), "w", encoding="utf-8") as handle:
+                handle.write(text)
+        # Same encoding the request used; measured here so it is not counted twice in the timing
+        return text, len(encode_image_b64(image, self.lossless))
+
+
+def tesseract_backend(path: str, image: Image.Image) -> tuple[str, int]:
+    return run_tesseract(image, lang=TESSERACT_LANG), 0
+
+
+def _decode(path: str) -> Image.Image:
+    image = Image.open(path)
+    image.load()
+    return image
+
+
+def _run_stages(path: str, recognize: Callable, backend: str) -> tuple[dict, list[dict], int]:
+    """One pass over all stages; returns per-stage (wall, cpu) seconds, the values and bytes sent."""
+    timings = {}
+
+    def timed(stage, fn, *args):
+        wall, cpu = time.perf_counter(), time.process_time()
+        result = fn(*args)
+        timings[stage] = (time.perf_counter() - wall, time.process_time() - cpu)
+        return result
+
+    image = timed("decode", _decode, path)
+    processed = timed("preprocess", preprocess_for, image, backend)
+    text, sent = timed("ocr", recognize, path, processed)
+    values = timed("extract", extract_values, text)
+    return timings, values, sent
+
+
+def _peak_memory(path: str, recognize: Callable, backend: str) -> dict:
+    """
+    Peak traced allocation per stage in KiB, from a separate pass so tracing does not skew timings.
+
+    tracemalloc sees Python and numpy allocations; buffers allocated inside
+    PIL or OpenCV C code are not included (the process max RSS is reported in meta).
+    """
+    peaks = {}
+
+    def traced(stage, fn, *args):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        result = fn(*args)
+        peaks[stage] = round((tracemalloc.get_traced_memory()[1] - base) / 1024, 1)
+        return result
+
+    tracemalloc.start()
+    try:
+        image = traced("decode", _decode, path)
+        processed = traced("preprocess", preprocess_for, image, backend)
+        text, _ = traced("ocr", recognize, path, processed)
+        traced("extract", extract_values, text)
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def _key(test: str) -> str:
+    return re.sub(r"[^0-9a-z%#]", "", test.lower())
+
+
+def score(values: list[dict], truth: list[dict]) -> dict:
+    """
+    Compare extracted rows with the ground truth.
+
+    Rows are matched on the normalized test name; a match counts as correct
+    when the value is equal too.
+    """
+    expected = {_key(row["Test"]): row["Value"] for row in truth}
+    found = {}
+    for row in values:
+        found.setdefault(_key(str(row["Test"])), row["Value"])
+    matched = [key for key in found if key in expected]
+    correct = sum(
+        1 for key in matched
+        if expected[key] is not None and found[key] is not None and abs(found[key] - expected[key]) < 1e-6
+    )
+    precision = correct / len(found) if found else (1.0 if not expected else 0.0)
+    recall = correct / len(expected) if expected else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {
+        "expected": len(expected),
+        "extracted": len(found),
+        "matched": len(matched),
+        "correct": correct,
+        "precision": round(precision, 3),
+        "recall": round(recall, 3),
+        "f1": round(f1, 3)
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def run_suite(recognize: Callable, backend: str, repeat: int = 3, memory: bool = True) -> list[dict]:
+    """
+    Benchmark every sample.
+
+    Args:
+        recognize: OCR stage, called as recognize(path, preprocessed_image) -> (text, bytes_sent)
+        backend: Backend name ("tesseract" or "ollama:<model>") whose operating point pages are prepared for
+        repeat: Timed passes per sample; medians are reported
+        memory: Also measure peak memory per stage in an extra traced pass
+
+    Returns:
+        list[dict]: One entry per sample with per-stage metrics and accuracy
+    """
+    samples = []
+    paths = sorted(path for pattern in SAMPLE_GLOBS for path in glob.glob(pattern))
+    for path in paths:
+        runs = []
+        values, sent, error = [], 0, ""
+        try:
+            for _ in range(repeat):
+                timings, values, sent = _run_stages(path, recognize, backend)
+                runs.append(timings)
+            peaks = _peak_memory(path, recognize, backend) if memory else {}
+        except Exception as e:
+            error, peaks = f"{type(e).__name__}: {e}", {}
+
+        stages = {}
+        for stage in STAGES:
+            measured = [run[stage] for run in runs if stage in run]
+            stages[stage] = {
+                "wall_ms": round(statistics.median(m[0] for m in measured) * 1000, 2) if measured else None,
+                "cpu_ms": round(statistics.median(m[1] for m in measured) * 1000, 2) if measured else None,
+                "peak_kib": peaks.get(stage),
+                "bytes_sent": sent if stage == "ocr" else 0
+            }
+        truth = load_ground_truth(path)
+        synthetic = path in getattr(recognize, "synthetic", ())
+        samples.append({
+            "file": path,
+            "stages": stages,
+            "rows": len(values),
+            "accuracy": score(values, truth) if truth is not None and not error and not synthetic else None,
+            "synthetic": synthetic,
+            "error": error
+        })
+    return samples
+
+
+def summarize(samples: list[dict]) -> dict:
+    """Per-stage and accuracy totals over the measured samples; synthetic ones are left out."""
+    totals = {}
+    measured = [s for s in samples if not s["synthetic"]]
+    for stage in STAGES:
+        entries = [s["stages"][stage] for s in measured if s["stages"][stage]["wall_ms"] is not None]
+        totals[stage] = {
+            "wall_ms": round(sum(e["wall_ms"] for e in entries), 2),
+            "cpu_ms": round(sum(e["cpu_ms"] for e in entries), 2),
+            "peak_kib": max((e["peak_kib"] or 0 for e in entries), default=0),
+            "bytes_sent": sum(e["bytes_sent"] for e in entries)
+        }
+    scored = [s["accuracy"] for s in measured if s["accuracy"]]
+    if not scored:
+        # Nothing was recognized for real (e.g. no recordings): there is no accuracy to report
+        totals["accuracy"] = None
+        return totals
+    expected = sum(a["expected"] for a in scored)
+    extracted = sum(a["extracted"] for a in scored)
+    correct = sum(a["correct"] for a in scored)
+    precision = correct / extracted if extracted else 0.0
+    recall = correct / expected if expected else 0.0
+    totals["accuracy"] = {
+        "precision": round(precision, 3),
+        "recall": round(recall, 3),
+        "f1": round(2 * precision * recall / (precision + recall), 3) if precision + recall else 0.0
+    }
+    return totals
+
+
+def compare(current: dict, previous: dict) -> None:
+    """Print per-stage wall time and accuracy changes against an earlier result file."""
+    for stage in STAGES:
+        before = previous["totals"][stage]["wall_ms"]
+        after = current["totals"][stage]["wall_ms"]
+        change = (after - before) / before if before else 0.0
+        print(f"{stage:>10}: {before:9.1f} ms -> {after:9.1f} ms ({change:+.1%})")
+    before, after = (
+        f"{totals['accuracy']['f1']:9.3f}" if totals["accuracy"] else f"{'n/a':>9}"
+        for totals in (previous["totals"], current["totals"])
+    )
+    print(f"{'f1':>10}: {before}    -> {after}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Per-stage benchmark and accuracy over the sample corpus.")
+    parser.add_argument("--backend", choices=["recorded", "ollama", "tesseract"], default="recorded",
+                        help="recorded replays saved Ollama responses and runs offline")
+    parser.add_argument("--model", default="llama3.2-vision:11b")
+    parser.add_argument("--record", action="store_true", help="Save live Ollama responses for --backend recorded")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed passes per sample")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the traced peak-memory pass")
+    parser.add_argument("-o", "--output", default="benchmark.json", help="JSON results file")
+    parser.add_argument("--compare", help="Earlier JSON results to compare against")
+    args = parser.parse_args()
+
+    if args.backend == "recorded":
+        recognize = RecordedBackend(args.model)
+    elif args.backend == "ollama":
+        recognize = OllamaBackend(args.model, LAB_PROMPT, args.record)
+    else:
+        recognize = tesseract_backend
+    # Recordings replay Ollama answers, so pages are prepared as for that model
+    backend = "tesseract" if args.backend == "tesseract" else f"ollama:{args.model}"
+
+    samples = run_suite(recognize, backend, args.repeat, not args.no_memory)
+
+    result = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "backend": args.backend,
+            "model": args.model if args.backend != "tesseract" else "",
+            "repeat": args.repeat,
+            "max_rss_mib": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        },
+        "samples": samples,
+        "totals": summarize(samples)
+    }
+    with open(args.output, "w", encoding="utf-8") as handle:
+        json.dump(result, handle, indent=2, ensure_ascii=False)
+
+    for sample in samples:
+        stages = "  ".join(f"{stage} {sample['stages'][stage]['wall_ms'] or 0:7.1f}" for stage in STAGES)
+        accuracy = sample["accuracy"]
+        if accuracy:
+            f1 = f"f1 {accuracy['f1']:.2f}"
+        elif sample["synthetic"]:
+            f1 = "f1 n/a (no recording)"
+        else:
+            f1 = sample["error"] or "no ground truth"
+        print(f"{os.path.basename(sample['file'])[:28]:<28} {stages} ms  {f1}")
+    totals = result["totals"]
+    synthetic = sum(sample["synthetic"] for sample in samples)
+    print(f"sent to model: {totals['ocr']['bytes_sent'] / 1024:.0f} KiB, accuracy: {totals['accuracy'] or 'n/a'}"
+          + (f" ({synthetic} samples without a recording left out)" if synthetic else ""))
+    print(f"Results: {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as handle:
+            compare(result, json.load(handle))
+
+
+if __name__ == "__main__":
+    main()
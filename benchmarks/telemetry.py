@@ -0,0 +1,41 @@
+#in terminal: python -m benchmarks.telemetry
+
+import time
+
+import telemetry
+from benchmarks.extraction import synthetic_report
+from extraction import extract_values
+
+
+def per_call_ns(calls: int = 200_000) -> float:
+    start = time.perf_counter()
+    for _ in range(calls):
+        pass
+    loop = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(calls):
+        with telemetry.span("bench") as s:
+            s.set("rows", 1)
+    return (time.perf_counter() - start - loop) / calls * 1e9
+
+
+def extract_ms(text: str, repeat: int = 200) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        extract_values(text)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main() -> None:
+    # A short report is the worst case: the span is a larger share of the work
+    text = synthetic_report(40)
+    for enabled in (False, True):
+        telemetry.enable(enabled)
+        telemetry.reset()
+        label = "enabled" if enabled else "disabled"
+        print(f"{label:>8}: {per_call_ns():7.0f} ns per span, extract_values on 40 lines {extract_ms(text):.3f} ms")
+    telemetry.enable(False)
+
+
+if __name__ == "__main__":
+    main()
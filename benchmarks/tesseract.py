@@ -0,0 +1,85 @@
+#in terminal: python -m benchmarks.tesseract --workers 4
+
+import argparse
+import glob
+import os
+import statistics
+import subprocess
+import time
+
+from PIL import Image
+
+from ocr_backends import TESSERACT_LANG
+from preprocessing import preprocess_image
+from tesseract_pool import TesseractPool, has_tesserocr
+
+SAMPLE_GLOB = "sample/*/*"
+
+
+def median_seconds(fn, repeats: int) -> float:
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def spawn_overhead(lang: str, repeats: int) -> tuple[float, float]:
+    """Seconds to start a tesseract process, and to start one and load the languages for a blank image."""
+    import pytesseract
+
+    cmd = pytesseract.pytesseract.tesseract_cmd
+    spawn = median_seconds(lambda: subprocess.run([cmd, "--version"], capture_output=True, check=True), repeats)
+    blank = Image.new("L", (32, 32), 255)
+    load = median_seconds(lambda: pytesseract.image_to_string(blank, lang=lang), repeats)
+    return spawn, load
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Per-page Tesseract latency: one process per call vs the engine pool.")
+    parser.add_argument("--lang", default=TESSERACT_LANG)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Engines for the parallel run")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    import pytesseract
+
+    try:
+        version = pytesseract.get_tesseract_version()
+    except pytesseract.TesseractNotFoundError:
+        print("tesseract is not installed; nothing to measure")
+        return 1
+    print(f"tesseract {version}, tesserocr {'installed' if has_tesserocr() else 'not installed (pool spawns per page)'}, "
+          f"{os.cpu_count()} CPU(s)")
+
+    spawn, load = spawn_overhead(args.lang, args.repeats)
+    print(f"process spawn: {spawn * 1000:.0f} ms, spawn + load {args.lang} on a blank image: {load * 1000:.0f} ms")
+
+    single, parallel = TesseractPool(args.lang, workers=1), TesseractPool(args.lang, workers=args.workers)
+    print(f"{'sample':<42} {'per call':>9} {'pool cold':>10} {'pool warm':>10} {f'x{args.workers} warm':>10} "
+          f"{'bands':>6} {'words':>6} {'conf':>5}")
+    totals = [0.0, 0.0, 0.0]
+    for i, path in enumerate(sorted(glob.glob(SAMPLE_GLOB))):
+        with Image.open(path) as image:
+            page = preprocess_image(image)
+        per_call = median_seconds(lambda: pytesseract.image_to_string(page, lang=args.lang), args.repeats)
+        # Only the first page pays for loading the engine
+        cold = single.recognize(page).seconds if i == 0 else float("nan")
+        warm = median_seconds(lambda: single.recognize(page), args.repeats)
+        result = parallel.recognize(page)
+        wide = median_seconds(lambda: parallel.recognize(page), args.repeats)
+        conf = statistics.mean(result.confidences) if result.words else 0.0
+        print(f"{os.path.basename(path)[:42]:<42} {per_call * 1000:7.0f}ms {cold * 1000:8.0f}ms {warm * 1000:8.0f}ms "
+              f"{wide * 1000:8.0f}ms {result.bands:6d} {len(result.words):6d} {conf:5.1f}")
+        totals[0] += per_call
+        totals[1] += warm
+        totals[2] += wide
+    print(f"{'total':<42} {totals[0] * 1000:7.0f}ms {'':>10} {totals[1] * 1000:8.0f}ms {totals[2] * 1000:8.0f}ms")
+    single.close()
+    parallel.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,150 @@
+#in terminal: python -m benchmarks.tune --backend ollama --model gemma3:4b
+
+import argparse
+import glob
+import statistics
+import time
+from dataclasses import asdict, replace
+from typing import Callable, Optional
+
+from PIL import Image
+
+from benchmarks.suite import SAMPLE_GLOBS, _decode, load_ground_truth, score
+from extraction import extract_values
+from image_io import encode_image_b64
+from ocr_backends import LAB_PROMPT, TESSERACT_LANG, run_ollama_ocr, run_tesseract
+from operating_point import DEFAULT_OPERATING_POINTS_PATH, OperatingPoint, save_operating_point
+from preprocessing import preprocess_image
+
+DEFAULT_WIDTHS = (768, 1024, 1280, 1600, 2048, 2560)
+
+# recognize(preprocessed_image, lossless) -> (text, bytes_sent)
+Recognizer = Callable[[Image.Image, bool], tuple[str, int]]
+
+
+def candidates(backend: str, widths: tuple[int, ...]) -> list[OperatingPoint]:
+    """The current default pipeline first, then every width with and without binarization and, for Ollama, JPEG."""
+    encodings = (True, False) if backend.startswith("ollama:") else (True,)
+    points = [OperatingPoint(backend)]
+    for width in widths:
+        for binarize in (True, False):
+            for lossless in encodings:
+                # Binarized pages are always sent as 1-bit PNG, JPEG would be the same request
+                if binarize and not lossless:
+                    continue
+                points.append(OperatingPoint(backend, width, binarize, lossless))
+    return points
+
+
+def load_samples() -> list[tuple[str, Image.Image, list[dict]]]:
+    """Every sample that has ground truth, decoded once."""
+    paths = sorted(path for pattern in SAMPLE_GLOBS for path in glob.glob(pattern))
+    samples = []
+    for path in paths:
+        truth = load_ground_truth(path)
+        if truth is not None:
+            samples.append((path, _decode(path), truth))
+    return samples
+
+
+def measure(point: OperatingPoint, samples: list, recognize: Recognizer, repeat: int) -> OperatingPoint:
+    """
+    Run every sample at point; returns it with accuracy, latency and request size filled in.
+
+    f1 is micro-averaged over all rows of the corpus, seconds is the mean per
+    sample of the median preprocess + encode + OCR time over repeat passes.
+    """
+    config = point.config()
+    extracted = expected = correct = sent = 0
+    seconds = []
+    for path, image, truth in samples:
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            text, size = recognize(preprocess_image(image, config), point.lossless)
+            times.append(time.perf_counter() - start)
+        accuracy = score(extract_values(text), truth)
+        extracted += accuracy["extracted"]
+        expected += accuracy["expected"]
+        correct += accuracy["correct"]
+        sent += size
+        seconds.append(statistics.median(times))
+    precision = correct / extracted if extracted else 0.0
+    recall = correct / expected if expected else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return replace(point, f1=round(f1, 3), seconds=round(statistics.mean(seconds), 4), bytes_sent=sent // len(samples))
+
+
+def choose(points: list[OperatingPoint], min_f1: float) -> tuple[OperatingPoint, bool]:
+    """
+    The fastest point with at least min_f1, or the most accurate one when none reaches it.
+
+    Returns:
+        tuple: The point, and whether it meets min_f1
+    """
+    eligible = [point for point in points if point.f1 >= min_f1]
+    if eligible:
+        return min(eligible, key=lambda point: (point.seconds, -point.f1)), True
+    return max(points, key=lambda point: (point.f1, -point.seconds)), False
+
+
+def make_recognizer(backend: str, model: str, prompt: Optional[str]) -> Recognizer:
+    if backend == "tesseract":
+        return lambda image, lossless: (run_tesseract(image, lang=TESSERACT_LANG), 0)
+
+    def recognize(image: Image.Image, lossless: bool) -> tuple[str, int]:
+        # No result cache: every point has to reach the model
+        text = run_ollama_ocr(image, model, prompt, lossless=lossless)
+        return text, len(encode_image_b64(image, lossless))
+
+    return recognize
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Sweep page size, binarization and encoding per backend over the labelled samples, "
+                    "and store the fastest setting that keeps the accuracy."
+    )
+    parser.add_argument("--backend", choices=["tesseract", "ollama"], default="ollama")
+    parser.add_argument("--model", default="llama3.2-vision:11b")
+    parser.add_argument("--widths", type=int, nargs="+", default=list(DEFAULT_WIDTHS), help="Page widths to try")
+    parser.add_argument("--min-f1", type=float, help="Accuracy floor, defaults to that of the current pipeline")
+    parser.add_argument("--tolerance", type=float, default=0.0,
+                        help="With the default floor, f1 the chosen point may lose against the current pipeline")
+    parser.add_argument("--repeat", type=int, default=1, help="Timed passes per sample and point")
+    parser.add_argument("-o", "--output", default=DEFAULT_OPERATING_POINTS_PATH, help="Operating points file")
+    parser.add_argument("--dry-run", action="store_true", help="Print the sweep without storing the result")
+    args = parser.parse_args()
+
+    backend = "tesseract" if args.backend == "tesseract" else f"ollama:{args.model}"
+    samples = load_samples()
+    if not samples:
+        print("No samples with ground truth found.")
+        return 1
+    recognize = make_recognizer(args.backend, args.model, LAB_PROMPT)
+
+    points = []
+    for point in candidates(backend, tuple(args.widths)):
+        point = measure(point, samples, recognize, args.repeat)
+        points.append(point)
+        print(f"  {point.label():<34} f1 {point.f1:5.3f}  {point.seconds * 1000:8.0f} ms/sample  "
+              f"{point.bytes_sent / 1024:7.0f} KiB sent")
+
+    baseline = points[0]
+    min_f1 = args.min_f1 if args.min_f1 is not None else baseline.f1 - args.tolerance
+    chosen, meets_floor = choose(points, min_f1)
+    if not meets_floor:
+        print(f"No setting reaches f1 {min_f1:.3f}; keeping the most accurate one.")
+    speedup = baseline.seconds / chosen.seconds if chosen.seconds else 0.0
+    print(f"{backend}: {chosen.label()}, f1 {chosen.f1:.3f} (current pipeline {baseline.f1:.3f}), "
+          f"{speedup:.1f}x faster than the current pipeline")
+
+    if not args.dry_run:
+        sweep = [{key: value for key, value in asdict(point).items() if key != "backend"} for point in points]
+        save_operating_point(chosen, sweep, args.output)
+        print(f"Saved to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
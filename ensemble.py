@@ -0,0 +1,249 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Optional, Sequence
+
+from PIL import Image
+
+import telemetry
+from async_ollama import AsyncOllamaClient
+from ollama_scheduler import OllamaScheduler
+from extraction import extract_values
+from normalization import convert_value
+from ocr_backends import MARKDOWN_PROMPT
+from result_cache import ResultCache
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ModelRun:
+    """One model's part in an ensemble."""
+    model: str
+    status: str = "running"  # done, error or cancelled
+    seconds: float = 0.0
+    text: str = ""
+    values: list[dict] = field(default_factory=list)
+    error: str = ""
+    cached: bool = False
+    agreement: Optional[float] = None
+
+
+def _round(value: float, digits: int = 4) -> float:
+    return float(f"{value:.{digits}g}")
+
+
+def vote_key(row: dict) -> tuple[str, tuple]:
+    """
+    What a model's row votes for: the test, and its value in the canonical unit.
+
+    Tests are compared by canonical code, so "Emoglobina" and "Hemoglobin"
+    are the same row, and values after unit conversion, so 135 g/L agrees
+    with 13.5 g/dL. Unknown tests or units fall back to the raw name and unit.
+    """
+    code, value, unit = convert_value(row["Test"], row["Value"], row.get("Unit", ""))
+    test = code or " ".join(str(row["Test"]).lower().split())
+    if value is None:
+        return test, (_round(row["Value"]), str(row.get("Unit", "")).strip().lower())
+    return test, (_round(value), unit)
+
+
+class Ballot:
+    """
+    Per-row votes of the models that have answered so far.
+
+    A row is settled once one value has quorum votes, or when even the
+    models still running could not give any value quorum. The ensemble can
+    stop when every known row is settled and the models still running are
+    too few to bring in a new row on their own.
+    """
+
+    def __init__(self, quorum: int):
+        self.quorum = quorum
+        # row key -> value key -> [(model, row)]
+        self.votes: dict[str, dict[tuple, list[tuple[str, dict]]]] = {}
+
+    def add(self, model: str, rows: list[dict]) -> None:
+        seen = set()
+        for row in rows:
+            test, value = vote_key(row)
+            # A model listing a test twice only votes once, for its first reading
+            if test in seen:
+                continue
+            seen.add(test)
+            self.votes.setdefault(test, {}).setdefault(value, []).append((model, row))
+
+    def _top(self, test: str) -> tuple[tuple, list]:
+        return max(self.votes[test].items(), key=lambda item: len(item[1]))
+
+    def settled(self, outstanding: int) -> bool:
+        if outstanding >= self.quorum:
+            return False
+        for test in self.votes:
+            top = len(self._top(test)[1])
+            if top < self.quorum and top + outstanding >= self.quorum:
+                return False
+        return True
+
+    def winners(self) -> dict[str, tuple[tuple, list]]:
+        return {test: self._top(test) for test in self.votes}
+
+    def merged(self) -> list[dict]:
+        """The winning row per test, in first-seen order, with its vote count and whether it reached quorum."""
+        merged = []
+        for _, voters in self.winners().values():
+            row = dict(voters[0][1])
+            row["Votes"] = len(voters)
+            row["Agreed"] = len(voters) >= self.quorum
+            merged.append(row)
+        return merged
+
+
+@dataclass
+class EnsembleResult:
+    """Merged values plus what every model contributed."""
+    values: list[dict]
+    runs: list[ModelRun]
+    quorum: int
+    early_exit: bool
+    seconds: float
+
+    @property
+    def text(self) -> str:
+        return "\n\n".join(f"<!-- {run.model} -->\n{run.text}" for run in self.runs if run.status == "done")
+
+    def report(self) -> list[dict]:
+        """Per-model latency, outcome and agreement with the merged result, for display."""
+        return [
+            {
+                "Model": run.model,
+                "Status": run.status + (" (cached)" if run.cached else ""),
+                "Seconds": round(run.seconds, 2),
+                "Rows": len(run.values),
+                "Agreement": None if run.agreement is None else round(run.agreement, 2),
+                "Error": run.error
+            }
+            for run in self.runs
+        ]
+
+
+async def _recognize(
+        client: AsyncOllamaClient,
+        image: Image.Image,
+        model: str,
+        prompt: str,
+        cache: Optional[ResultCache],
+        run: ModelRun
+) -> str:
+    cache_key = None
+    if cache is not None:
+        # Same key as the streaming path and the service, so their answers are shared
+        cache_key = cache.make_key(image, model, prompt, "markdown-stream")
+        cached = cache.get(cache_key)
+        if cached is not None:
+            run.cached = True
+            return cached
+    text = await client.analyze_image(image, prompt, model=model)
+    if cache_key is not None:
+        cache.put(cache_key, text)
+    return text
+
+
+async def run_ensemble_async(
+        image: Image.Image,
+        models: Sequence[str],
+        prompt: Optional[str] = None,
+        quorum: Optional[int] = None,
+        client: Optional[AsyncOllamaClient] = None,
+        cache: Optional[ResultCache] = None
+) -> EnsembleResult:
+    """
+    Send an image to several models at once and merge their values by per-row voting.
+
+    As soon as every row has quorum agreeing models (or can no longer get
+    them) the remaining requests are cancelled, which also stops generation
+    in Ollama, so the slowest model is only waited for when it matters.
+
+    Args:
+        image: Preprocessed image
+        models: Ollama vision models to ask
+        prompt: Prompt for every model, defaults to MARKDOWN_PROMPT
+        quorum: Models that must agree on a row, defaults to a majority
+        client: Shared client; a temporary one is created otherwise
+        cache: Optional result cache checked per model
+
+    Returns:
+        EnsembleResult: Merged values with Votes and Agreed columns, and per-model runs
+    """
+    models = list(dict.fromkeys(models))
+    if not models:
+        raise ValueError("At least one model is needed")
+    quorum = quorum or len(models) // 2 + 1
+    if not 1 <= quorum <= len(models):
+        raise ValueError(f"quorum must be between 1 and {len(models)}")
+    prompt = prompt or MARKDOWN_PROMPT
+    own_client = client is None
+    client = client or AsyncOllamaClient(max_in_flight=len(models))
+
+    runs = {model: ModelRun(model) for model in models}
+    ballot = Ballot(quorum)
+    early_exit = False
+    start = time.perf_counter()
+    tasks = {asyncio.create_task(_recognize(client, image, m, prompt, cache, runs[m])): m for m in models}
+    pending = set(tasks)
+    try:
+        with telemetry.span("ensemble", models=len(models), quorum=quorum) as s:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    run = runs[tasks[task]]
+                    run.seconds = time.perf_counter() - start
+                    if task.exception() is not None:
+                        run.status, run.error = "error", str(task.exception())
+                        logger.warning("Ensemble model %s failed: %s", run.model, run.error)
+                        continue
+                    run.status, run.text = "done", task.result()
+                    run.values = extract_values(run.text)
+                    ballot.add(run.model, run.values)
+                if pending and ballot.settled(len(pending)):
+                    early_exit = True
+                    break
+            s.set("early_exit", early_exit)
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        for task in pending:
+            run = runs[tasks[task]]
+            run.status, run.seconds = "cancelled", time.perf_counter() - start
+        if own_client:
+            await client.close()
+
+    winners = ballot.winners()
+    for run in runs.values():
+        telemetry.observe("labsnap_ensemble_model_seconds", run.seconds, model=run.model, outcome=run.status)
+        if run.status != "done" or not run.values:
+            continue
+        keys = dict(vote_key(row) for row in reversed(run.values))
+        agreeing = sum(1 for test, value in keys.items() if winners[test][0] == value)
+        run.agreement = agreeing / len(keys)
+
+    return EnsembleResult(ballot.merged(), list(runs.values()), quorum, early_exit, time.perf_counter() - start)
+
+
+def run_ensemble(
+        image: Image.Image,
+        models: Sequence[str],
+        prompt: Optional[str] = None,
+        quorum: Optional[int] = None,
+        cache: Optional[ResultCache] = None,
+        base_url: str = "http://localhost:11434",
+        scheduler: Optional[OllamaScheduler] = None
+) -> EnsembleResult:
+    """Blocking wrapper around run_ensemble_async, for scripts and Streamlit; scheduler is passed to the client."""
+    async def run() -> EnsembleResult:
+        async with AsyncOllamaClient(base_url, max_in_flight=max(len(models), 1), scheduler=scheduler) as client:
+            return await run_ensemble_async(image, models, prompt, quorum, client, cache)
+
+    return asyncio.run(run())
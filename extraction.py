@@ -0,0 +1,316 @@
+import re
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional, Union
+
+import telemetry
+
+# All patterns are anchored and applied to single whitespace-free tokens,
+# so matching is linear in the line length (no nested or lazy quantifiers)
+TOKEN_RE = re.compile(r"[^\s:=|]+")
+# Digits with one decimal separator, or thousands groups of three with an optional decimal part;
+# anything else with repeated separators (dates "12.03.2024", IP addresses) is not a number
+_NUMBER = r"(?:\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d{1,3}(?:\.\d{3})+(?:,\d+)?|\d+(?:[.,]\d+)?)"
+NUMBER_RE = re.compile(rf"[<>≤≥]?[-+]?{_NUMBER}")
+RANGE_RE = re.compile(rf"[(\[]?([-+]?{_NUMBER})[-–—]([-+]?{_NUMBER})[)\]]?")
+BOUND_RE = re.compile(rf"[(\[]?([<>≤≥])\s?({_NUMBER})[)\]]?")
+UNIT_RE = re.compile(r"(?:%|‰|[A-Za-zµμ°][A-Za-z0-9µμ/^³²*·.%]*|10\^?\d+/[A-Za-zµμ]+|[x×]10\^?\d+/[A-Za-zµμ]+|/[A-Za-zµμ]+)")
+TABLE_SEPARATOR_RE = re.compile(r"\|?\s*:?-{2,}:?\s*(?:\|\s*:?-{2,}:?\s*)*\|?")
+LETTER_RE = re.compile(r"[^\W\d_]")
+# Units printed directly against their value ("42%", "88fL", "13.5g/dL"); deliberately narrower
+# than UNIT_RE, so tokens such as "25OH" or "2nd" are not split into a value and a unit
+_GLUED_UNIT = r"(?:%|‰|(?:[munpµμ]?(?:g|mol|L|l|U|IU|Eq)|fL|fl|pg|mm|sec|s)(?:/[A-Za-zµμ0-9.^³²]+)*)"
+# A number not glued to a preceding word ("B12"), alone or followed by a glued unit;
+# group 1 is the number, group 2 the glued unit
+VALUE_RE = re.compile(rf"(?<![^\s:=])([<>≤≥]?[-+]?{_NUMBER})({_GLUED_UNIT})?(?![^\s:=|])")
+REFERENCE_START = set("0123456789-+([<>≤≥")
+MARKUP_RE = re.compile(r"\*\*|__|`")
+BULLET_RE = re.compile(r"(?:[-*+•]|\d+[.)])\s+")
+
+FLAGS = {
+    "H": "H", "HH": "H", "HIGH": "H", "ALTO": "H", "ALTA": "H", "↑": "H",
+    "L": "L", "LL": "L", "LOW": "L", "BASSO": "L", "BASSA": "L", "BAIXO": "L", "↓": "L",
+    "*": "*", "!": "*"
+}
+
+# Header cell names (eng/ita/por) mapped to the column they describe
+HEADER_ALIASES = {
+    "test": ("test", "test name", "name", "analyte", "parameter", "exam", "esame", "analisi", "parametro", "exame"),
+    "value": ("value", "result", "valore", "risultato", "resultado", "valor"),
+    "unit": ("unit", "units", "unità", "unita", "u.m.", "um", "unidade", "unidades"),
+    "reference": ("reference", "reference range", "range", "normal range", "riferimento", "valori di riferimento",
+                  "intervallo", "intervallo di riferimento", "referência", "referencia", "valores de referência"),
+    "flag": ("flag", "flags", "note", "nota")
+}
+_HEADER_LOOKUP = {alias: column for column, aliases in HEADER_ALIASES.items() for alias in aliases}
+
+
+@dataclass(slots=True)
+class LabValue:
+    """One extracted lab result."""
+    test: str
+    value: float
+    unit: str = ""
+    ref_low: Optional[float] = None
+    ref_high: Optional[float] = None
+    flag: str = ""
+
+    @property
+    def reference(self) -> str:
+        if self.ref_low is not None and self.ref_high is not None:
+            return f"{self.ref_low:g}-{self.ref_high:g}"
+        if self.ref_high is not None:
+            return f"<{self.ref_high:g}"
+        if self.ref_low is not None:
+            return f">{self.ref_low:g}"
+        return ""
+
+    def as_dict(self) -> dict:
+        return {
+            "Test": self.test,
+            "Value": self.value,
+            "Unit": self.unit,
+            "Reference": self.reference,
+            "Flag": self.flag
+        }
+
+
+def parse_number(token: str) -> float:
+    """
+    Parse a number written with either decimal convention.
+
+    "13,5" and "13.5" both give 13.5. When both separators are present the
+    last one is the decimal separator ("1.234,5" and "1,234.5" give 1234.5);
+    a repeated separator groups thousands ("1,234,567").
+
+    Raises:
+        ValueError: If the token is not a number, e.g. a date like "12.03.2024"
+    """
+    token = token.lstrip("<>≤≥")
+    if "," not in token and token.count(".") <= 1:
+        return float(token)
+    last_comma, last_dot = token.rfind(","), token.rfind(".")
+    if token.count(",") > 1 and last_dot < 0:
+        grouping, decimal = ",", ""
+    elif token.count(".") > 1 and last_comma < 0:
+        grouping, decimal = ".", ""
+    elif last_dot >= 0 and last_comma >= 0:
+        grouping, decimal = (".", ",") if last_comma > last_dot else (",", ".")
+    else:
+        return float(token.replace(",", "."))
+    integer, _, fraction = token.rpartition(decimal) if decimal else (token, "", "")
+    if decimal and decimal in integer:
+        raise ValueError(f"could not convert string to float: {token!r}")
+    groups = integer.lstrip("-+").split(grouping)
+    if not 1 <= len(groups[0]) <= 3 or any(len(group) != 3 for group in groups[1:]):
+        raise ValueError(f"could not convert string to float: {token!r}")
+    return float("".join(integer.split(grouping)) + ("." + fraction if decimal else ""))
+
+
+def _clean(text: str) -> str:
+    if "*" in text or "_" in text or "`" in text:
+        text = MARKUP_RE.sub("", text)
+    return text.strip()
+
+
+def _parse_reference(tokens: list[str]) -> tuple[Optional[float], Optional[float], int]:
+    """Parse a reference range at the start of tokens; returns (low, high, tokens used)."""
+    if not tokens:
+        return None, None, 0
+    match = RANGE_RE.fullmatch(tokens[0])
+    if match:
+        return parse_number(match.group(1)), parse_number(match.group(2)), 1
+    # "12.0 - 16.0" split into three tokens
+    if len(tokens) >= 3 and tokens[1] in ("-", "–", "—"):
+        low = NUMBER_RE.fullmatch(tokens[0].strip("(["))
+        high = NUMBER_RE.fullmatch(tokens[2].strip(")]"))
+        if low and high:
+            return parse_number(low.group()), parse_number(high.group()), 3
+    match = BOUND_RE.fullmatch(tokens[0])
+    if match:
+        bound = parse_number(match.group(2))
+        return (None, bound, 1) if match.group(1) in "<≤" else (bound, None, 1)
+    return None, None, 0
+
+
+def _parse_tail(tokens: list[str]) -> tuple[str, Optional[float], Optional[float], str]:
+    """Read the optional unit, reference range and flag that follow a value."""
+    unit, low, high, flag = "", None, None, ""
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        upper = token.upper()
+        if not flag and upper in FLAGS:
+            flag = FLAGS[upper]
+            i += 1
+            continue
+        if low is None and high is None and token[0] in REFERENCE_START:
+            low, high, used = _parse_reference(tokens[i:])
+            if used:
+                i += used
+                continue
+        if not unit and low is None and high is None and UNIT_RE.fullmatch(token):
+            unit = token
+            i += 1
+            continue
+        break
+    return unit, low, high, flag
+
+
+def parse_line(line: str) -> Optional[LabValue]:
+    """
+    Parse a plain-text or key/value line such as
+    "Hemoglobin 13,5 g/dL 12.0-16.0 L" or "WBC: 6.2 10^3/µL".
+
+    The test name is everything before the first standalone number that follows
+    a word containing a letter.
+    """
+    text = _clean(line)
+    bullet = BULLET_RE.match(text)
+    if bullet:
+        text = text[bullet.end():]
+
+    letter = LETTER_RE.search(text)
+    if letter is None:
+        return None
+    value = VALUE_RE.search(text, letter.end())
+    if value is None:
+        return None
+
+    test = " ".join(text[:value.start()].split()).rstrip(":=").strip(" -.")
+    unit, low, high, flag = _parse_tail(TOKEN_RE.findall(text, value.end()))
+    return LabValue(test, parse_number(value.group(1)), value.group(2) or unit, low, high, flag)
+
+
+def _header_columns(cells: list[str]) -> Optional[dict]:
+    columns = {}
+    for index, cell in enumerate(cells):
+        column = _HEADER_LOOKUP.get(cell.lower())
+        if column and column not in columns:
+            columns[column] = index
+    return columns if "test" in columns and "value" in columns else None
+
+
+def _parse_table_row(cells: list[str], columns: dict) -> Optional[LabValue]:
+    def cell(name: str) -> str:
+        index = columns.get(name)
+        return cells[index] if index is not None and index < len(cells) else ""
+
+    test = cell("test")
+    value_tokens = TOKEN_RE.findall(cell("value"))
+    value = VALUE_RE.fullmatch(value_tokens[0]) if value_tokens else None
+    if not test or value is None:
+        return None
+
+    # The value cell often carries the unit or flag too ("13.5 g/dL", "42%", "18.2 H")
+    unit, low, high, flag = _parse_tail(value_tokens[1:])
+    unit = cell("unit") or value.group(2) or unit
+    if "reference" in columns:
+        low, high, _ = _parse_reference(TOKEN_RE.findall(cell("reference")))
+    if "flag" in columns and cell("flag"):
+        flag = FLAGS.get(cell("flag").upper(), cell("flag"))
+    return LabValue(test, parse_number(value.group(1)), unit, low, high, flag)
+
+
+class _LineParser:
+    """Parses one line at a time, remembering the header of the table it is in."""
+
+    def __init__(self):
+        self.columns: Optional[dict] = None
+
+    def parse(self, line: str) -> Optional[LabValue]:
+        try:
+            return self._parse(line)
+        except ValueError:
+            # A token that looked numeric but is not a number (e.g. a malformed date): skip the line
+            return None
+
+    def _parse(self, line: str) -> Optional[LabValue]:
+        stripped = line.strip()
+        if not stripped:
+            self.columns = None
+            return None
+
+        if stripped.startswith("|"):
+            if TABLE_SEPARATOR_RE.fullmatch(stripped):
+                return None
+            cells = [_clean(cell) for cell in stripped.strip("|").split("|")]
+            header = _header_columns(cells)
+            if header:
+                self.columns = header
+                return None
+            if self.columns:
+                return _parse_table_row(cells, self.columns)
+            # Table without a recognizable header: read the row as plain text
+            stripped = " ".join(cells)
+        else:
+            self.columns = None
+
+        return parse_line(stripped)
+
+
+def iter_lab_values(text: Union[str, Iterable[str]]) -> Iterator[LabValue]:
+    """
+    Parse lab values from markdown tables, plain text and key/value lines in one pass.
+
+    Args:
+        text: Whole OCR/model output, or any iterable of lines (e.g. a stream)
+
+    Yields:
+        LabValue: Results in document order
+    """
+    lines = text.splitlines() if isinstance(text, str) else text
+    parser = _LineParser()
+    for line in lines:
+        record = parser.parse(line)
+        if record:
+            yield record
+
+
+class StreamingValueParser:
+    """
+    Parse lab values out of model output while it is still being streamed.
+
+    Only complete lines are parsed, so a table row is read once its newline
+    arrives; finish() parses whatever is left after the stream ends. The rows
+    are exactly those extract_values would return for the whole text.
+    """
+
+    def __init__(self):
+        self.values: list[dict] = []
+        self._parser = _LineParser()
+        self._partial = ""
+
+    def feed(self, chunk: str) -> list[dict]:
+        """Add streamed text and return the rows completed by it."""
+        *lines, self._partial = (self._partial + chunk).split("\n")
+        return self._parse(lines)
+
+    def finish(self) -> list[dict]:
+        """Parse the last, unterminated line and return its row, if any."""
+        line, self._partial = self._partial, ""
+        return self._parse([line])
+
+    def _parse(self, lines: list[str]) -> list[dict]:
+        rows = []
+        for line in lines:
+            record = self._parser.parse(line)
+            if record:
+                rows.append(record.as_dict())
+        self.values.extend(rows)
+        return rows
+
+
+def extract_values(text: str) -> list[dict]:
+    """
+    Extract test name, value, unit, reference range and flag from OCR or model output.
+
+    Args:
+        text: Raw text returned by the OCR backend
+
+    Returns:
+        list[dict]: One dict per result with keys Test, Value, Unit, Reference and Flag
+    """
+    with telemetry.span("parse") as s:
+        values = [record.as_dict() for record in iter_lab_values(text)]
+        s.set("rows", len(values))
+    return values
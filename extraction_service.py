@@ -0,0 +1,467 @@
+#in terminal: python extraction_service.py --port 8765 --workers 2
+
+import argparse
+import asyncio
+import hashlib
+import io
+import itertools
+import logging
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Iterator, Optional
+
+import requests
+from aiohttp import web
+from PIL import Image
+
+import telemetry
+from async_ollama import AsyncOllamaClient
+from extraction import extract_values
+from ingestion import Page, iter_pages
+from layout import DEFAULT_LAYOUT, LayoutConfig, split_regions, stitch_texts
+from ocr_backends import MARKDOWN_PROMPT
+from ollama_scheduler import INTERACTIVE, PRIORITY_NAMES, get_scheduler, parse_priority
+from operating_point import preprocess_for
+from result_cache import DEFAULT_CACHE_PATH, ResultCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8765
+DEFAULT_MODEL = "llama3.2-vision:11b"
+MAX_UPLOAD_BYTES = 64 * 1024 * 1024
+
+
+@dataclass
+class Job:
+    id: str
+    model: str
+    prompt: str
+    data: Optional[bytes] = field(default=None, repr=False)
+    priority: int = INTERACTIVE
+    status: str = "queued"
+    submitted_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    pages: int = 0
+    text: str = ""
+    values: list[dict] = field(default_factory=list)
+    error: str = ""
+    done: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "error")
+
+    def as_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "model": self.model,
+            "priority": PRIORITY_NAMES[self.priority],
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "pages": self.pages,
+            "text": self.text,
+            "values": self.values,
+            "error": self.error
+        }
+
+
+class QueueFull(Exception):
+    """Raised by ExtractionService.submit when no more jobs can be queued."""
+
+
+class ExtractionService:
+    """
+    In-process job queue around preprocess → Ollama → extract_values.
+
+    A fixed number of async workers take jobs from a bounded queue, so a burst
+    of uploads is answered with 429 instead of piling up requests on Ollama.
+    Job ids are derived from the uploaded bytes, model and prompt: submitting
+    the same file twice returns the existing job instead of running it again.
+    Finished jobs are kept for the last max_jobs submissions. With a layout,
+    pages are cropped and tall ones sent as strips recognized concurrently.
+
+    Interactive jobs are taken from the queue before batch ones, and every
+    Ollama request goes through the process-wide OllamaScheduler, which groups
+    the requests of the running jobs by model and caps their concurrency at
+    what Ollama measurably sustains. workers only bounds how many jobs are in
+    progress, i.e. how many requests the scheduler has to choose from.
+    """
+
+    def __init__(
+            self,
+            ollama_url: str = "http://localhost:11434",
+            workers: int = 2,
+            queue_size: int = 16,
+            max_jobs: int = 1000,
+            cache: Optional[ResultCache] = None,
+            default_model: str = DEFAULT_MODEL,
+            layout: Optional[LayoutConfig] = None
+    ):
+        self.ollama_url = ollama_url
+        self.workers = workers
+        self.queue_size = queue_size
+        self.max_jobs = max_jobs
+        self.cache = cache
+        self.default_model = default_model
+        self.layout = layout
+        self.jobs: OrderedDict[str, Job] = OrderedDict()
+        self.counters = {"submitted": 0, "deduplicated": 0, "rejected": 0, "done": 0, "error": 0}
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._seq = itertools.count()
+        self._tasks: list[asyncio.Task] = []
+        self._client: Optional[AsyncOllamaClient] = None
+        self._cpu_pool: Optional[ThreadPoolExecutor] = None
+        self._render_pool: Optional[ThreadPoolExecutor] = None
+
+    @staticmethod
+    def job_id(data: bytes, model: str, prompt: str) -> str:
+        digest = hashlib.sha256(data)
+        for part in (model, prompt):
+            digest.update(b"\0")
+            digest.update(part.encode())
+        return digest.hexdigest()[:32]
+
+    async def start(self, app: Optional[web.Application] = None) -> None:
+        self._queue = asyncio.PriorityQueue(maxsize=self.queue_size)
+        self._client = AsyncOllamaClient(
+            self.ollama_url, max_in_flight=self.workers, scheduler=get_scheduler(self.ollama_url)
+        )
+        self._cpu_pool = ThreadPoolExecutor(max_workers=min(self.workers, os.cpu_count() or 1))
+        # PyMuPDF is not thread-safe, so every job's pages are rasterized on this one thread
+        self._render_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="render")
+        self._tasks = [asyncio.create_task(self._worker(), name=f"extract-{i}") for i in range(self.workers)]
+
+    async def stop(self, app: Optional[web.Application] = None) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._client is not None:
+            await self._client.close()
+        for pool in (self._cpu_pool, self._render_pool):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+        if self.cache is not None:
+            self.cache.save_index()
+
+    def submit(
+            self,
+            data: bytes,
+            model: Optional[str] = None,
+            prompt: Optional[str] = None,
+            priority: int = INTERACTIVE
+    ) -> tuple[Job, bool]:
+        """
+        Queue an image or document for extraction.
+
+        Args:
+            data: Image, PDF or TIFF bytes
+            model: Ollama model, defaults to default_model
+            prompt: Prompt, defaults to MARKDOWN_PROMPT
+            priority: INTERACTIVE or BATCH
+
+        Returns:
+            tuple: The job, and False if an identical job already existed
+
+        Raises:
+            QueueFull: If queue_size jobs are already waiting
+        """
+        model = model or self.default_model
+        prompt = prompt or MARKDOWN_PROMPT
+        job_id = self.job_id(data, model, prompt)
+        existing = self.jobs.get(job_id)
+        # Failed jobs can be resubmitted; anything else is answered from the existing job
+        if existing is not None and existing.status != "error":
+            self.counters["deduplicated"] += 1
+            return existing, False
+
+        job = Job(job_id, model, prompt, data, priority=priority)
+        try:
+            # Interactive jobs first, FIFO within a priority
+            self._queue.put_nowait((priority, next(self._seq), job))
+        except asyncio.QueueFull:
+            self.counters["rejected"] += 1
+            raise QueueFull(f"{self.queue_size} jobs already queued") from None
+        self.jobs[job_id] = job
+        self.jobs.move_to_end(job_id)
+        self.counters["submitted"] += 1
+        self._forget_old_jobs()
+        return job, True
+
+    def _forget_old_jobs(self) -> None:
+        while len(self.jobs) > self.max_jobs:
+            oldest_id, oldest = next(iter(self.jobs.items()))
+            if not oldest.finished:
+                break
+            del self.jobs[oldest_id]
+
+    async def _worker(self) -> None:
+        while True:
+            _, _, job = await self._queue.get()
+            try:
+                await self._run(job)
+            except Exception as e:
+                job.status, job.error = "error", f"{type(e).__name__}: {e}"
+                logger.warning("job %s failed: %s", job.id, job.error)
+            else:
+                job.status = "done"
+            finally:
+                job.data = None
+                job.finished_at = time.time()
+                if job.finished:
+                    self.counters[job.status] += 1
+                    telemetry.observe("labsnap_service_job_seconds", job.finished_at - job.submitted_at)
+                job.done.set()
+                self._queue.task_done()
+
+    async def _run(self, job: Job) -> None:
+        loop = asyncio.get_running_loop()
+        job.status, job.started_at = "running", time.time()
+        telemetry.observe("labsnap_service_queue_wait_seconds", job.started_at - job.submitted_at)
+        pages: Iterator[Page] = iter_pages(job.data)
+        texts = []
+        try:
+            while True:
+                # Rasterizing and preprocessing are CPU work, kept off the event loop
+                page = await loop.run_in_executor(self._render_pool, next, pages, None)
+                if page is None:
+                    break
+                image = await loop.run_in_executor(self._cpu_pool, preprocess_for, page.image, f"ollama:{job.model}")
+                if self.layout is not None:
+                    regions = await loop.run_in_executor(self._cpu_pool, split_regions, image, self.layout)
+                    strips = await asyncio.gather(
+                        *(self._recognize(region, job.model, job.prompt, job.priority) for region in regions)
+                    )
+                    text = stitch_texts(list(strips))
+                else:
+                    text = await self._recognize(image, job.model, job.prompt, job.priority)
+                job.pages = page.number
+                texts.append(text)
+                job.values.extend({"Page": page.number, **value} for value in extract_values(text))
+        finally:
+            # Closing the document is PyMuPDF work too, even when the job failed halfway
+            await loop.run_in_executor(self._render_pool, pages.close)
+        job.text = "\n\n".join(texts)
+
+    async def _recognize(self, image: Image.Image, model: str, prompt: str, priority: int) -> str:
+        # Same key as the Streamlit streaming path: same model request, same answer.
+        # Hashing and SQLite block, so they run in the pool rather than on the event loop
+        loop = asyncio.get_running_loop()
+        cache_key = None
+        if self.cache is not None:
+            cache_key = await loop.run_in_executor(
+                self._cpu_pool, self.cache.make_key, image, model, prompt, "markdown-stream"
+            )
+            cached = await loop.run_in_executor(self._cpu_pool, self.cache.get, cache_key)
+            if cached is not None:
+                return cached
+        text = await self._client.analyze_image(image, prompt, model=model, priority=priority)
+        if cache_key is not None:
+            await loop.run_in_executor(self._cpu_pool, self.cache.put, cache_key, text)
+        return text
+
+    def stats(self) -> dict:
+        statuses = {}
+        for job in self.jobs.values():
+            statuses[job.status] = statuses.get(job.status, 0) + 1
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "jobs": statuses,
+            "scheduler": get_scheduler(self.ollama_url).stats(),
+            **self.counters
+        }
+
+    def create_app(self) -> web.Application:
+        """Build the aiohttp application serving this service."""
+        app = web.Application(client_max_size=MAX_UPLOAD_BYTES)
+        app["service"] = self
+        app.on_startup.append(self.start)
+        app.on_cleanup.append(self.stop)
+        app.router.add_post("/extract", _extract)
+        app.router.add_get("/jobs/{job_id}", _get_job)
+        app.router.add_get("/health", _health)
+        app.router.add_get("/metrics", _metrics)
+        return app
+
+
+async def _read_upload(request: web.Request) -> tuple[bytes, dict]:
+    # Either a multipart form with a "file" field, or the raw file as the request body
+    if request.content_type.startswith("multipart/"):
+        form = await request.post()
+        upload = form.get("file")
+        if upload is None or not hasattr(upload, "file"):
+            raise web.HTTPBadRequest(text="multipart body needs a 'file' field")
+        return upload.file.read(), {key: value for key, value in form.items() if isinstance(value, str)}
+    return await request.read(), dict(request.query)
+
+
+async def _extract(request: web.Request) -> web.Response:
+    service: ExtractionService = request.app["service"]
+    data, params = await _read_upload(request)
+    if not data:
+        raise web.HTTPBadRequest(text="empty upload")
+    if not data.startswith(b"%PDF-"):
+        try:
+            Image.open(io.BytesIO(data))
+        except Exception:
+            raise web.HTTPUnsupportedMediaType(text="expected an image, PDF or TIFF") from None
+    try:
+        priority = parse_priority(params.get("priority") or PRIORITY_NAMES[INTERACTIVE])
+    except ValueError as e:
+        raise web.HTTPBadRequest(text=str(e)) from None
+    try:
+        job, created = service.submit(data, params.get("model"), params.get("prompt"), priority)
+    except QueueFull as e:
+        return web.json_response({"error": str(e)}, status=429, headers={"Retry-After": "5"})
+    return web.json_response(
+        {"id": job.id, "status": job.status},
+        status=202 if created else 200,
+        headers={"Location": f"/jobs/{job.id}"}
+    )
+
+
+async def _get_job(request: web.Request) -> web.Response:
+    service: ExtractionService = request.app["service"]
+    job = service.jobs.get(request.match_info["job_id"])
+    if job is None:
+        raise web.HTTPNotFound(text="unknown job")
+    # ?wait=N long-polls up to N seconds for the job to finish
+    try:
+        wait = min(float(request.query.get("wait", 0) or 0), 60.0)
+    except ValueError:
+        raise web.HTTPBadRequest(text="wait must be a number of seconds") from None
+    if wait > 0 and not job.finished:
+        try:
+            await asyncio.wait_for(job.done.wait(), timeout=wait)
+        except asyncio.TimeoutError:
+            pass
+    return web.json_response(job.as_dict())
+
+
+async def _health(request: web.Request) -> web.Response:
+    return web.json_response(request.app["service"].stats())
+
+
+async def _metrics(request: web.Request) -> web.Response:
+    service: ExtractionService = request.app["service"]
+    stats = service.stats()
+    # Queue state is read at scrape time, the rest comes from the pipeline spans
+    gauges = [
+        "# TYPE labsnap_service_queued_jobs gauge",
+        f"labsnap_service_queued_jobs {stats['queued']}",
+        "# TYPE labsnap_service_jobs_total counter",
+        *(f'labsnap_service_jobs_total{{outcome="{key}"}} {stats[key]}'
+          for key in ("submitted", "deduplicated", "rejected", "done", "error"))
+    ]
+    return web.Response(text=telemetry.render_prometheus() + "\n".join(gauges) + "\n", content_type="text/plain")
+
+
+class ServiceBusy(Exception):
+    """Raised by ExtractionClient when the service keeps answering 429."""
+
+
+class ExtractionClient:
+    """
+    Small synchronous client for the extraction service, used by the Streamlit app.
+
+    Args:
+        base_url: Service address
+        timeout: Seconds allowed for a single HTTP request
+    """
+
+    def __init__(self, base_url: str = f"http://127.0.0.1:{DEFAULT_PORT}", timeout: float = 30.0):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self._session = requests.Session()
+
+    def is_available(self) -> bool:
+        try:
+            return self._session.get(f"{self.base_url}/health", timeout=2).ok
+        except requests.exceptions.RequestException:
+            return False
+
+    def submit(
+            self,
+            data: bytes,
+            model: Optional[str] = None,
+            prompt: Optional[str] = None,
+            retries: int = 3,
+            priority: Optional[str] = None
+    ) -> dict:
+        """
+        Submit a file and return the job as {"id", "status"}.
+
+        Args:
+            priority: "interactive" (the service default) or "batch"
+
+        Raises:
+            ServiceBusy: If the queue is still full after retries attempts
+        """
+        form = {key: value for key, value in (("model", model), ("prompt", prompt), ("priority", priority)) if value}
+        for attempt in range(retries + 1):
+            response = self._session.post(
+                f"{self.base_url}/extract", files={"file": ("upload", data)}, data=form, timeout=self.timeout
+            )
+            if response.status_code != 429:
+                response.raise_for_status()
+                return response.json()
+            if attempt < retries:
+                time.sleep(float(response.headers.get("Retry-After", 1)))
+        raise ServiceBusy(response.json().get("error", "queue full"))
+
+    def job(self, job_id: str, wait: float = 0.0) -> dict:
+        """Fetch a job, long-polling up to wait seconds for it to finish."""
+        response = self._session.get(
+            f"{self.base_url}/jobs/{job_id}", params={"wait": wait}, timeout=self.timeout + wait
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def extract(self, data: bytes, model: Optional[str] = None, prompt: Optional[str] = None, poll: float = 10.0) -> dict:
+        """Submit a file and block until its job has finished."""
+        job = self.submit(data, model, prompt)
+        while job["status"] not in ("done", "error"):
+            job = self.job(job["id"], wait=poll)
+        return job
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local HTTP service extracting lab values from report images.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=2,
+                        help="Jobs in progress at once; the scheduler picks which of their Ollama requests run")
+    parser.add_argument("--queue-size", type=int, default=16, help="Queued jobs before answering 429")
+    parser.add_argument("--ollama-url", default="http://localhost:11434")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="Model used when a request does not name one")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="Result cache for Ollama output")
+    parser.add_argument("--no-cache", action="store_true", help="Always call the model")
+    parser.add_argument("--near-duplicates", action="store_true",
+                        help="Reuse cached results for re-photographed or re-compressed copies of a page")
+    parser.add_argument("--tile", action="store_true", help="Crop pages and send tall ones as overlapping strips")
+    parser.add_argument("--no-tracing", action="store_true", help="Disable stage timings on /metrics")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    telemetry.enable(not args.no_tracing)
+
+    service = ExtractionService(
+        args.ollama_url,
+        workers=args.workers,
+        queue_size=args.queue_size,
+        cache=None if args.no_cache else ResultCache(args.cache, near_duplicates=args.near_duplicates),
+        default_model=args.model,
+        layout=DEFAULT_LAYOUT if args.tile else None
+    )
+    web.run_app(service.create_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
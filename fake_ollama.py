@@ -0,0 +1,223 @@
+#in terminal: python fake_ollama.py --port 11435
+
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+from typing import Optional
+
+from aiohttp import web
+
+DEFAULT_RESPONSE = """| Test | Value | Unit |
+|------|-------|------|
+| Hemoglobin | 13.5 | g/dL |
+| WBC | 6.2 | 10^3/µL |
+| Platelets | 250 | 10^3/µL |
+| MCV | 88 | fL |
+"""
+
+
+def _tokenize(text: str) -> list[str]:
+    # Split on spaces but keep them, so joined tokens reproduce the text exactly
+    tokens, current = [], ""
+    for char in text:
+        current += char
+        if char in " \n":
+            tokens.append(current)
+            current = ""
+    if current:
+        tokens.append(current)
+    return tokens
+
+
+def create_app(
+        response_text: str = DEFAULT_RESPONSE,
+        token_delay: float = 0.01,
+        fail_first: int = 0,
+        models: tuple = ("gemma3:4b", "llama3.2-vision:11b"),
+        model_delays: Optional[dict[str, float]] = None,
+        model_responses: Optional[dict[str, str]] = None,
+        load_seconds: float = 0.0,
+        max_loaded_models: Optional[int] = None,
+        num_parallel: Optional[int] = None,
+        parallel_slowdown: float = 0.0,
+        malformed_after: Optional[int] = None
+) -> web.Application:
+    """
+    Build a fake Ollama server that answers /api/generate and /api/tags.
+
+    Args:
+        response_text: Text returned for every generation
+        token_delay: Seconds to wait between streamed tokens
+        fail_first: Number of initial /api/generate requests answered with HTTP 503
+        models: Model names listed by /api/tags
+        model_delays: Per-model token delay, to mimic models of different speed
+        model_responses: Per-model response text, to mimic models that disagree
+        load_seconds: Seconds it takes to load a model that is not in memory
+        max_loaded_models: Models kept in memory at once; like Ollama, a model is only unloaded once it is idle
+        num_parallel: Requests per model generated at once, further ones wait (OLLAMA_NUM_PARALLEL)
+        parallel_slowdown: Extra token delay per additional request running on the same model
+        malformed_after: Streamed tokens after which a line that is not JSON is sent, as from a broken proxy
+
+    The app keeps request counters in app["stats"]; "cancelled" counts
+    streams the client closed before they finished and "loads" counts
+    model loads.
+    """
+    app = web.Application()
+    app["stats"] = {
+        "requests": 0, "failed": 0, "in_flight": 0, "max_in_flight": 0, "bytes_received": 0, "cancelled": 0,
+        "loads": 0
+    }
+    model_delays = model_delays or {}
+    model_responses = model_responses or {}
+    # Model -> requests using it, and an event set once it has finished loading
+    resident: dict[str, int] = {}
+    ready: dict[str, asyncio.Event] = {}
+    memory = asyncio.Condition()
+    running: dict[str, int] = {}
+    parallel: dict[str, asyncio.Semaphore] = {}
+
+    pending: deque = deque()
+
+    async def load(model: str) -> asyncio.Event:
+        """
+        Take a reference on model, making room for it; returns the event set once it is loaded.
+
+        Like Ollama's scheduler, requests are placed strictly in arrival order:
+        one waiting for another model to be unloaded holds up those behind it,
+        even when they are for the loaded model.
+        """
+        ticket = object()
+        async with memory:
+            pending.append(ticket)
+            try:
+                while True:
+                    if pending[0] is ticket:
+                        if model in resident:
+                            break
+                        idle = [name for name, users in resident.items() if not users]
+                        if max_loaded_models is None or len(resident) < max_loaded_models or idle:
+                            if max_loaded_models is not None and len(resident) >= max_loaded_models:
+                                del resident[idle[0]]
+                            resident[model] = 0
+                            ready[model] = event = asyncio.Event()
+                            app["stats"]["loads"] += 1
+                            asyncio.get_running_loop().call_later(load_seconds, event.set)
+                            break
+                    await memory.wait()
+            finally:
+                pending.remove(ticket)
+                memory.notify_all()
+            resident[model] += 1
+            return ready[model]
+
+    async def unload(model: str) -> None:
+        async with memory:
+            resident[model] -= 1
+            memory.notify_all()
+
+    def slowed(delay: float, model: str) -> float:
+        return delay * (1 + parallel_slowdown * (running[model] - 1))
+
+    async def generate(request: web.Request) -> web.StreamResponse:
+        stats = request.app["stats"]
+        body = await request.read()
+        stats["requests"] += 1
+        stats["bytes_received"] += len(body)
+        if stats["failed"] < fail_first:
+            stats["failed"] += 1
+            return web.json_response({"error": "model is loading"}, status=503)
+
+        payload = json.loads(body)
+        model = payload.get("model", "")
+        stats["in_flight"] += 1
+        stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+        delay = model_delays.get(model, token_delay)
+        text = model_responses.get(model, response_text)
+        loaded, semaphore, is_running = None, None, False
+        try:
+            loaded = await load(model)
+            await loaded.wait()
+            if num_parallel:
+                await parallel.setdefault(model, asyncio.Semaphore(num_parallel)).acquire()
+                semaphore = parallel[model]
+            running[model] = running.get(model, 0) + 1
+            is_running = True
+            started = time.perf_counter()
+            # Like Ollama, a request without a prompt only loads the model
+            if not payload.get("prompt"):
+                return web.json_response({"model": model, "response": "", "done": True, "done_reason": "load"})
+            if not payload.get("stream", True):
+                await asyncio.sleep(slowed(delay, model) * len(_tokenize(text)))
+                return web.json_response({"model": model, "response": text, "done": True})
+
+            response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+            await response.prepare(request)
+            try:
+                for index, token in enumerate(_tokenize(text)):
+                    if index == malformed_after:
+                        await response.write(b'{"model": "' + model.encode() + b'", "resp\n')
+                    await asyncio.sleep(slowed(delay, model))
+                    line = {"model": model, "response": token, "done": False}
+                    await response.write(json.dumps(line).encode() + b"\n")
+            except ConnectionResetError:
+                # The client went away mid-stream, which is how Ollama sees a cancelled request
+                stats["cancelled"] += 1
+                return response
+            except asyncio.CancelledError:
+                stats["cancelled"] += 1
+                raise
+            done = {
+                "model": model,
+                "response": "",
+                "done": True,
+                "total_duration": int((time.perf_counter() - started) * 1e9)
+            }
+            await response.write(json.dumps(done).encode() + b"\n")
+            await response.write_eof()
+            return response
+        finally:
+            stats["in_flight"] -= 1
+            if is_running:
+                running[model] -= 1
+            if semaphore is not None:
+                semaphore.release()
+            if loaded is not None:
+                await unload(model)
+
+    async def tags(request: web.Request) -> web.Response:
+        return web.json_response({"models": [{"name": name} for name in models]})
+
+    app.router.add_post("/api/generate", generate)
+    app.router.add_get("/api/tags", tags)
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fake Ollama server for local testing.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--fail-first", type=int, default=0)
+    parser.add_argument("--load-seconds", type=float, default=0.0, help="Time to load a model that is not in memory")
+    parser.add_argument("--max-loaded-models", type=int, help="Models kept in memory at once")
+    parser.add_argument("--num-parallel", type=int, help="Requests per model generated at once")
+    parser.add_argument("--parallel-slowdown", type=float, default=0.0,
+                        help="Extra token delay per additional request running on a model")
+    parser.add_argument("--malformed-after", type=int, help="Send a line that is not JSON after this many tokens")
+    args = parser.parse_args()
+    app = create_app(
+        token_delay=args.token_delay,
+        fail_first=args.fail_first,
+        load_seconds=args.load_seconds,
+        max_loaded_models=args.max_loaded_models,
+        num_parallel=args.num_parallel,
+        parallel_slowdown=args.parallel_slowdown,
+        malformed_after=args.malformed_after
+    )
+    web.run_app(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
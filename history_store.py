@@ -0,0 +1,394 @@
+import contextlib
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, Optional, Sequence, Union
+
+try:
+    import fcntl
+except ImportError:  # Windows: merges are only guarded by the missing-file check
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pyarrow.fs import LocalFileSystem
+
+import telemetry
+from normalization import get_conversion_table, match_test, normalize_frame, to_numbers
+
+DEFAULT_HISTORY_DIR = "history"
+
+SCHEMA = pa.schema([
+    ("ts", pa.timestamp("ms", tz="UTC")),
+    ("patient", pa.string()),
+    ("code", pa.string()),
+    ("test", pa.string()),
+    ("value", pa.float64()),
+    ("unit", pa.string()),
+    ("norm_value", pa.float64()),
+    ("norm_unit", pa.string()),
+    ("reference", pa.string()),
+    ("flag", pa.string()),
+    ("model", pa.string()),
+    ("image_hash", pa.string()),
+    ("source", pa.string()),
+])
+
+PARTITIONING = ds.partitioning(pa.schema([("month", pa.string())]), flavor="hive")
+DATASET_SCHEMA = SCHEMA.append(pa.field("month", pa.string()))
+
+# Rows are sorted by (patient, code, ts) inside each file, so with row groups this
+# small a query for one patient reads about one row group per file
+ROW_GROUP_ROWS = 4 * 1024
+
+SORT_KEYS = [("patient", "ascending"), ("code", "ascending"), ("ts", "ascending")]
+
+TimeLike = Union[str, datetime, pd.Timestamp]
+
+# Extraction table column -> store column, for per-row metadata supplied in the table itself
+_ROW_COLUMNS = {"Timestamp": "ts", "Patient": "patient", "Model": "model", "ImageHash": "image_hash",
+                "File": "source", "Source": "source"}
+
+
+def _timestamp(value: Optional[TimeLike]) -> pd.Timestamp:
+    ts = pd.Timestamp(value if value is not None else datetime.now(timezone.utc))
+    return ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+
+
+def _month(ts: pd.Timestamp) -> str:
+    return ts.strftime("%Y-%m")
+
+
+class HistoryStore:
+    """
+    Append-only history of extracted lab values, as Parquet files partitioned by month.
+
+    Every append writes new files (one per month it touches) and never rewrites
+    existing ones, so appends are cheap and safe from several processes. Rows
+    of a report already stored in the same month (same patient, image hash and
+    model) are skipped, so analyzing an image again does not count it twice.
+    Queries go through a pyarrow dataset: the month directories prune by date,
+    and the per-row-group min/max statistics of the patient column skip
+    everything else, while files are read memory-mapped. Every file costs a
+    few milliseconds per query, so once a month has more than max_files
+    files the append merges them into one sorted file (see compact()).
+
+    Args:
+        root: Directory of the store, created on first append
+        max_files: Files a month may have before appends compact it, None never does
+    """
+
+    def __init__(self, root: str = DEFAULT_HISTORY_DIR, max_files: Optional[int] = 16):
+        self.root = root
+        self.max_files = max_files
+        self._fs = LocalFileSystem(use_mmap=True)
+        # Reused while the files are unchanged, so their footers and statistics are read once
+        self._cached: tuple[tuple[str, ...], Optional[ds.Dataset]] = ((), None)
+
+    def append(
+            self,
+            values: Union[pd.DataFrame, Sequence[dict]],
+            model: str = "",
+            image_hash: str = "",
+            patient: str = "",
+            source: str = "",
+            timestamp: Optional[TimeLike] = None
+    ) -> int:
+        """
+        Store extracted values together with where they came from.
+
+        Args:
+            values: Rows as returned by extract_values, or a DataFrame of them.
+                Timestamp, Patient, Model, ImageHash and File/Source columns,
+                when present, override the arguments per row
+            model: Model or backend that produced the values
+            image_hash: Digest of the source image (result_cache.image_digest)
+            patient: Optional patient identifier
+            source: File name or other origin
+            timestamp: When the report was taken, defaults to now
+
+        Returns:
+            int: Rows written, without those of reports already stored
+        """
+        df = values if isinstance(values, pd.DataFrame) else pd.DataFrame(list(values))
+        if df.empty:
+            return 0
+        with telemetry.span("history_append", rows=len(df)) as s:
+            table, months = self._drop_stored(*self._to_table(df, model, image_hash, patient, source, timestamp))
+            s.set("written", table.num_rows)
+            if not table.num_rows:
+                return 0
+            # Rows arrive sorted by month, so every month is a zero-copy slice
+            bounds = np.flatnonzero(np.diff(months)) + 1
+            touched = []
+            for first, last in zip(np.r_[0, bounds], np.r_[bounds, len(months)]):
+                month = f"{months[first] // 12:04d}-{months[first] % 12 + 1:02d}"
+                self._write(month, table.slice(first, last - first))
+                touched.append(month)
+        if self.max_files is not None:
+            for month in touched:
+                self._merge_small(month)
+        return table.num_rows
+
+    def _to_table(self, df, model, image_hash, patient, source, timestamp) -> tuple[pa.Table, np.ndarray]:
+        normalized = normalize_frame(df if "Reference" in df else df.assign(Reference=""))
+        defaults = {"ts": _timestamp(timestamp), "patient": patient, "model": model,
+                    "image_hash": image_hash, "source": source}
+        columns = {}
+        for column, target in _ROW_COLUMNS.items():
+            if column in df and target not in columns:
+                columns[target] = df[column]
+        for target, default in defaults.items():
+            if target not in columns:
+                columns[target] = pd.Series([default] * len(df), index=df.index)
+        frame = pd.DataFrame({
+            # Stored in milliseconds; a default of now has microseconds, which Arrow refuses to drop silently
+            "ts": pd.to_datetime(columns["ts"], utc=True).dt.floor("ms"),
+            "patient": columns["patient"].astype(str),
+            "code": normalized["Code"].astype(str),
+            "test": df["Test"].astype(str),
+            "value": to_numbers(df["Value"]),
+            "unit": df["Unit"].astype(str) if "Unit" in df else "",
+            "norm_value": normalized["NormValue"],
+            "norm_unit": normalized["NormUnit"].astype(str),
+            "reference": normalized["Reference"].astype(str),
+            "flag": df["Flag"].astype(str) if "Flag" in df else "",
+            "model": columns["model"].astype(str),
+            "image_hash": columns["image_hash"].astype(str),
+            "source": columns["source"].astype(str),
+        })
+        # One sort on integer keys: month, then patient, code and time within the month
+        months = (frame["ts"].dt.year * 12 + frame["ts"].dt.month - 1).to_numpy()
+        codes = pd.factorize(frame["code"], sort=True)[0]
+        patients = pd.factorize(frame["patient"], sort=True)[0]
+        order = np.lexsort((frame["ts"].astype("int64").to_numpy(), codes, patients, months))
+        table = pa.Table.from_pandas(frame.iloc[order], schema=SCHEMA, preserve_index=False)
+        return table, months[order]
+
+    def _drop_stored(self, table: pa.Table, months: np.ndarray) -> tuple[pa.Table, np.ndarray]:
+        """Leave out rows whose patient, image hash and model are already stored in their month."""
+        keys = ["patient", "image_hash", "model"]
+        hashes = [h for h in pc.unique(table["image_hash"]).to_pylist() if h]
+        dataset = self._dataset()
+        # Rows without an image hash cannot be told apart from a new report, so they are always kept
+        if not hashes or dataset is None:
+            return table, months
+        touched = [f"{month // 12:04d}-{month % 12 + 1:02d}" for month in np.unique(months)]
+        # Only the months written to are read, and within them the patient filter skips
+        # row groups by their statistics, as in a per-patient query
+        stored = dataset.to_table(columns=keys, filter=(
+            ds.field("month").isin(touched)
+            & ds.field("patient").isin(pc.unique(table["patient"]))
+            & ds.field("image_hash").isin(hashes)
+        ))
+        if not stored.num_rows:
+            return table, months
+        seen = pd.MultiIndex.from_arrays([stored[key].to_numpy(zero_copy_only=False) for key in keys])
+        new = pd.MultiIndex.from_arrays([table[key].to_numpy(zero_copy_only=False) for key in keys])
+        keep = ~new.isin(seen)
+        return table.filter(pa.array(keep)), months[keep]
+
+    def _write(self, month: str, table: pa.Table, name: Optional[str] = None) -> str:
+        directory = os.path.join(self.root, f"month={month}")
+        os.makedirs(directory, exist_ok=True)
+        name = name or f"part-{time.time_ns()}-{uuid.uuid4().hex[:8]}.parquet"
+        path = os.path.join(directory, name)
+        # Written under a dot-name, which dataset discovery ignores, then renamed into place
+        tmp = os.path.join(directory, f".{name}.tmp")
+        pq.write_table(table, tmp, compression="zstd", row_group_size=ROW_GROUP_ROWS)
+        os.replace(tmp, path)
+        return path
+
+    def _dataset(self) -> Optional[ds.Dataset]:
+        paths = tuple(path for month_paths in self._files().values() for path in month_paths)
+        if not paths:
+            return None
+        if paths != self._cached[0]:
+            dataset = ds.dataset(list(paths), schema=DATASET_SCHEMA, format="parquet", filesystem=self._fs,
+                                 partitioning=PARTITIONING, partition_base_dir=os.path.abspath(self.root))
+            self._cached = (paths, dataset)
+        return self._cached[1]
+
+    def _files(self) -> dict[str, list[str]]:
+        files: dict[str, list[str]] = {}
+        if not os.path.isdir(self.root):
+            return files
+        for entry in sorted(os.listdir(self.root)):
+            if not entry.startswith("month="):
+                continue
+            directory = os.path.join(self.root, entry)
+            files[entry[len("month="):]] = sorted(
+                os.path.abspath(os.path.join(directory, name)) for name in os.listdir(directory)
+                if name.endswith(".parquet") and not name.startswith(".")
+            )
+        return files
+
+    def compact(self, min_files: int = 2, months: Optional[Iterable[str]] = None) -> int:
+        """
+        Merge the files of every month with at least min_files into one file sorted by patient, code and time.
+
+        Only the files listed when a month is compacted are replaced, so appends
+        running at the same time are kept. Merges of a month are serialized by a
+        lock file, and a merge whose files another process already merged is
+        skipped. Readers may briefly see a month's rows twice, between the new
+        file appearing and the old ones being removed.
+
+        Args:
+            min_files: Months with fewer files are left alone
+            months: Only these months ("YYYY-MM"), defaults to all
+
+        Returns:
+            int: Files removed
+        """
+        removed = 0
+        wanted = None if months is None else set(months)
+        for month, paths in self._files().items():
+            if len(paths) < min_files or (wanted is not None and month not in wanted):
+                continue
+            if self._merge(month, paths):
+                removed += len(paths) - 1
+        return removed
+
+    @contextlib.contextmanager
+    def _month_lock(self, month: str) -> Iterator[None]:
+        # A dot-name, so neither _files() nor dataset discovery pick it up
+        directory = os.path.join(self.root, f"month={month}")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, ".compact.lock"), "a") as handle:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _merge(self, month: str, paths: list[str]) -> bool:
+        """Replace paths with one sorted file; False if another process merged any of them first."""
+        with self._month_lock(month), telemetry.span("history_compact", files=len(paths)):
+            # Merging what is left would write rows of the removed files a second time
+            if not all(os.path.exists(path) for path in paths):
+                return False
+            try:
+                table = pa.concat_tables(pq.read_table(path, schema=SCHEMA) for path in paths)
+            except FileNotFoundError:
+                # Only without flock (Windows): a concurrent merge removed a file after the check
+                return False
+            self._write(month, table.sort_by(SORT_KEYS), f"compacted-{time.time_ns()}.parquet")
+            for path in paths:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(path)
+        return True
+
+    def _merge_small(self, month: str) -> None:
+        # Size-tiered: only the smallest files are merged, down to half of max_files,
+        # so a large compacted file is not rewritten for every few small appends
+        paths = self._files().get(month, [])
+        if len(paths) <= self.max_files:
+            return
+        paths.sort(key=os.path.getsize)
+        self._merge(month, paths[:len(paths) - self.max_files // 2 + 1])
+
+    def _filter(
+            self,
+            tests: Optional[Iterable[str]],
+            patient: Optional[str],
+            start: Optional[TimeLike],
+            end: Optional[TimeLike]
+    ) -> Optional[ds.Expression]:
+        conditions = []
+        if tests is not None:
+            codes = get_conversion_table().code_index
+            wanted = {test if test in codes else (match_test(test) or test) for test in tests}
+            conditions.append(ds.field("code").isin(sorted(wanted)))
+        if patient is not None:
+            conditions.append(ds.field("patient") == patient)
+        if start is not None:
+            start = _timestamp(start)
+            conditions += [ds.field("month") >= _month(start), ds.field("ts") >= pa.scalar(start, SCHEMA.field("ts").type)]
+        if end is not None:
+            end = _timestamp(end)
+            conditions += [ds.field("month") <= _month(end), ds.field("ts") <= pa.scalar(end, SCHEMA.field("ts").type)]
+        expression = None
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+        return expression
+
+    def query(
+            self,
+            tests: Optional[Iterable[str]] = None,
+            patient: Optional[str] = None,
+            start: Optional[TimeLike] = None,
+            end: Optional[TimeLike] = None,
+            columns: Optional[list[str]] = None
+    ) -> pd.DataFrame:
+        """
+        Read stored values, filtered in the scan rather than after loading.
+
+        Args:
+            tests: Canonical codes or test names in any supported language
+            patient: Only this patient's values
+            start: Earliest timestamp, inclusive
+            end: Latest timestamp, inclusive
+            columns: Columns to read, defaults to all
+
+        Returns:
+            pd.DataFrame: Matching rows ordered by time
+        """
+        columns = columns or SCHEMA.names
+        dataset = self._dataset()
+        if dataset is None:
+            return pd.DataFrame({name: pd.Series(dtype=SCHEMA.field(name).type.to_pandas_dtype()) for name in columns})
+        with telemetry.span("history_query") as s:
+            table = dataset.to_table(columns=columns, filter=self._filter(tests, patient, start, end))
+            if "ts" in columns:
+                table = table.sort_by("ts")
+            s.set("rows", table.num_rows)
+            return table.to_pandas()
+
+    def trend(
+            self,
+            test: str,
+            patient: Optional[str] = None,
+            start: Optional[TimeLike] = None,
+            end: Optional[TimeLike] = None
+    ) -> pd.DataFrame:
+        """
+        One test over time, in its canonical unit where it could be converted.
+
+        Returns:
+            pd.DataFrame: ts, value, unit and source, ordered by time
+        """
+        df = self.query([test], patient, start, end, ["ts", "value", "unit", "norm_value", "norm_unit", "source"])
+        converted = df["norm_value"].notna()
+        return pd.DataFrame({
+            "ts": df["ts"],
+            "value": df["norm_value"].where(converted, df["value"]),
+            "unit": df["norm_unit"].where(converted, df["unit"]),
+            "source": df["source"]
+        })
+
+    def tests(self, patient: Optional[str] = None) -> pd.Series:
+        """Stored values per canonical code (unknown tests are left out), most frequent first."""
+        df = self.query(patient=patient, columns=["code"])
+        return df.loc[df["code"] != "", "code"].value_counts()
+
+    def patients(self) -> list[str]:
+        """Patients with at least one stored value."""
+        df = self.query(columns=["patient"])
+        return sorted(p for p in df["patient"].unique() if p)
+
+    def stats(self) -> dict:
+        files = self._files()
+        paths = [path for month_paths in files.values() for path in month_paths]
+        return {
+            "months": len(files),
+            "files": len(paths),
+            "rows": sum(pq.ParquetFile(path).metadata.num_rows for path in paths),
+            "bytes": sum(os.path.getsize(path) for path in paths)
+        }
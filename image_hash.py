@@ -0,0 +1,243 @@
+import hashlib
+import os
+import threading
+from typing import Optional, Union
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# Near-duplicates are found by splitting the 64-bit pHash into CHUNKS pieces of
+# 16 bits and probing each piece's bucket with up to one flipped bit. By the
+# pigeonhole principle every hash within MAX_DISTANCE of the query shares one
+# piece with it up to a single bit, so the lookup is exact, not approximate.
+CHUNKS = 4
+CHUNK_BITS = 16
+MAX_DISTANCE = 2 * CHUNKS - 1
+
+# The pHash finds candidates and the dHash must agree as well, which cuts false
+# matches between unrelated pages. Neither hash sees a single changed number on
+# an otherwise identical report, which is why result reuse is opt-in.
+DEFAULT_PHASH_DISTANCE = 6
+DEFAULT_DHASH_DISTANCE = 10
+
+# Entries added since the last bucket rebuild are scanned linearly; past this
+# many the buckets are rebuilt (about 0.1 s per million entries)
+_MAX_TAIL = 4096
+
+
+def _gray(image: Union[Image.Image, np.ndarray]) -> np.ndarray:
+    if isinstance(image, Image.Image):
+        image = np.asarray(image.convert("L"))
+    elif image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    return image
+
+
+def _pack(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+
+
+def phash(image: Union[Image.Image, np.ndarray]) -> int:
+    """
+    64-bit perceptual hash: the signs of the lowest 8x8 DCT frequencies of a
+    32x32 thumbnail, compared with their median. Stable under re-compression,
+    rescaling and small brightness changes.
+    """
+    thumb = cv2.resize(_gray(image), (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(thumb)[:8, :8].ravel()
+    # The DC term only encodes overall brightness
+    return _pack(low > np.median(low[1:]))
+
+
+def dhash(image: Union[Image.Image, np.ndarray]) -> int:
+    """64-bit difference hash: whether each pixel of a 9x8 thumbnail is brighter than its right neighbour."""
+    thumb = cv2.resize(_gray(image), (9, 8), interpolation=cv2.INTER_AREA).astype(np.int16)
+    return _pack(thumb[:, 1:] > thumb[:, :-1])
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def context_id(*parts: str) -> int:
+    """32-bit id for the request parameters a result depends on (model, prompt, format)."""
+    digest = hashlib.sha256("\0".join(parts).encode()).digest()
+    return int.from_bytes(digest[:4], "big")
+
+
+def _flips() -> np.ndarray:
+    # XOR masks for a 16-bit piece: unchanged plus every single-bit flip
+    return np.array([0] + [1 << bit for bit in range(CHUNK_BITS)], dtype=np.int64)
+
+
+_FLIPS = _flips()
+
+# Bits set per byte, for numpy < 2.0 which has no bitwise_count
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _popcount(values: np.ndarray) -> np.ndarray:
+    """Bits set in each element of a uint64 array."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    return _POPCOUNT[np.ascontiguousarray(values).view(np.uint8)].reshape(len(values), 8).sum(axis=1, dtype=np.uint8)
+
+
+class HashIndex:
+    """
+    Array-backed index of perceptual hashes with Hamming-distance lookup.
+
+    Each entry is a pHash, a dHash, a 32-bit context (e.g. model and prompt,
+    so results are only shared between identical requests) and a 32-byte
+    reference to the stored result, kept in parallel numpy arrays:
+
+        hashes and context   8 + 8 + 4 bytes
+        result reference     32 bytes
+        bucket order         4 x 4 bytes (a uint32 position per 16-bit piece)
+        ------------------------------------
+        about 68 bytes per entry, plus 2 MiB of bucket offsets and up to
+        2x spare capacity while the arrays grow: 1M entries take 65-130 MiB,
+        10M entries 650 MiB-1.3 GiB.
+
+    The four pieces are bucketed with a counting sort (offset table + order
+    array). Lookups read 4 x 17 buckets, so for well spread hashes at 1M
+    entries about a thousand candidates are compared, plus the (at most
+    _MAX_TAIL) entries added since the buckets were last rebuilt.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self._phash = np.zeros(capacity, dtype=np.uint64)
+        self._dhash = np.zeros(capacity, dtype=np.uint64)
+        self._context = np.zeros(capacity, dtype=np.uint32)
+        self._refs = np.zeros((capacity, 32), dtype=np.uint8)
+        self._size = 0
+        self._indexed = 0
+        self._offsets: Optional[np.ndarray] = None
+        self._order: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the arrays, including spare capacity."""
+        arrays = [self._phash, self._dhash, self._context, self._refs, self._offsets, self._order]
+        return sum(a.nbytes for a in arrays if a is not None)
+
+    def _grow(self, needed: int) -> None:
+        capacity = len(self._phash)
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2)
+        for name in ("_phash", "_dhash", "_context", "_refs"):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    def add(self, p: int, d: int, context: int, ref: bytes) -> None:
+        """Add one entry; ref is the 32-byte key of the stored result."""
+        self.add_many(
+            np.array([p], dtype=np.uint64), np.array([d], dtype=np.uint64),
+            np.array([context], dtype=np.uint32), np.frombuffer(ref, dtype=np.uint8).reshape(1, 32)
+        )
+
+    def add_many(self, phashes: np.ndarray, dhashes: np.ndarray, contexts: np.ndarray, refs: np.ndarray) -> None:
+        """Bulk insert; refs is an (n, 32) uint8 array."""
+        with self._lock:
+            n = len(phashes)
+            self._grow(self._size + n)
+            end = self._size + n
+            self._phash[self._size:end] = phashes
+            self._dhash[self._size:end] = dhashes
+            self._context[self._size:end] = contexts
+            self._refs[self._size:end] = refs
+            self._size = end
+            if self._size - self._indexed > _MAX_TAIL:
+                self._rebuild()
+
+    def _pieces(self, hashes: np.ndarray) -> np.ndarray:
+        shifts = np.arange(CHUNKS, dtype=np.uint64) * np.uint64(CHUNK_BITS)
+        return ((hashes[:, None] >> shifts) & np.uint64(0xFFFF)).astype(np.uint16)
+
+    def _rebuild(self) -> None:
+        # One flat order array for all pieces; offsets point into it, so a
+        # lookup can gather every probed bucket in a single indexing step
+        n = self._size
+        pieces = self._pieces(self._phash[:n])
+        offsets = np.zeros((CHUNKS, (1 << CHUNK_BITS) + 1), dtype=np.int64)
+        order = np.empty(CHUNKS * n, dtype=np.uint32)
+        for c in range(CHUNKS):
+            # Stable sort of 16-bit keys is a radix sort in numpy
+            order[c * n:(c + 1) * n] = np.argsort(pieces[:, c], kind="stable")
+            np.cumsum(np.bincount(pieces[:, c], minlength=1 << CHUNK_BITS), out=offsets[c, 1:])
+            offsets[c] += c * n
+        self._offsets, self._order, self._indexed = offsets, order, n
+
+    def _candidates(self, p: int) -> np.ndarray:
+        tail = np.arange(self._indexed, self._size, dtype=np.int64)
+        if not self._indexed:
+            return tail
+        probes = self._pieces(np.array([p], dtype=np.uint64))[0].astype(np.int64)[:, None] ^ _FLIPS
+        rows = np.arange(CHUNKS)[:, None]
+        starts = self._offsets[rows, probes].ravel()
+        lengths = self._offsets[rows, probes + 1].ravel() - starts
+        # Positions of every probed bucket's entries, concatenated
+        positions = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(lengths.sum())
+        # An entry can turn up in several buckets; comparing it twice is cheaper than deduplicating
+        return np.concatenate((self._order[positions].astype(np.int64), tail))
+
+    def search(
+            self,
+            p: int,
+            d: int,
+            context: int = 0,
+            max_distance: int = DEFAULT_PHASH_DISTANCE,
+            max_dhash_distance: int = DEFAULT_DHASH_DISTANCE
+    ) -> Optional[tuple[bytes, int]]:
+        """
+        Closest entry in the same context within both distances.
+
+        Returns:
+            (ref, pHash distance), or None when there is no near-duplicate
+        """
+        if max_distance > MAX_DISTANCE:
+            raise ValueError(f"max_distance must be at most {MAX_DISTANCE}")
+        with self._lock:
+            candidates = self._candidates(p)
+            if len(candidates) == 0:
+                return None
+            candidates = candidates[self._context[candidates] == context]
+            p_dist = _popcount(self._phash[candidates] ^ np.uint64(p))
+            d_dist = _popcount(self._dhash[candidates] ^ np.uint64(d))
+            ok = (p_dist <= max_distance) & (d_dist <= max_dhash_distance)
+            if not ok.any():
+                return None
+            # Prefer the closest match, and among equals the most recent entry
+            hits = np.flatnonzero(ok)
+            best = hits[np.lexsort((-candidates[hits], p_dist[hits].astype(np.int64) + d_dist[hits]))[0]]
+            return self._refs[candidates[best]].tobytes(), int(p_dist[best])
+
+    def save(self, path: str) -> None:
+        """Write the entries to an .npz file; buckets are rebuilt on load."""
+        # A temporary name per process and thread, renamed under the lock, so concurrent saves never mix
+        tmp = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp.npz"
+        with self._lock:
+            n = self._size
+            np.savez(tmp, phash=self._phash[:n], dhash=self._dhash[:n], context=self._context[:n], refs=self._refs[:n])
+            os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "HashIndex":
+        """Read an index written by save(); a missing file gives an empty index."""
+        if not os.path.exists(path):
+            return cls()
+        with np.load(path) as data:
+            index = cls(max(len(data["phash"]), 1024))
+            index.add_many(data["phash"], data["dhash"], data["context"], data["refs"])
+        if index._size > index._indexed:
+            with index._lock:
+                index._rebuild()
+        return index
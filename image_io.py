@@ -0,0 +1,94 @@
+import base64
+import io
+import os
+import tempfile
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from PIL import Image
+
+import telemetry
+
+MEMORY_PREFIX = "memory://"
+
+# Base64 payloads handed to path-based backends under a pseudo path
+_pending: dict[str, str] = {}
+_pending_lock = threading.Lock()
+
+
+def _as_bilevel(image: Image.Image) -> Image.Image:
+    # Binarized pages only use 0 and 255; as 1-bit PNG they encode faster and smaller, still lossless
+    if image.mode == "L":
+        colors = image.getcolors(2)
+        if colors is not None and all(color in (0, 255) for _, color in colors):
+            return image.convert("1", dither=Image.Dither.NONE)
+    return image
+
+
+def encode_image_bytes(image: Image.Image, lossless: bool = True) -> memoryview:
+    """
+    Encode an image for a model request without touching the disk.
+
+    Binarized pages are written as 1-bit PNG, other images as PNG unless
+    lossless=False, in which case photos and grayscale scans are sent as JPEG,
+    which is much cheaper to encode and smaller to transfer.
+
+    Returns:
+        memoryview: View over the encoded buffer, no extra copy
+    """
+    with telemetry.span("encode") as s:
+        buffered = io.BytesIO()
+        image = _as_bilevel(image)
+        if not lossless and image.mode in ("RGB", "L"):
+            image.save(buffered, format="JPEG", quality=90)
+        else:
+            image.save(buffered, format="PNG")
+        s.set("bytes", buffered.tell())
+    return buffered.getbuffer()
+
+
+def encode_image_b64(image: Image.Image, lossless: bool = True) -> str:
+    """Encode an image straight to the base64 string Ollama expects."""
+    return base64.b64encode(encode_image_bytes(image, lossless)).decode("ascii")
+
+
+@contextmanager
+def in_memory_path(image_b64: str) -> Iterator[str]:
+    """
+    Expose an encoded image under a pseudo path for backends that take a path.
+
+    The backend must resolve the path with resolve_encoded(); the entry is
+    removed when the context exits.
+    """
+    path = f"{MEMORY_PREFIX}{uuid.uuid4().hex}.png"
+    with _pending_lock:
+        _pending[path] = image_b64
+    try:
+        yield path
+    finally:
+        with _pending_lock:
+            _pending.pop(path, None)
+
+
+def resolve_encoded(path: str) -> Optional[str]:
+    """Return the base64 payload registered for a pseudo path, or None for real paths."""
+    if not path.startswith(MEMORY_PREFIX):
+        return None
+    with _pending_lock:
+        return _pending.get(path)
+
+
+@contextmanager
+def temporary_image_file(image: Image.Image) -> Iterator[str]:
+    """Write an image to a PNG temp file that is always deleted on exit, for backends that need a real file."""
+    fd, path = tempfile.mkstemp(suffix=".png")
+    try:
+        with telemetry.span("temp_file_write") as s, os.fdopen(fd, "wb") as tmp:
+            _as_bilevel(image).save(tmp, format="PNG")
+            s.set("bytes", tmp.tell())
+        yield path
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,198 @@
+import io
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import BinaryIO, Callable, Iterator, Optional, Union
+
+import pandas as pd
+from PIL import Image, ImageSequence
+
+import telemetry
+from extraction import extract_values
+from preprocessing import preprocess_image
+
+DocumentSource = Union[str, bytes, BinaryIO]
+
+DOCUMENT_EXTENSIONS = (".pdf", ".tif", ".tiff")
+DEFAULT_DPI = 200
+
+
+@dataclass
+class Page:
+    number: int
+    image: Image.Image
+
+
+@dataclass
+class PageResult:
+    number: int
+    text: str
+    values: list[dict] = field(default_factory=list)
+    seconds: float = 0.0
+    error: str = ""
+
+
+def _open_source(source: DocumentSource) -> tuple[Union[str, bytes], bool]:
+    """Return a path or bytes to open, and whether it is a PDF. Paths are not read into memory."""
+    if isinstance(source, str):
+        with open(source, "rb") as handle:
+            return source, is_pdf(handle.read(5))
+    data = source if isinstance(source, bytes) else source.read()
+    return data, is_pdf(data)
+
+
+def is_pdf(data: bytes) -> bool:
+    return data[:5] == b"%PDF-"
+
+
+def _open_pdf(source: Union[str, bytes]):
+    import pymupdf
+
+    if isinstance(source, str):
+        return pymupdf.open(source)
+    return pymupdf.open(stream=source, filetype="pdf")
+
+
+def _open_image(source: Union[str, bytes]) -> Image.Image:
+    return Image.open(source if isinstance(source, str) else io.BytesIO(source))
+
+
+def _iter_pdf_pages(source: Union[str, bytes], dpi: int) -> Iterator[Page]:
+    with _open_pdf(source) as doc:
+        for index in range(doc.page_count):
+            with telemetry.span("decode", page=index + 1, format="pdf"):
+                pix = doc[index].get_pixmap(dpi=dpi)
+                image = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+                # Record the render DPI so preprocessing knows not to upscale again
+                image.info["dpi"] = (dpi, dpi)
+                del pix
+            yield Page(index + 1, image)
+
+
+def _iter_image_frames(source: Union[str, bytes]) -> Iterator[Page]:
+    with _open_image(source) as container:
+        for index, frame in enumerate(ImageSequence.Iterator(container)):
+            with telemetry.span("decode", page=index + 1, format=container.format):
+                image = frame.copy()
+                image.info.setdefault("dpi", container.info.get("dpi"))
+            yield Page(index + 1, image)
+
+
+def iter_pages(source: DocumentSource, dpi: int = DEFAULT_DPI) -> Iterator[Page]:
+    """
+    Yield the pages of a PDF, multi-frame TIFF or single image, one at a time.
+
+    Pages are rasterized lazily, so only the page being consumed is held in
+    memory regardless of document length.
+
+    Args:
+        source: File path, raw bytes or a binary file object (e.g. a Streamlit upload)
+        dpi: Rasterization resolution for PDF pages
+    """
+    opened, pdf = _open_source(source)
+    if pdf:
+        yield from _iter_pdf_pages(opened, dpi)
+    else:
+        yield from _iter_image_frames(opened)
+
+
+def count_pages(source: DocumentSource) -> int:
+    """Number of pages without rasterizing any of them."""
+    opened, pdf = _open_source(source)
+    if pdf:
+        with _open_pdf(opened) as doc:
+            return doc.page_count
+    with _open_image(opened) as container:
+        return getattr(container, "n_frames", 1)
+
+
+def is_document(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() in DOCUMENT_EXTENSIONS
+
+
+def prefetch(iterator: Iterator, size: int = 1) -> Iterator:
+    """
+    Run an iterator in a background thread, at most size items ahead of the consumer.
+
+    Lets the next page rasterize while the current one is in OCR, without
+    letting memory grow beyond size + 1 pages.
+    """
+    if size <= 0:
+        yield from iterator
+        return
+
+    buffer: queue.Queue = queue.Queue(maxsize=size)
+    done = object()
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        # Gives up once the consumer has stopped, so the thread never blocks on a full buffer
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterator:
+                if not put(item):
+                    return
+            put(done)
+        except Exception as e:
+            put(e)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+def process_document(
+        source: DocumentSource,
+        recognize: Callable[[Image.Image], str],
+        dpi: int = DEFAULT_DPI,
+        lookahead: int = 1,
+        preprocess: Optional[Callable[[Image.Image], Image.Image]] = preprocess_image
+) -> Iterator[PageResult]:
+    """
+    Stream every page through preprocessing, OCR and extract_values.
+
+    Args:
+        source: Document path, bytes or file object
+        recognize: OCR function taking a preprocessed image and returning text
+        dpi: Rasterization resolution for PDF pages
+        lookahead: Pages rasterized ahead of the one being recognized
+        preprocess: Preprocessing function, None to send pages as rendered
+
+    Yields:
+        PageResult: One result per page, in page order. A failing page is
+        reported through its error field and does not stop the document.
+    """
+    for page in prefetch(iter_pages(source, dpi), lookahead):
+        start = time.perf_counter()
+        try:
+            image = preprocess(page.image) if preprocess else page.image
+            text = recognize(image)
+        except Exception as e:
+            yield PageResult(page.number, "", seconds=time.perf_counter() - start, error=f"{type(e).__name__}: {e}")
+            continue
+        yield PageResult(page.number, text, extract_values(text), time.perf_counter() - start)
+
+
+def merge_results(results: Iterator[PageResult]) -> pd.DataFrame:
+    """Combine page results into one DataFrame with a Page column."""
+    rows = [{"Page": result.number, **value} for result in results for value in result.values]
+    return pd.DataFrame(rows, columns=["Page", "Test", "Value", "Unit", "Reference", "Flag"])
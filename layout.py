@@ -0,0 +1,191 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Optional, Union
+
+import cv2
+import numpy as np
+from PIL import Image
+
+Box = tuple[int, int, int, int]
+
+
+@dataclass(frozen=True)
+class LayoutConfig:
+    """
+    Settings for cropping and tiling a page before it is sent to a vision model.
+
+    Attributes:
+        crop: Crop to the detected text blocks, dropping margins, logos and barcodes
+        margin: Padding in pixels kept around the cropped content
+        max_width: Wider content is downscaled to this width. Vision models resize
+            their input to roughly this size anyway, so extra pixels only cost time
+        strip_height: Content taller than this (after downscaling) is cut into strips
+        overlap: Rows shared by consecutive strips, so no text line is lost at a cut
+        workers: Strips recognized concurrently
+    """
+    crop: bool = True
+    margin: int = 16
+    max_width: int = 1120
+    strip_height: int = 1120
+    overlap: int = 96
+    workers: int = 2
+
+
+DEFAULT_LAYOUT = LayoutConfig()
+
+
+def _ink_mask(binary: np.ndarray) -> np.ndarray:
+    """Dark pixels as 255, with long table rulings removed so they do not join unrelated blocks."""
+    ink = cv2.threshold(binary, 127, 255, cv2.THRESH_BINARY_INV)[1]
+    h, w = ink.shape
+    horizontal = cv2.morphologyEx(ink, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (max(w // 20, 10), 1)))
+    vertical = cv2.morphologyEx(ink, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (1, max(h // 20, 10))))
+    return cv2.subtract(ink, cv2.bitwise_or(horizontal, vertical))
+
+
+def find_text_blocks(binary: np.ndarray) -> list[Box]:
+    """
+    Find the text blocks of a binarized page as (x, y, w, h) boxes.
+
+    Characters are joined into words and lines with a horizontal closing. Blocks
+    that are too small (specks), much taller than a text line and densely inked
+    (logos, QR codes, barcodes, photos) or stuck to the page border (scan edges)
+    are left out.
+    """
+    ink = _ink_mask(binary)
+    h, w = ink.shape
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(9, w // 120), 3))
+    blocks = cv2.morphologyEx(ink, cv2.MORPH_CLOSE, kernel)
+    contours, _ = cv2.findContours(blocks, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return []
+
+    boxes = np.array([cv2.boundingRect(c) for c in contours])
+    boxes = boxes[boxes[:, 2] * boxes[:, 3] >= max(24, h * w * 2e-5)]
+    if len(boxes) == 0:
+        return []
+    line_height = float(np.median(boxes[:, 3]))
+
+    kept = []
+    for x, y, bw, bh in boxes:
+        fill = cv2.countNonZero(ink[y:y + bh, x:x + bw]) / float(bw * bh)
+        if bh > 2.5 * line_height and fill > 0.35:
+            continue
+        touches_border = x <= 1 or y <= 1 or x + bw >= w - 1 or y + bh >= h - 1
+        if touches_border and min(bw, bh) < 0.6 * line_height:
+            continue
+        kept.append((int(x), int(y), int(bw), int(bh)))
+    return kept
+
+
+def find_content_region(binary: np.ndarray, margin: int = 16) -> Optional[Box]:
+    """Bounding box of all text blocks plus margin, or None when no text is found."""
+    blocks = find_text_blocks(binary)
+    if not blocks:
+        return None
+    boxes = np.array(blocks)
+    x0 = max(int(boxes[:, 0].min()) - margin, 0)
+    y0 = max(int(boxes[:, 1].min()) - margin, 0)
+    x1 = min(int((boxes[:, 0] + boxes[:, 2]).max()) + margin, binary.shape[1])
+    y1 = min(int((boxes[:, 1] + boxes[:, 3]).max()) + margin, binary.shape[0])
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def _cut_rows(gray: np.ndarray, strip_height: int, overlap: int) -> list[tuple[int, int]]:
+    # Cut where the fewest dark pixels are, within the last quarter of each strip,
+    # so cuts fall between text lines rather than through them
+    h = gray.shape[0]
+    ink_per_row = (gray < 128).sum(axis=1)
+    spans, start = [], 0
+    while start + strip_height < h:
+        search_from = start + strip_height * 3 // 4
+        end = search_from + int(np.argmin(ink_per_row[search_from:start + strip_height]))
+        spans.append((start, end))
+        start = max(end - overlap, start + 1)
+    spans.append((start, h))
+    return spans
+
+
+def split_regions(image: Union[Image.Image, np.ndarray], config: LayoutConfig = DEFAULT_LAYOUT) -> list[Image.Image]:
+    """
+    Crop a preprocessed page to its content, downscale it and cut it into strips.
+
+    Args:
+        image: Preprocessed (binarized or grayscale) page
+        config: Layout settings
+
+    Returns:
+        list[Image.Image]: Regions to recognize, top to bottom. A short page is a single region.
+    """
+    gray = np.asarray(image.convert("L")) if isinstance(image, Image.Image) else image
+    if config.crop:
+        region = find_content_region(gray, config.margin)
+        if region is not None:
+            x, y, rw, rh = region
+            gray = gray[y:y + rh, x:x + rw]
+
+    if gray.shape[1] > config.max_width:
+        bilevel = not np.any((gray != 0) & (gray != 255))
+        scale = config.max_width / gray.shape[1]
+        size = (config.max_width, max(1, int(round(gray.shape[0] * scale))))
+        gray = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+        if bilevel:
+            # Back to pure black and white so the strips still encode as 1-bit PNG;
+            # the high cut keeps thin strokes that were averaged to gray
+            gray = cv2.threshold(gray, 191, 255, cv2.THRESH_BINARY)[1]
+
+    return [
+        Image.fromarray(np.ascontiguousarray(gray[start:end]))
+        for start, end in _cut_rows(gray, config.strip_height, config.overlap)
+    ]
+
+
+def _normalize(line: str) -> str:
+    return " ".join(line.lower().split())
+
+
+def stitch_texts(texts: list[str], window: int = 8) -> str:
+    """
+    Join the text recognized for consecutive strips.
+
+    Lines at the start of a strip that already appeared near the end of the
+    previous one come from the overlap and are dropped, as are repeated table
+    headers and separator rows.
+    """
+    if not texts:
+        return ""
+    lines = texts[0].splitlines()
+    seen_headers = {_normalize(line) for line in lines[:3] if line.strip().startswith("|")}
+    for text in texts[1:]:
+        tail = {_normalize(line) for line in lines[-window:] if line.strip()}
+        new_lines = text.splitlines()
+        for i, line in enumerate(new_lines):
+            key = _normalize(line)
+            if i < window and key and (key in tail or key in seen_headers):
+                continue
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def recognize_regions(
+        image: Image.Image,
+        recognize: Callable[[Image.Image], str],
+        config: LayoutConfig = DEFAULT_LAYOUT
+) -> str:
+    """
+    Crop and tile a preprocessed page, recognize the strips concurrently and stitch the results.
+
+    Args:
+        image: Preprocessed page
+        recognize: OCR function for one region, e.g. a run_ollama_ocr partial
+        config: Layout settings
+
+    Returns:
+        str: Combined text, top to bottom, without the overlap duplicates
+    """
+    regions = split_regions(image, config)
+    if len(regions) == 1:
+        return recognize(regions[0])
+    with ThreadPoolExecutor(max_workers=config.workers) as pool:
+        texts = list(pool.map(recognize, regions))
+    return stitch_texts(texts)
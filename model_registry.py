@@ -0,0 +1,200 @@
+import threading
+import time
+from functools import lru_cache
+from typing import Iterable, Optional
+
+import requests
+
+from image_io import resolve_encoded
+
+DEFAULT_BASE_URL = "http://localhost:11434"
+DEFAULT_KEEP_ALIVE = "30m"
+
+
+def _keep_alive_seconds(keep_alive: str) -> float:
+    units = {"s": 1, "m": 60, "h": 3600}
+    if keep_alive and keep_alive[-1] in units:
+        return float(keep_alive[:-1]) * units[keep_alive[-1]]
+    return float(keep_alive)
+
+
+@lru_cache(maxsize=None)
+def _processor_class():
+    """OCRProcessor that also takes images already encoded in memory (see image_io.in_memory_path)."""
+    from ollama_ocr import OCRProcessor
+
+    class InMemoryOCRProcessor(OCRProcessor):
+        def _encode_image(self, image_path: str) -> str:
+            return resolve_encoded(image_path) or super()._encode_image(image_path)
+
+    return InMemoryOCRProcessor
+
+
+class ModelWorker:
+    """
+    Long-lived handle for one Ollama model.
+
+    Holds the OCRProcessor for the model and keeps the model resident in Ollama
+    by re-sending a keep-alive ping when the previous one is about to expire.
+    """
+
+    def __init__(self, model_name: str, base_url: str = DEFAULT_BASE_URL, keep_alive: str = DEFAULT_KEEP_ALIVE):
+        self.model_name = model_name
+        self.base_url = base_url
+        self.keep_alive = keep_alive
+        self.warmed_at: Optional[float] = None
+        self.requests = 0
+        self._processor = None
+        self._lock = threading.Lock()
+
+    @property
+    def processor(self):
+        """The OCRProcessor for this model, created on first use."""
+        if self._processor is None:
+            with self._lock:
+                if self._processor is None:
+                    self._processor = _processor_class()(
+                        model_name=self.model_name, base_url=f"{self.base_url}/api/generate"
+                    )
+        return self._processor
+
+    @property
+    def is_warm(self) -> bool:
+        if self.warmed_at is None:
+            return False
+        # Refresh a little before Ollama would unload the model
+        return time.monotonic() - self.warmed_at < _keep_alive_seconds(self.keep_alive) * 0.9
+
+    def warm(self, timeout: float = 300.0) -> bool:
+        """
+        Load the model into Ollama's memory with an empty generate request.
+
+        The request is sent without holding the worker's lock, so a slow load
+        does not block other callers; concurrent warms of the same model are
+        harmless, Ollama loads it once.
+
+        Returns:
+            bool: True if Ollama confirmed the model is loaded
+        """
+        try:
+            response = requests.post(
+                f"{self.base_url}/api/generate",
+                json={"model": self.model_name, "keep_alive": self.keep_alive},
+                timeout=timeout
+            )
+            response.raise_for_status()
+        except requests.exceptions.RequestException:
+            with self._lock:
+                self.warmed_at = None
+            return False
+        with self._lock:
+            self.warmed_at = time.monotonic()
+        return True
+
+    def ensure_warm(self) -> None:
+        if not self.is_warm:
+            self.warm()
+
+    def checkout(self) -> "ModelWorker":
+        """Mark a request routed to this worker, warming the model first if needed."""
+        self.ensure_warm()
+        self.requests += 1
+        return self
+
+
+class WorkerRegistry:
+    """
+    Process-wide registry of ModelWorkers, one per model name.
+
+    Also caches the installed model list from /api/tags for ttl seconds so
+    Streamlit reruns do not hit Ollama every time.
+    """
+
+    def __init__(self, base_url: str = DEFAULT_BASE_URL, keep_alive: str = DEFAULT_KEEP_ALIVE, ttl: float = 60.0):
+        self.base_url = base_url
+        self.keep_alive = keep_alive
+        self.ttl = ttl
+        self._workers: dict[str, ModelWorker] = {}
+        self._models: Optional[list[str]] = None
+        self._models_fetched_at = 0.0
+        self._lock = threading.Lock()
+
+    def worker(self, model_name: str) -> ModelWorker:
+        """Return the worker for model_name, creating it if needed."""
+        with self._lock:
+            worker = self._workers.get(model_name)
+            if worker is None:
+                worker = self._workers[model_name] = ModelWorker(model_name, self.base_url, self.keep_alive)
+        return worker
+
+    def route(self, model_name: str) -> ModelWorker:
+        """Return a warm worker for model_name."""
+        return self.worker(model_name).checkout()
+
+    def prewarm(self, model_names: Iterable[str], wait: bool = False) -> list[threading.Thread]:
+        """
+        Warm the given models in background threads.
+
+        Args:
+            model_names: Models to load into Ollama
+            wait: Block until every model has answered
+
+        Returns:
+            list[threading.Thread]: The started warm-up threads
+        """
+        threads = []
+        for model_name in model_names:
+            worker = self.worker(model_name)
+            if worker.is_warm:
+                continue
+            thread = threading.Thread(target=worker.ensure_warm, name=f"warm-{model_name}", daemon=True)
+            thread.start()
+            threads.append(thread)
+        if wait:
+            for thread in threads:
+                thread.join()
+        return threads
+
+    def installed_models(self, refresh: bool = False) -> list[str]:
+        """
+        Names of the models installed in Ollama, cached for ttl seconds.
+
+        Raises:
+            requests.exceptions.RequestException: If Ollama cannot be reached and nothing is cached
+        """
+        with self._lock:
+            fresh = time.monotonic() - self._models_fetched_at < self.ttl
+            if self._models is not None and fresh and not refresh:
+                return self._models
+        try:
+            response = requests.get(f"{self.base_url}/api/tags", timeout=10)
+            response.raise_for_status()
+        except requests.exceptions.RequestException:
+            # A stale list is more useful than an error while Ollama restarts
+            if self._models is not None:
+                return self._models
+            raise
+        models = [model["name"] for model in response.json().get("models", [])]
+        with self._lock:
+            self._models = models
+            self._models_fetched_at = time.monotonic()
+        return models
+
+    def stats(self) -> dict:
+        return {
+            name: {"warm": worker.is_warm, "requests": worker.requests}
+            for name, worker in self._workers.items()
+        }
+
+
+_registries: dict[str, WorkerRegistry] = {}
+_registry_lock = threading.Lock()
+
+
+def get_registry(base_url: str = DEFAULT_BASE_URL) -> WorkerRegistry:
+    """Return the process-wide WorkerRegistry for base_url; each Ollama server keeps its own."""
+    with _registry_lock:
+        registry = _registries.get(base_url)
+        if registry is None:
+            registry = _registries[base_url] = WorkerRegistry(base_url)
+        return registry
@@ -1,33 +1,168 @@
-import torch
+from typing import TYPE_CHECKING, Iterable, Optional, Union
+
 import cv2
 import numpy as np
 import pandas as pd
-from mtb.dataset import TableVirtuoso  # adjust import per repo structure
-from mtb.models import TableMaster  # or the actual MuTAbNet model class
+
+if TYPE_CHECKING:
+    # torch takes seconds and hundreds of MiB to import, so it is only loaded with a model
+    import torch
+
+ImageInput = Union[str, np.ndarray]
+
+
+def letterbox(img: np.ndarray, size: tuple[int, int], fill: int = 255) -> tuple[np.ndarray, float, tuple[int, int]]:
+    """
+    Resize an image to fit size (height, width) keeping its aspect ratio, padding the rest.
+
+    Returns:
+        tuple: Letterboxed image, scale factor applied, (top, left) padding in pixels
+    """
+    target_h, target_w = size
+    h, w = img.shape[:2]
+    scale = min(target_h / h, target_w / w)
+    new_h, new_w = int(round(h * scale)), int(round(w * scale))
+    interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+    resized = cv2.resize(img, (new_w, new_h), interpolation=interpolation)
+    top, left = (target_h - new_h) // 2, (target_w - new_w) // 2
+    out = np.full((target_h, target_w, 3), fill, dtype=np.uint8)
+    out[top:top + new_h, left:left + new_w] = resized
+    return out, scale, (top, left)
+
+
+def _load_rgb(image: ImageInput) -> np.ndarray:
+    if isinstance(image, str):
+        img = cv2.imread(image)
+        if img is None:
+            raise ValueError(f"Could not read image at {image}")
+        return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    if image.ndim == 2:
+        return cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
+    if image.shape[2] == 4:
+        return cv2.cvtColor(image, cv2.COLOR_RGBA2RGB)
+    return image
+
 
 class MuTAbNet:
-    def __init__(self, model, device):
-        self.model = model.to(device)
+    def __init__(self, model, device, num_threads: Optional[int] = None):
+        import torch
+
+        self.model = model.to(device).eval()
         self.device = device
+        if num_threads:
+            torch.set_num_threads(num_threads)
 
     @classmethod
-    def from_pretrained(cls, model_name="mutabnet-lab", device="cpu"):
+    def from_pretrained(
+            cls,
+            model_name="mutabnet-lab",
+            device="cpu",
+            quantize: bool = False,
+            num_threads: Optional[int] = None
+    ):
+        """
+        Load the pretrained table model.
+
+        Args:
+            model_name: Checkpoint name
+            device: Torch device
+            quantize: Use a dynamically quantized int8 copy of the linear layers (CPU only)
+            num_threads: Intra-op threads for CPU inference, defaults to torch's choice
+        """
+        from mtb.models import TableMaster  # or the actual MuTAbNet model class
+
         model = TableMaster.from_pretrained(model_name)  # adjust naming
-        return cls(model, device)
+        if quantize:
+            model = quantize_for_cpu(model)
+        return cls(model, device, num_threads)
+
+    @staticmethod
+    def _to_dataframes(tables) -> list[pd.DataFrame]:
+        dfs = []
+        for tbl in tables:
+            rows = tbl.cells  # you’ll need to adapt this shape
+            df = pd.DataFrame(rows)
+            dfs.append(df)
+        return dfs
 
     def predict(self, image_path: str) -> list[pd.DataFrame]:
+        import torch
+        from mtb.dataset import TableVirtuoso  # adjust import per repo structure
+
         img = cv2.imread(image_path)
         img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
         tensor = torch.from_numpy(img_rgb).permute(2, 0, 1).unsqueeze(0).float().to(self.device) / 255.0
 
         # forward pass & decode (adjust per API)
-        output = self.model(tensor)
+        with torch.inference_mode():
+            output = self.model(tensor)
         tables = TableVirtuoso.decode(output, img.shape[:2])
 
-        dfs = []
-        for tbl in tables:
-            rows = tbl.cells  # you’ll need to adapt this shape
-            df = pd.DataFrame(rows)
-            dfs.append(df)
+        return self._to_dataframes(tables)
+
+    def infer_batch(
+            self,
+            images: Iterable[ImageInput],
+            size: tuple[int, int] = (1024, 768),
+            batch_size: int = 8
+    ) -> list:
+        """
+        Run the forward pass on many images, batch_size at a time.
+
+        Images are letterboxed to a common size (height, width) so they can be
+        stacked into one tensor. No decoding happens here.
+
+        Returns:
+            list: One raw model output per image, in input order
+        """
+        import torch
+
+        images = list(images)
+        outputs = []
+        # One reusable uint8 staging buffer per batch, converted to float once
+        staging = np.empty((min(batch_size, len(images)), size[0], size[1], 3), dtype=np.uint8)
+        with torch.inference_mode():
+            for start in range(0, len(images), batch_size):
+                chunk = images[start:start + batch_size]
+                for i, image in enumerate(chunk):
+                    staging[i], _, _ = letterbox(_load_rgb(image), size)
+                batch = torch.from_numpy(staging[:len(chunk)]).to(self.device)
+                batch = batch.permute(0, 3, 1, 2).float().div_(255.0)
+                output = self.model(batch)
+                outputs.extend(output[i] for i in range(len(chunk)))
+        return outputs
+
+    def predict_batch(
+            self,
+            images: Iterable[ImageInput],
+            size: tuple[int, int] = (1024, 768),
+            batch_size: int = 8
+    ) -> list[list[pd.DataFrame]]:
+        """
+        Detect tables in many images with batched inference.
+
+        Args:
+            images: Image paths or RGB/grayscale arrays
+            size: Common (height, width) every image is letterboxed to
+            batch_size: Images per forward pass
+
+        Returns:
+            list[list[pd.DataFrame]]: Tables per image, in input order
+        """
+        from mtb.dataset import TableVirtuoso  # adjust import per repo structure
+
+        results = []
+        for output in self.infer_batch(images, size, batch_size):
+            # Cell coordinates are in letterboxed space; the cell contents are what we keep
+            tables = TableVirtuoso.decode(output.unsqueeze(0), size)
+            results.append(self._to_dataframes(tables))
+        return results
+
+
+def quantize_for_cpu(model: "torch.nn.Module") -> "torch.nn.Module":
+    """Dynamically quantize linear and LSTM layers to int8 for faster CPU inference."""
+    import torch
 
-        return dfs
\ No newline at end of file
+    return torch.ao.quantization.quantize_dynamic(
+        model.cpu().eval(), {torch.nn.Linear, torch.nn.LSTM}, dtype=torch.qint8
+    )
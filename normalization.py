@@ -0,0 +1,444 @@
+import difflib
+import re
+import unicodedata
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from extraction import parse_number
+
+
+@dataclass(frozen=True)
+class Analyte:
+    """
+    A lab test with its canonical code, units and names.
+
+    Attributes:
+        code: Canonical code, e.g. "HGB"
+        name: Canonical English name
+        units: Canonical unit per kind of measurement; differential counts are
+            reported both as "%" and as an absolute count
+        synonyms: Names and abbreviations in English, Italian and Portuguese
+            (the languages of the Tesseract setup), written without accents
+        molar_mass: g/mol, allows converting between mass and molar units
+        valence: Charge of the ion, allows converting mEq/L
+    """
+    code: str
+    name: str
+    units: tuple[str, ...]
+    synonyms: tuple[str, ...]
+    molar_mass: Optional[float] = None
+    valence: Optional[int] = None
+
+
+ANALYTES = (
+    Analyte("HGB", "Hemoglobin", ("g/dL",),
+            ("hemoglobin", "haemoglobin", "hgb", "hb", "emoglobina", "hemoglobina")),
+    Analyte("HCT", "Hematocrit", ("%",),
+            ("hematocrit", "haematocrit", "hct", "ht", "ematocrito", "hematocrito")),
+    Analyte("RBC", "Red blood cells", ("10^12/L",),
+            ("rbc", "red blood cells", "red blood cell count", "red cells", "erythrocytes", "eritrociti",
+             "globuli rossi", "emazie", "hemacias", "eritrocitos", "globulos vermelhos")),
+    Analyte("WBC", "White blood cells", ("10^9/L",),
+            ("wbc", "white blood cells", "white blood cell count", "white cells", "leukocytes", "leucocytes",
+             "leucociti", "globuli bianchi", "leucocitos", "globulos brancos")),
+    Analyte("PLT", "Platelets", ("10^9/L",),
+            ("plt", "platelets", "platelet count", "thrombocytes", "piastrine", "trombociti", "plaquetas")),
+    Analyte("MCV", "Mean corpuscular volume", ("fL",),
+            ("mcv", "mean corpuscular volume", "mean cell volume", "volume corpuscolare medio", "vcm",
+             "volume corpuscular medio")),
+    Analyte("MCH", "Mean corpuscular hemoglobin", ("pg",),
+            ("mch", "mean corpuscular hemoglobin", "mean cell hemoglobin", "contenuto emoglobinico medio",
+             "contenuto medio di emoglobina", "hcm", "hemoglobina corpuscular media")),
+    Analyte("MCHC", "Mean corpuscular hemoglobin concentration", ("g/dL",),
+            ("mchc", "mean corpuscular hemoglobin concentration", "mean cell hemoglobin concentration",
+             "concentrazione emoglobinica corpuscolare media", "concentrazione media di emoglobina", "chcm",
+             "concentracao de hemoglobina corpuscular media")),
+    Analyte("RDW", "Red cell distribution width", ("%",),
+            ("rdw", "rdw cv", "red cell distribution width", "ampiezza distribuzione eritrocitaria",
+             "amplitude de distribuicao dos eritrocitos")),
+    Analyte("NEUT", "Neutrophils", ("%", "10^9/L"),
+            ("neutrophils", "neutrophil", "neutrophile", "neut", "neu", "neutrofili", "granulociti neutrofili",
+             "neutrofilos", "segmented neutrophils")),
+    Analyte("LYMPH", "Lymphocytes", ("%", "10^9/L"),
+            ("lymphocytes", "lymphocyte", "lymphocites", "lymph", "lym", "linfociti", "linfocitos")),
+    Analyte("MONO", "Monocytes", ("%", "10^9/L"),
+            ("monocytes", "monocyte", "mono", "mon", "monociti", "monocitos")),
+    Analyte("EOS", "Eosinophils", ("%", "10^9/L"),
+            ("eosinophils", "eosinophil", "eos", "eosinofili", "granulociti eosinofili", "eosinofilos")),
+    Analyte("BASO", "Basophils", ("%", "10^9/L"),
+            ("basophils", "basophil", "baso", "bas", "basofili", "granulociti basofili", "basofilos")),
+    Analyte("GLU", "Glucose", ("mg/dL",),
+            ("glucose", "glu", "fasting glucose", "blood glucose", "glycemia", "glicemia", "glucosio",
+             "glicemia a digiuno", "glicose", "glicemia de jejum"), molar_mass=180.16),
+    Analyte("HBA1C", "Glycated hemoglobin", ("%",),
+            ("hba1c", "hb a1c", "a1c", "glycated hemoglobin", "glycosylated hemoglobin", "emoglobina glicata",
+             "emoglobina glicosilata", "hemoglobina glicada", "hemoglobina glicosilada")),
+    Analyte("CREA", "Creatinine", ("mg/dL",),
+            ("creatinine", "crea", "creat", "creatinina", "creatininemia"), molar_mass=113.12),
+    Analyte("UREA", "Urea", ("mg/dL",),
+            ("urea", "azotemia", "ureia"), molar_mass=60.06),
+    Analyte("CHOL", "Total cholesterol", ("mg/dL",),
+            ("cholesterol", "total cholesterol", "cholesterol total", "colesterolo", "colesterolo totale",
+             "colesterol", "colesterol total"), molar_mass=386.65),
+    Analyte("HDL", "HDL cholesterol", ("mg/dL",),
+            ("hdl", "hdl cholesterol", "cholesterol hdl", "colesterolo hdl", "hdl colesterolo", "colesterol hdl",
+             "hdl colesterol"), molar_mass=386.65),
+    Analyte("LDL", "LDL cholesterol", ("mg/dL",),
+            ("ldl", "ldl cholesterol", "cholesterol ldl", "colesterolo ldl", "ldl colesterolo", "colesterol ldl",
+             "ldl colesterol"), molar_mass=386.65),
+    Analyte("TRIG", "Triglycerides", ("mg/dL",),
+            ("triglycerides", "trig", "tg", "trigliceridi", "triglicerides", "triglicerideos"), molar_mass=885.7),
+    Analyte("ALT", "Alanine aminotransferase", ("U/L",),
+            ("alt", "gpt", "sgpt", "alt gpt", "alanine aminotransferase", "alanina aminotransferasi",
+             "transaminasi gpt", "alanina aminotransferase", "tgp")),
+    Analyte("AST", "Aspartate aminotransferase", ("U/L",),
+            ("ast", "got", "sgot", "ast got", "aspartate aminotransferase", "aspartato aminotransferasi",
+             "transaminasi got", "aspartato aminotransferase", "tgo")),
+    Analyte("GGT", "Gamma-glutamyl transferase", ("U/L",),
+            ("ggt", "gamma gt", "gamma glutamyl transferase", "gamma glutamiltransferasi",
+             "gamma glutamil transferasi", "gama gt", "gama glutamil transferase")),
+    Analyte("ALP", "Alkaline phosphatase", ("U/L",),
+            ("alp", "alkaline phosphatase", "fosfatasi alcalina", "fosfatase alcalina")),
+    Analyte("TBIL", "Total bilirubin", ("mg/dL",),
+            ("bilirubin", "total bilirubin", "bilirubin total", "bilirubina", "bilirubina totale",
+             "bilirrubina", "bilirrubina total"), molar_mass=584.66),
+    Analyte("DBIL", "Direct bilirubin", ("mg/dL",),
+            ("direct bilirubin", "bilirubin direct", "conjugated bilirubin", "bilirubina diretta",
+             "bilirubina coniugata", "bilirrubina direta"), molar_mass=584.66),
+    Analyte("FE", "Iron", ("µg/dL",),
+            ("iron", "serum iron", "fe", "sideremia", "ferro", "ferro sierico", "ferro serico"), molar_mass=55.845),
+    Analyte("FERR", "Ferritin", ("ng/mL",),
+            ("ferritin", "ferritina", "serum ferritin", "ferritinemia")),
+    Analyte("NA", "Sodium", ("mmol/L",),
+            ("sodium", "na", "sodio", "natremia"), molar_mass=22.99, valence=1),
+    Analyte("K", "Potassium", ("mmol/L",),
+            ("potassium", "k", "potassio", "kalemia", "potassemia"), molar_mass=39.098, valence=1),
+    Analyte("CA", "Calcium", ("mg/dL",),
+            ("calcium", "ca", "calcio", "calcemia"), molar_mass=40.078, valence=2),
+    Analyte("TSH", "Thyroid-stimulating hormone", ("mIU/L",),
+            ("tsh", "thyrotropin", "thyroid stimulating hormone", "tireotropina", "ormone tireostimolante",
+             "hormonio tireoestimulante")),
+    Analyte("CRP", "C-reactive protein", ("mg/L",),
+            ("crp", "c reactive protein", "proteina c reattiva", "pcr", "proteina c reativa")),
+)
+
+# Unit spellings (after _unit_key cleanup) -> (kind, factor to the kind's base unit).
+# Bases: mass g/L, molar mol/L, equivalent eq/L, count per L, fraction 1, volume fL,
+# mass per cell pg, enzyme activity U/L, hormone units IU/L, ratio mmol/mol
+UNITS = {
+    "g/l": ("mass", 1.0), "g/dl": ("mass", 10.0), "g/100ml": ("mass", 10.0), "mg/dl": ("mass", 1e-2),
+    "mg/l": ("mass", 1e-3), "mg/100ml": ("mass", 1e-2), "µg/dl": ("mass", 1e-5), "µg/l": ("mass", 1e-6),
+    "µg/ml": ("mass", 1e-3), "ng/ml": ("mass", 1e-6), "ng/dl": ("mass", 1e-8), "ng/l": ("mass", 1e-9),
+    "pg/ml": ("mass", 1e-9),
+    "mol/l": ("molar", 1.0), "mmol/l": ("molar", 1e-3), "µmol/l": ("molar", 1e-6), "nmol/l": ("molar", 1e-9),
+    "pmol/l": ("molar", 1e-12),
+    "meq/l": ("equivalent", 1e-3),
+    "10^9/l": ("count", 1e9), "10^3/µl": ("count", 1e9), "10^3/mm3": ("count", 1e9), "k/µl": ("count", 1e9),
+    "10^12/l": ("count", 1e12), "10^6/µl": ("count", 1e12), "10^6/mm3": ("count", 1e12), "m/µl": ("count", 1e12),
+    "/µl": ("count", 1e6), "/mm3": ("count", 1e6), "cells/µl": ("count", 1e6), "/l": ("count", 1.0),
+    "%": ("fraction", 1e-2), "l/l": ("fraction", 1.0),
+    "fl": ("volume", 1.0), "µm3": ("volume", 1.0),
+    "pg": ("cell mass", 1.0),
+    "u/l": ("activity", 1.0), "iu/l": ("activity", 1.0), "ui/l": ("activity", 1.0), "µkat/l": ("activity", 60.0),
+    "miu/l": ("hormone", 1e-3), "mu/l": ("hormone", 1e-3), "mui/l": ("hormone", 1e-3),
+    "µiu/ml": ("hormone", 1e-3), "µu/ml": ("hormone", 1e-3), "µui/ml": ("hormone", 1e-3),
+    "mmol/mol": ("ratio", 1.0),
+}
+
+# Conversions that are not a plain factor: (code, unit) -> (factor, offset)
+AFFINE = {
+    # IFCC mmol/mol to NGSP %
+    ("HBA1C", "mmol/mol"): (0.09148, 2.152),
+}
+
+_SUPERSCRIPT_RE = re.compile("[⁰¹²³⁴⁵⁶⁷⁸⁹]+")
+_SUPERSCRIPT_DIGITS = str.maketrans("⁰¹²³⁴⁵⁶⁷⁸⁹", "0123456789")
+_POWER_RE = re.compile(r"^(?:x|\*)?10(?:\^|\*|e)?(\d+)")
+_MICRO_RE = re.compile(r"(?:\bmc|\bu)(?=(?:g|l|mol|iu|ui|u/|kat|m3)\b)")
+_NAME_SPLIT_RE = re.compile(r"[^a-z0-9]+")
+_ACRONYM_RE = re.compile(r"\b(?:[a-z]\.){2,}(?:[a-z]\b)?")
+# Abbreviations this short only count when they are the whole name ("Ca" but not "Ca 19-9")
+_MIN_PARTIAL = 3
+_FUZZY_MIN = 6
+
+
+def _unit_key(unit: str) -> str:
+    """Lower-case a unit and unify the spellings of micro, powers of ten and mm³."""
+    # "10⁹" must become "10^9", not the "109" NFKC would make of it
+    text = _SUPERSCRIPT_RE.sub(lambda m: "^" + m.group().translate(_SUPERSCRIPT_DIGITS), unit.strip())
+    text = unicodedata.normalize("NFKC", text).lower().replace(" ", "").replace("×", "x")
+    text = text.replace("μ", "µ").replace("^^", "^")
+    text = _MICRO_RE.sub("µ", text)
+    text = text.replace("mm^3", "mm3").replace("mmc", "mm3").replace("µm^3", "µm3")
+    power = _POWER_RE.match(text)
+    if power:
+        text = f"10^{power.group(1)}" + text[power.end():]
+    return text
+
+
+def _strip_accents(text: str) -> str:
+    return "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+
+
+def _name_tokens(name: str) -> tuple[str, ...]:
+    # "V.C.M." is the abbreviation "vcm", not three one-letter words
+    text = _ACRONYM_RE.sub(lambda m: m.group().replace(".", ""), _strip_accents(name).lower())
+    return tuple(token for token in _NAME_SPLIT_RE.split(text) if token)
+
+
+class NameIndex:
+    """
+    Token trie over every synonym, with a fuzzy fallback for OCR misspellings.
+
+    A name is matched to the longest synonym found anywhere in it, so
+    "Colesterolo HDL" is HDL rather than total cholesterol and "Emoglobina
+    (Hb)" is hemoglobin. Names with no exact synonym are compared with the
+    longer synonyms by similarity ratio. Results are cached per distinct name.
+    """
+
+    def __init__(self, analytes: tuple[Analyte, ...] = ANALYTES, cutoff: float = 0.85):
+        self.cutoff = cutoff
+        self._root: dict = {}
+        self._fuzzy: dict[str, str] = {}
+        for analyte in analytes:
+            for synonym in analyte.synonyms:
+                tokens = _name_tokens(synonym)
+                node = self._root
+                for token in tokens:
+                    node = node.setdefault(token, {})
+                node[""] = analyte.code
+                if len(synonym) >= _FUZZY_MIN:
+                    self._fuzzy[" ".join(tokens)] = analyte.code
+        self._fuzzy_keys = list(self._fuzzy)
+        self.match = lru_cache(maxsize=65536)(self._match)
+
+    def _longest(self, tokens: tuple[str, ...]) -> Optional[str]:
+        best, best_length = None, 0
+        for start in range(len(tokens)):
+            node = self._root
+            for end in range(start, len(tokens)):
+                node = node.get(tokens[end])
+                if node is None:
+                    break
+                code = node.get("")
+                if code is None:
+                    continue
+                length = sum(len(t) for t in tokens[start:end + 1])
+                whole = start == 0 and end == len(tokens) - 1
+                if length > best_length and (length >= _MIN_PARTIAL or whole):
+                    best, best_length = code, length
+        return best
+
+    def _match(self, name: str) -> Optional[str]:
+        tokens = _name_tokens(name)
+        if not tokens:
+            return None
+        code = self._longest(tokens)
+        if code is not None:
+            return code
+        text = " ".join(tokens)
+        if len(text) < _FUZZY_MIN:
+            return None
+        close = difflib.get_close_matches(text, self._fuzzy_keys, n=1, cutoff=self.cutoff)
+        if not close:
+            # OCR noise around the name ("Emoglobna g/dl Metodo ..."): try single words
+            for token in tokens:
+                if len(token) >= _FUZZY_MIN:
+                    close = difflib.get_close_matches(token, self._fuzzy_keys, n=1, cutoff=self.cutoff)
+                    if close:
+                        break
+        return self._fuzzy[close[0]] if close else None
+
+
+class ConversionTable:
+    """
+    Dense (analyte x unit) tables of factor, offset and target unit.
+
+    Built once from ANALYTES and UNITS, so converting a column is a fancy
+    index into three arrays instead of a lookup per row. Pairs that cannot be
+    converted (a count in mg/dL, an unknown unit) have a NaN factor.
+    """
+
+    def __init__(self, analytes: tuple[Analyte, ...] = ANALYTES, units: dict = UNITS):
+        self.analytes = analytes
+        self.codes = [a.code for a in analytes]
+        self.code_index = {code: i for i, code in enumerate(self.codes)}
+        self.unit_keys = list(units)
+        self.unit_index = {key: i for i, key in enumerate(self.unit_keys)}
+        self.target_units = sorted({u for a in analytes for u in a.units})
+        target_lookup = {u: i for i, u in enumerate(self.target_units)}
+
+        # One extra row/column for "no analyte" / "unknown unit"
+        shape = (len(analytes) + 1, len(self.unit_keys) + 1)
+        self.factor = np.full(shape, np.nan)
+        self.offset = np.zeros(shape)
+        self.target = np.full(shape, -1, dtype=np.int16)
+        for a, analyte in enumerate(analytes):
+            for u, key in enumerate(self.unit_keys):
+                converted = self._convert(analyte, key, units)
+                if converted is not None:
+                    target, factor, offset = converted
+                    self.factor[a, u], self.offset[a, u], self.target[a, u] = factor, offset, target_lookup[target]
+
+    @staticmethod
+    def _convert(analyte: Analyte, key: str, units: dict) -> Optional[tuple[str, float, float]]:
+        if (analyte.code, key) in AFFINE:
+            factor, offset = AFFINE[(analyte.code, key)]
+            return analyte.units[0], factor, offset
+        kind, factor = units[key]
+        if kind == "equivalent" and analyte.valence:
+            kind, factor = "molar", factor / analyte.valence
+        for target in analyte.units:
+            target_kind, target_factor = units[_unit_key(target)]
+            if kind == target_kind:
+                return target, factor / target_factor, 0.0
+            if analyte.molar_mass and {kind, target_kind} == {"mass", "molar"}:
+                # g/L = mol/L x g/mol
+                scale = analyte.molar_mass if kind == "molar" else 1 / analyte.molar_mass
+                return target, factor * scale / target_factor, 0.0
+        return None
+
+    def convert(self, codes: np.ndarray, unit_ids: np.ndarray, values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Converted values (NaN where impossible) and target-unit ids (-1) for index arrays."""
+        return values * self.factor[codes, unit_ids] + self.offset[codes, unit_ids], self.target[codes, unit_ids]
+
+
+_NAME_INDEX: Optional[NameIndex] = None
+_TABLE: Optional[ConversionTable] = None
+_REFERENCE_NUMBER_RE = re.compile(r"\d[\d.,]*\d|\d")
+_REFERENCE_RE = r"^\s*([<>≤≥]?)\s*(-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)(?:\s*[-–]\s*(-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?))?\s*$"
+
+
+def get_name_index() -> NameIndex:
+    global _NAME_INDEX
+    if _NAME_INDEX is None:
+        _NAME_INDEX = NameIndex()
+    return _NAME_INDEX
+
+
+def get_conversion_table() -> ConversionTable:
+    global _TABLE
+    if _TABLE is None:
+        _TABLE = ConversionTable()
+    return _TABLE
+
+
+def match_test(name: str) -> Optional[str]:
+    """Canonical code for a test name in English, Italian or Portuguese, or None."""
+    return get_name_index().match(name)
+
+
+def convert_value(name: str, value: float, unit: str) -> tuple[Optional[str], Optional[float], str]:
+    """
+    Single-row version of normalize_frame.
+
+    Returns:
+        tuple: (code or None, value in the canonical unit or None, canonical unit or "")
+    """
+    table = get_conversion_table()
+    code = match_test(name)
+    a = table.code_index.get(code, len(table.codes))
+    u = table.unit_index.get(_unit_key(unit or ""), len(table.unit_keys))
+    target = table.target[a, u]
+    if target < 0:
+        return code, None, ""
+    return code, float(value * table.factor[a, u] + table.offset[a, u]), table.target_units[target]
+
+
+def _factorize(column: pd.Series) -> tuple[np.ndarray, list[str]]:
+    """Codes per row and the distinct strings; missing values get code -1, which indexes a trailing ""."""
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        codes, uniques = column.cat.codes.to_numpy(), column.cat.categories
+    else:
+        codes, uniques = pd.factorize(column)
+    return codes, [str(u) for u in uniques] + [""]
+
+
+def _parse_number(text: str) -> float:
+    try:
+        return parse_number(text.strip())
+    except ValueError:
+        return np.nan
+
+
+def to_numbers(column: pd.Series) -> np.ndarray:
+    """
+    Values as floats, NaN where they are not numbers.
+
+    Numeric columns are taken as they are; strings may use either decimal
+    convention ("13,5" or "13.5"), and are parsed once per distinct value.
+    """
+    if pd.api.types.is_numeric_dtype(column.dtype) and not pd.api.types.is_bool_dtype(column.dtype):
+        return column.to_numpy(dtype=float, na_value=np.nan)
+    codes, uniques = _factorize(column)
+    parsed = np.array([_parse_number(u) if u else np.nan for u in uniques[:-1]] + [np.nan], dtype=float)
+    return parsed[codes]
+
+
+def _decimal_point(match: re.Match) -> str:
+    number = _parse_number(match.group())
+    return match.group() if np.isnan(number) else repr(number)
+
+
+def _parse_references(column: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    # Parsed once per distinct string; reports repeat the same few ranges
+    codes, uniques = _factorize(column)
+    # Numbers in either decimal convention ("3,5-5,0", "> 1.000,5") are rewritten with a decimal point
+    uniques = [_REFERENCE_NUMBER_RE.sub(_decimal_point, u) for u in uniques]
+    parts = pd.Series(uniques, dtype=object).str.extract(_REFERENCE_RE)
+    bound = parts[0].to_numpy(dtype=object)
+    first = pd.to_numeric(parts[1], errors="coerce").to_numpy(dtype=float)
+    second = pd.to_numeric(parts[2], errors="coerce").to_numpy(dtype=float)
+    is_upper = np.isin(bound, ["<", "≤"])
+    is_lower = np.isin(bound, [">", "≥"])
+    low = np.where(is_upper, np.nan, first)
+    high = np.where(is_lower, np.nan, np.where(is_upper, first, second))
+    return low[codes], high[codes]
+
+
+def normalize_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Add canonical codes and converted values to an extraction table.
+
+    Works on whole columns: names, units and reference strings are resolved
+    once per distinct value, then every row is converted by indexing the
+    precomputed ConversionTable. Categorical columns skip the factorizing.
+
+    Args:
+        df: Table with Test, Value, Unit and optionally Reference columns,
+            as produced by extract_values; values and references written
+            with a decimal comma are read as numbers
+
+    Returns:
+        pd.DataFrame: Copy of df with Code, NormValue, NormUnit, NormLow and
+        NormHigh. Code is empty for unknown tests; the Norm columns are NaN
+        (NormUnit empty) when the unit is missing or cannot be converted
+    """
+    index, table = get_name_index(), get_conversion_table()
+    out = df.copy()
+
+    name_ids, names = _factorize(df["Test"])
+    code_of_name = np.array([table.code_index.get(index.match(n), len(table.codes)) for n in names], dtype=np.intp)
+    codes = code_of_name[name_ids]
+
+    unit_ids, units = _factorize(df["Unit"]) if "Unit" in df else (np.full(len(df), -1), [""])
+    unit_of_key = np.array([table.unit_index.get(_unit_key(u), len(table.unit_keys)) for u in units], dtype=np.intp)
+    unit_idx = unit_of_key[unit_ids]
+
+    values = to_numbers(df["Value"])
+    converted, target = table.convert(codes, unit_idx, values)
+
+    code_names = np.array(table.codes + [""], dtype=object)
+    unit_names = np.array(table.target_units + [""], dtype=object)
+    out["Code"] = code_names[codes]
+    out["NormValue"] = converted
+    out["NormUnit"] = unit_names[target]
+    if "Reference" in df:
+        low, high = _parse_references(df["Reference"])
+        out["NormLow"], _ = table.convert(codes, unit_idx, low)
+        out["NormHigh"], _ = table.convert(codes, unit_idx, high)
+    return out
@@ -0,0 +1,324 @@
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Optional, Protocol, Sequence
+
+from PIL import Image
+
+import telemetry
+from extraction import extract_values
+from image_io import encode_image_b64, in_memory_path, temporary_image_file
+from layout import LayoutConfig, recognize_regions
+from model_registry import get_registry
+from operating_point import is_lossless
+from ollama_scheduler import INTERACTIVE, get_scheduler
+from result_cache import ResultCache
+from tesseract_pool import get_pool
+
+logger = logging.getLogger(__name__)
+
+TESSERACT_LANG = "eng+ita"
+
+LAB_PROMPT = """Using default prompt: Extract all blood count values content from this image **exactly as it appears**, without modification, summarization, or omission.
+            Format the output in markdown table:
+            - output always a table with columns test name, value and unit
+            - Use headers (#, ##, ###) **only if they appear in the image**
+            - Preserve original lists (-, *, numbered lists) as they are
+            - Maintain all text formatting (bold, italics, underlines) exactly as seen
+            - **Do not add, interpret, or restructure any content**
+                """
+
+# Used when calling Ollama directly, where Ollama-OCR's built-in default prompt is not applied
+MARKDOWN_PROMPT = """Extract all text content from this image **exactly as it appears**, without modification, summarization, or omission.
+            Format the output in markdown, keeping tables as markdown tables."""
+
+
+def run_tesseract(image: Image.Image, lang: str = TESSERACT_LANG) -> str:
+    """Run Tesseract on a preprocessed image and return the recognized text."""
+    return get_pool(lang).recognize(image).text
+
+
+def run_tesseract_with_confidence(image: Image.Image, lang: str = TESSERACT_LANG) -> tuple[str, list[float]]:
+    """
+    Run Tesseract once and return the text together with per-word confidences.
+
+    Pages go through the shared engine pool of this process, so the languages
+    are loaded once rather than per call.
+
+    Returns:
+        tuple[str, list[float]]: Text, and word confidences in 0-100
+    """
+    page = get_pool(lang).recognize(image)
+    return page.text, page.confidences
+
+
+def run_ollama_ocr(
+        image: Image.Image,
+        model_name: str,
+        prompt: Optional[str] = None,
+        cache: Optional[ResultCache] = None,
+        layout: Optional[LayoutConfig] = None,
+        priority: int = INTERACTIVE,
+        lossless: Optional[bool] = None
+) -> str:
+    """
+    Run Ollama-OCR on a preprocessed image.
+
+    Args:
+        image: Preprocessed PIL Image
+        model_name: Name of an installed Ollama vision model
+        prompt: Optional custom prompt, None uses the Ollama-OCR default
+        cache: Optional result cache checked before calling the model
+        layout: Crop and tile the page first, recognizing the strips concurrently
+        priority: Scheduler priority, BATCH for bulk jobs so interactive requests go first
+        lossless: PNG or JPEG encoding, None uses the model's tuned operating point (PNG if untuned)
+
+    Returns:
+        str: Markdown returned by the model
+
+    Raises:
+        RuntimeError: If Ollama-OCR reports a processing error
+    """
+    if layout is not None:
+        # Each strip goes through the cache on its own
+        return recognize_regions(
+            image, lambda region: run_ollama_ocr(region, model_name, prompt, cache, None, priority, lossless), layout
+        )
+
+    if lossless is None:
+        lossless = is_lossless(f"ollama:{model_name}")
+    cache_key = None
+    if cache is not None:
+        # The model sees a different image as JPEG, so its answer is cached apart from the PNG one
+        cache_key = cache.make_key(image, model_name, prompt, "markdown" if lossless else "markdown-jpeg")
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    result = _process_with_ollama_ocr(image, model_name, prompt, priority, lossless)
+    if cache_key is not None:
+        cache.put(cache_key, result)
+    return result
+
+
+def _process_with_ollama_ocr(
+        image: Image.Image,
+        model_name: str,
+        prompt: Optional[str],
+        priority: int,
+        lossless: bool
+) -> str:
+    # The image is encoded once in memory and handed over under a pseudo path,
+    # so no temp file is written and re-read
+    image_b64 = encode_image_b64(image, lossless)
+    registry = get_registry()
+    # Warm, long-lived processor for this model instead of a new one per request. The model is
+    # warmed before queueing, so a load of up to minutes does not hold a slot other requests wait for
+    ocr = registry.route(model_name).processor
+    with get_scheduler(registry.base_url).slot(model_name, cost=len(image_b64), priority=priority) as slot, \
+            in_memory_path(image_b64) as image_path, telemetry.span("ollama_ocr", model=model_name) as s:
+        s.set("bytes_sent", len(image_b64))
+        telemetry.inc("labsnap_ollama_bytes_sent_total", len(image_b64), model=model_name)
+        result = ocr.process_image(
+            image_path=image_path,
+            preprocess=False,
+            format_type="markdown",  # Options: markdown, text, json, structured, key_value
+            custom_prompt=prompt
+        )
+        # Ollama-OCR does not stream, so throughput is measured in characters of the answer
+        slot.add_work(len(result))
+
+    # Ollama-OCR reports failures as text; they must not be parsed or cached as results
+    if result.startswith("Error processing image:"):
+        raise RuntimeError(result)
+    return result
+
+
+@dataclass
+class OCRResult:
+    """Text produced by one backend, with what the router needs to judge it."""
+    backend: str
+    text: str
+    seconds: float
+    word_confidences: Optional[list[float]] = None
+    score: float = 0.0
+    rows: int = 0
+    error: str = ""
+
+
+class OCRBackend(Protocol):
+    """Anything that turns a preprocessed image into text."""
+    name: str
+
+    def recognize(self, image: Image.Image) -> OCRResult:
+        ...
+
+
+class TesseractBackend:
+    """Cheap local pass, reports word confidences."""
+
+    def __init__(self, lang: str = TESSERACT_LANG):
+        self.lang = lang
+        self.name = "tesseract"
+
+    def recognize(self, image: Image.Image) -> OCRResult:
+        start = time.perf_counter()
+        text, confidences = run_tesseract_with_confidence(image, self.lang)
+        return OCRResult(self.name, text, time.perf_counter() - start, confidences)
+
+
+class OllamaOCRBackend:
+    """Vision LLM through Ollama-OCR; slow but robust on photos and odd layouts."""
+
+    def __init__(
+            self,
+            model_name: str,
+            prompt: Optional[str] = LAB_PROMPT,
+            cache: Optional[ResultCache] = None,
+            layout: Optional[LayoutConfig] = None,
+            priority: int = INTERACTIVE
+    ):
+        self.model_name = model_name
+        self.prompt = prompt
+        self.cache = cache
+        self.layout = layout
+        self.priority = priority
+        self.name = f"ollama:{model_name}"
+
+    def recognize(self, image: Image.Image) -> OCRResult:
+        start = time.perf_counter()
+        text = run_ollama_ocr(image, self.model_name, self.prompt, self.cache, self.layout, self.priority)
+        return OCRResult(self.name, text, time.perf_counter() - start)
+
+
+class MuTAbNetBackend:
+    """Table-structure model; its tables are rendered as markdown so extract_values can read them."""
+
+    def __init__(self, model_name: str = "mutabnet-lab", device: str = "cpu"):
+        self.model_name = model_name
+        self.device = device
+        self.name = "mutabnet"
+        self._model = None
+
+    def recognize(self, image: Image.Image) -> OCRResult:
+        if self._model is None:
+            from mutabnet_wrapper import MuTAbNet
+
+            self._model = MuTAbNet.from_pretrained(self.model_name, device=self.device)
+        start = time.perf_counter()
+        with temporary_image_file(image) as image_path:
+            tables = self._model.predict(image_path)
+        lines = []
+        for table in tables:
+            for row in table.astype(str).itertuples(index=False):
+                lines.append("| " + " | ".join(row) + " |")
+            lines.append("")
+        return OCRResult(self.name, "\n".join(lines), time.perf_counter() - start)
+
+
+def score_result(result: OCRResult) -> OCRResult:
+    """
+    Rate how trustworthy a result is, between 0 and 1.
+
+    Combines how many candidate lines (containing both letters and digits)
+    extract_values could parse with the mean Tesseract word confidence, when
+    the backend reports one.
+    """
+    values = extract_values(result.text)
+    candidates = sum(
+        1 for line in result.text.splitlines()
+        if any(char.isdigit() for char in line) and any(char.isalpha() for char in line)
+    )
+    coverage = len(values) / candidates if candidates else 0.0
+    result.rows = len(values)
+    if result.word_confidences:
+        confidence = sum(result.word_confidences) / len(result.word_confidences) / 100
+        result.score = 0.5 * min(coverage, 1.0) + 0.5 * confidence
+    else:
+        result.score = min(coverage, 1.0)
+    return result
+
+
+@dataclass
+class RoutedResult:
+    """Final answer of the router plus every attempt that led to it."""
+    result: OCRResult
+    attempts: list[OCRResult] = field(default_factory=list)
+
+    @property
+    def values(self) -> list[dict]:
+        return extract_values(self.result.text)
+
+
+class OCRRouter:
+    """
+    Runs backends from cheapest to most expensive and stops at the first good result.
+
+    A result is good enough when its score reaches threshold and it yields at
+    least min_rows values. If every backend falls short, the best-scoring
+    result is returned. Backend errors are logged and the next backend is tried.
+    """
+
+    def __init__(self, backends: Sequence[OCRBackend], threshold: float = 0.6, min_rows: int = 3):
+        if not backends:
+            raise ValueError("OCRRouter needs at least one backend")
+        self.backends = list(backends)
+        self.threshold = threshold
+        self.min_rows = min_rows
+
+    def is_good(self, result: OCRResult) -> bool:
+        return not result.error and result.score >= self.threshold and result.rows >= self.min_rows
+
+    def route(self, image: Image.Image, first: Optional[OCRResult] = None) -> RoutedResult:
+        """
+        Recognize an image, escalating only while results are not good enough.
+
+        Args:
+            image: Preprocessed PIL Image
+            first: Result of the first backend if it already ran, and was scored with score_result,
+                elsewhere (e.g. in a worker process)
+
+        Returns:
+            RoutedResult: The chosen result and all attempts
+        """
+        attempts = []
+        backends = self.backends
+        if first is not None:
+            attempts.append(first)
+            backends = backends[1:]
+            logger.info(
+                "OCR backend %s: score %.2f, %d rows in %.2fs%s",
+                first.backend, first.score, first.rows, first.seconds, f" ({first.error})" if first.error else ""
+            )
+            if self.is_good(first):
+                return self._finish(first, attempts)
+
+        for backend in backends:
+            try:
+                result = score_result(backend.recognize(image))
+            except Exception as e:
+                logger.warning("OCR backend %s failed: %s", backend.name, e)
+                attempts.append(OCRResult(backend.name, "", 0.0, error=f"{type(e).__name__}: {e}"))
+                continue
+            attempts.append(result)
+            logger.info(
+                "OCR backend %s: score %.2f, %d rows in %.2fs",
+                result.backend, result.score, result.rows, result.seconds
+            )
+            if self.is_good(result):
+                return self._finish(result, attempts)
+            logger.info("Escalating past %s (score %.2f < %.2f or rows < %d)",
+                        result.backend, result.score, self.threshold, self.min_rows)
+
+        usable = [attempt for attempt in attempts if not attempt.error]
+        best = max(usable, key=lambda attempt: (attempt.score, attempt.rows)) if usable else attempts[-1]
+        return self._finish(best, attempts)
+
+    @staticmethod
+    def _finish(result: OCRResult, attempts: list[OCRResult]) -> RoutedResult:
+        logger.info(
+            "OCR routed to %s after %d attempt(s): %s",
+            result.backend, len(attempts),
+            ", ".join(f"{attempt.backend}={attempt.seconds:.2f}s" for attempt in attempts)
+        )
+        return RoutedResult(result, attempts)
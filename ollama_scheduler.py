@@ -0,0 +1,397 @@
+import asyncio
+import itertools
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager, suppress
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import AsyncIterator, Callable, Iterator, Optional
+
+import telemetry
+
+INTERACTIVE = 0
+BATCH = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BATCH: "batch"}
+
+
+def parse_priority(name: str) -> int:
+    """INTERACTIVE or BATCH from its name, as used in form fields and flags."""
+    for priority, priority_name in PRIORITY_NAMES.items():
+        if name == priority_name:
+            return priority
+    raise ValueError(f"Unknown priority {name!r}, expected one of {', '.join(PRIORITY_NAMES.values())}")
+
+
+@dataclass(eq=False)
+class Slot:
+    """One request's place in the scheduler: queued, then running once granted."""
+    model: str
+    priority: int
+    cost: int
+    seq: int
+    wake: Callable[[], None] = field(repr=False)
+    enqueued: float = field(default_factory=time.perf_counter)
+    granted: Optional[float] = None
+    work: int = 0
+    overloaded: bool = False
+
+    def add_work(self, units: int = 1) -> None:
+        """Report generated output (e.g. tokens); per-model throughput is measured from it."""
+        self.work += units
+
+    def overload(self) -> None:
+        """Report that Ollama answered 429 or 5xx; the model's limit is lowered when the slot is released."""
+        self.overloaded = True
+
+    def key(self, now: float, aging: float) -> tuple:
+        # Batch requests that waited longer than aging compete as interactive ones,
+        # so a steady stream of small uploads cannot starve them
+        priority = self.priority
+        if priority > INTERACTIVE and now - self.enqueued > aging:
+            priority = INTERACTIVE
+        return priority, self.cost, self.seq
+
+
+@dataclass
+class ModelState:
+    """Queue, concurrency cap and throughput measurement of one model."""
+    limit: int
+    queue: list[Slot] = field(default_factory=list)
+    in_flight: int = 0
+    completed: int = 0
+    # Measured throughput (work per second while requests were waiting) per limit tried
+    rates: dict[int, float] = field(default_factory=dict)
+    window_start: Optional[float] = None
+    window_work: int = 0
+    window_done: int = 0
+    saturated: bool = True
+    hold: int = 0
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class OllamaScheduler:
+    """
+    Admission control between the app and a single Ollama server.
+
+    Every generation asks for a slot first. Waiting requests are grouped by
+    model: the models assumed loaded keep being served, and another model is
+    only switched to when nothing is queued for the loaded ones, when its
+    request outranks everything queued for them, or when it has waited longer
+    than switch_after. The model being replaced is drained first, so Ollama
+    never evicts a model that still has requests running. Within a model,
+    interactive requests go before batch ones and small images before large
+    ones; batch requests older than aging seconds compete as interactive.
+
+    The concurrency cap of each model is found by hill climbing: while
+    requests are waiting, throughput (work reported by the slots, e.g. tokens,
+    per second) is measured over a window of requests, and the cap is raised
+    while that gains more than gain, and lowered again when it does not, or
+    as soon as a request reports that Ollama answered 429 or 5xx.
+    Ollama queues requests beyond OLLAMA_NUM_PARALLEL itself, so the cap
+    settles there instead of piling requests up inside Ollama.
+
+    Thread-safe: sync callers use slot(), async callers aslot(), and one
+    scheduler is shared by the Streamlit sessions, event loops and batch
+    threads of a process.
+
+    Args:
+        max_loaded_models: Models Ollama keeps in memory at once
+        initial_limit: Concurrency per model before anything is measured
+        max_limit: Upper bound for the per-model concurrency
+        window: Completed requests per measurement, per unit of the current limit
+        gain: Relative throughput improvement needed to keep a higher limit
+        switch_after: Seconds a request for another model waits at most before the loaded one is drained for it
+        aging: Seconds after which a batch request competes as interactive
+    """
+
+    def __init__(
+            self,
+            max_loaded_models: int = 1,
+            initial_limit: int = 1,
+            max_limit: int = 8,
+            window: int = 2,
+            gain: float = 0.1,
+            switch_after: float = 30.0,
+            aging: float = 60.0
+    ):
+        self.max_loaded_models = max_loaded_models
+        self.initial_limit = initial_limit
+        self.max_limit = max_limit
+        self.window = window
+        self.gain = gain
+        self.switch_after = switch_after
+        self.aging = aging
+        self.models: dict[str, ModelState] = {}
+        self.loaded: list[str] = []
+        self.loads = 0
+        self._switched_at = 0.0
+        self._draining: Optional[str] = None
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._waits: dict[int, deque] = {priority: deque(maxlen=1000) for priority in PRIORITY_NAMES}
+
+    @contextmanager
+    def slot(self, model: str, cost: int = 0, priority: int = INTERACTIVE) -> Iterator[Slot]:
+        """
+        Block until a request for model may run, and hold the slot while it does.
+
+        Args:
+            model: Ollama model the request is for
+            cost: Request size, e.g. image bytes; smaller requests go first
+            priority: INTERACTIVE or BATCH
+        """
+        granted = threading.Event()
+        slot = self._enqueue(model, cost, priority, granted.set)
+        try:
+            granted.wait()
+        except BaseException:
+            self._abandon(slot)
+            raise
+        try:
+            yield slot
+        finally:
+            self._release(slot)
+
+    @asynccontextmanager
+    async def aslot(self, model: str, cost: int = 0, priority: int = INTERACTIVE) -> AsyncIterator[Slot]:
+        """Async version of slot(); cancelling the waiting task gives the place up."""
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+        slot = self._enqueue(model, cost, priority, lambda: loop.call_soon_threadsafe(_resolve, granted))
+        try:
+            await granted
+        except BaseException:
+            self._abandon(slot)
+            raise
+        try:
+            yield slot
+        finally:
+            self._release(slot)
+
+    def _state(self, model: str) -> ModelState:
+        state = self.models.get(model)
+        if state is None:
+            state = self.models[model] = ModelState(self.initial_limit)
+        return state
+
+    def _enqueue(self, model: str, cost: int, priority: int, wake: Callable[[], None]) -> Slot:
+        if priority not in PRIORITY_NAMES:
+            raise ValueError(f"Unknown priority {priority!r}")
+        slot = Slot(model, priority, cost, next(self._seq), wake, time.perf_counter())
+        with self._lock:
+            self._state(model).queue.append(slot)
+            self._dispatch()
+        return slot
+
+    def _abandon(self, slot: Slot) -> None:
+        with self._lock:
+            granted = slot.granted is not None
+            if not granted:
+                # _grant already dropped the slot if its event loop was gone when it was woken
+                with suppress(ValueError):
+                    self.models[slot.model].queue.remove(slot)
+                self._dispatch()
+        if granted:
+            self._release(slot)
+
+    def _release(self, slot: Slot) -> None:
+        now = time.perf_counter()
+        with self._lock:
+            state = self.models[slot.model]
+            state.in_flight -= 1
+            state.completed += 1
+            state.window_work += slot.work
+            state.window_done += 1
+            if not state.queue or self._draining == slot.model:
+                state.saturated = False
+            # Requests granted before the last back-off already counted towards it
+            if slot.overloaded and state.window_start is not None and slot.granted >= state.window_start:
+                self._back_off(slot.model, state, now)
+            elif state.window_done >= self.window * state.limit:
+                self._adapt(slot.model, state, now)
+            if not state.queue and not state.in_flight:
+                # Idle: the next measurement starts with the next request, idle time is not throughput
+                state.window_start = None
+            self._dispatch()
+
+    def _adapt(self, model: str, state: ModelState, now: float) -> None:
+        # Callers that report no work are measured in requests per second
+        work = state.window_work or state.window_done
+        elapsed = now - state.window_start
+        saturated = state.saturated
+        state.window_start, state.window_work, state.window_done, state.saturated = now, 0, 0, True
+        # Throughput only says something about the limit when requests were waiting for it
+        if not saturated or elapsed <= 0:
+            return
+        rate = work / elapsed
+        previous = state.rates.get(state.limit)
+        state.rates[state.limit] = rate if previous is None else (previous + rate) / 2
+        if state.hold > 0:
+            state.hold -= 1
+            return
+        lower = state.rates.get(state.limit - 1)
+        if lower is not None and state.rates[state.limit] < lower * (1 + self.gain):
+            # The last step up did not pay off; stay below it for a while before probing again
+            state.limit -= 1
+            state.hold = 4
+        elif state.limit < self.max_limit:
+            state.limit += 1
+        telemetry.set_gauge("labsnap_scheduler_concurrency_limit", state.limit, model=model)
+
+    def _back_off(self, model: str, state: ModelState, now: float) -> None:
+        # Ollama refused work at this limit: its measurement is dropped, and the next window starts below it
+        state.rates.pop(state.limit, None)
+        state.limit = max(1, state.limit - 1)
+        state.hold = 4
+        state.window_start, state.window_work, state.window_done, state.saturated = now, 0, 0, True
+        telemetry.set_gauge("labsnap_scheduler_concurrency_limit", state.limit, model=model)
+
+    def _load(self, model: str, now: float) -> None:
+        self.loaded.append(model)
+        # The first window includes Ollama loading the model, so it is not counted
+        state = self.models[model]
+        state.window_start, state.window_work, state.window_done, state.saturated = now, 0, 0, False
+        self._switched_at = now
+        self.loads += 1
+        telemetry.inc("labsnap_scheduler_model_loads_total", model=model)
+
+    def _plan(self, heads: dict[str, Slot], now: float) -> None:
+        """Decide which models count as loaded: finish drains, load into free room, start a switch."""
+        if self._draining is not None and self.models[self._draining].in_flight == 0:
+            self.loaded.remove(self._draining)
+            self._draining = None
+
+        outsiders = sorted((slot.key(now, self.aging), model) for model, slot in heads.items() if model not in self.loaded)
+        for _, model in outsiders:
+            if len(self.loaded) >= self.max_loaded_models:
+                idle = [m for m in self.loaded if m not in heads and not self.models[m].in_flight and m != self._draining]
+                if not idle:
+                    break
+                self.loaded.remove(idle[0])
+            self._load(model, now)
+
+        if self._draining is not None:
+            return
+        waiting = [(slot.key(now, self.aging), model) for model, slot in heads.items() if model not in self.loaded]
+        if not waiting:
+            return
+        best_key, best = min(waiting)
+        loaded_keys = [heads[m].key(now, self.aging) for m in self.loaded if m in heads]
+        outranks = not loaded_keys or best_key[0] < min(key[0] for key in loaded_keys)
+        # A backlog of the same priority waits at most switch_after, but also lets the
+        # model just switched to work at least that long before switching back
+        if outranks or now - max(heads[best].enqueued, self._switched_at) > self.switch_after:
+            # Make room by draining the loaded model whose queued work ranks lowest
+            self._draining = max(
+                self.loaded, key=lambda m: heads[m].key(now, self.aging) if m in heads else (float("inf"),)
+            )
+            if not self.models[self._draining].in_flight:
+                self.loaded.remove(self._draining)
+                self._draining = None
+                self._load(best, now)
+
+    def _grant(self, slot: Slot, now: float) -> None:
+        state = self.models[slot.model]
+        state.queue.remove(slot)
+        if state.window_start is None:
+            state.window_start, state.window_work, state.window_done, state.saturated = now, 0, 0, True
+        try:
+            slot.wake()
+        except RuntimeError:
+            # The waiting event loop is gone, so nobody will use or release this slot
+            return
+        slot.granted = now
+        state.in_flight += 1
+        wait = now - slot.enqueued
+        self._waits[slot.priority].append(wait)
+        telemetry.observe("labsnap_scheduler_wait_seconds", wait, model=slot.model,
+                          priority=PRIORITY_NAMES[slot.priority])
+
+    def _dispatch(self) -> None:
+        now = time.perf_counter()
+        while True:
+            heads = {
+                model: min(state.queue, key=lambda slot: slot.key(now, self.aging))
+                for model, state in self.models.items() if state.queue
+            }
+            if not heads:
+                break
+            self._plan(heads, now)
+            ready = [
+                (heads[model].key(now, self.aging), model) for model in self.loaded
+                if model in heads and model != self._draining
+                and self.models[model].in_flight < self.models[model].limit
+            ]
+            if not ready:
+                break
+            self._grant(heads[min(ready)[1]], now)
+        for model, state in self.models.items():
+            telemetry.set_gauge("labsnap_scheduler_in_flight", state.in_flight, model=model)
+            for priority, name in PRIORITY_NAMES.items():
+                depth = sum(1 for slot in state.queue if slot.priority == priority)
+                telemetry.set_gauge("labsnap_scheduler_queue_depth", depth, model=model, priority=name)
+
+    def queue_depth(self) -> int:
+        with self._lock:
+            return sum(len(state.queue) for state in self.models.values())
+
+    def stats(self) -> dict:
+        """Queues, limits and measured throughput per model, and recent wait times per priority."""
+        with self._lock:
+            waits = {}
+            for priority, name in PRIORITY_NAMES.items():
+                recent = sorted(self._waits[priority])
+                waits[name] = {
+                    "count": len(recent),
+                    "p50": statistics.median(recent) if recent else 0.0,
+                    "p95": recent[int(0.95 * (len(recent) - 1))] if recent else 0.0
+                }
+            return {
+                "loaded": list(self.loaded),
+                "draining": self._draining,
+                "loads": self.loads,
+                "waits": waits,
+                "models": {
+                    model: {
+                        "queued": {name: sum(1 for s in state.queue if s.priority == p) for p, name in PRIORITY_NAMES.items()},
+                        "in_flight": state.in_flight,
+                        "limit": state.limit,
+                        "completed": state.completed,
+                        "rates": {limit: round(rate, 2) for limit, rate in sorted(state.rates.items())}
+                    }
+                    for model, state in self.models.items()
+                }
+            }
+
+
+def _default_max_loaded_models() -> int:
+    """Ollama's own default: 3 models per GPU, or 3 when it runs on the CPU."""
+    for variable in ("CUDA_VISIBLE_DEVICES", "HIP_VISIBLE_DEVICES", "ROCR_VISIBLE_DEVICES"):
+        devices = [device for device in os.getenv(variable, "").split(",") if device.strip() not in ("", "-1")]
+        if devices:
+            return 3 * len(devices)
+    return 3
+
+
+@lru_cache(maxsize=None)
+def get_scheduler(base_url: str = "http://localhost:11434") -> OllamaScheduler:
+    """
+    Process-wide scheduler for one Ollama server.
+
+    Reads Ollama's own OLLAMA_MAX_LOADED_MODELS and OLLAMA_NUM_PARALLEL, when
+    set, as the number of models kept loaded and the highest concurrency tried;
+    otherwise assumes Ollama's default number of loaded models, so that the
+    models of an ensemble still run side by side.
+    """
+    max_loaded_models = os.getenv("OLLAMA_MAX_LOADED_MODELS")
+    return OllamaScheduler(
+        max_loaded_models=int(max_loaded_models) if max_loaded_models else _default_max_loaded_models(),
+        max_limit=int(os.getenv("OLLAMA_NUM_PARALLEL", "8"))
+    )
@@ -1,25 +1,37 @@
-import base64
 import requests
-from typing import Optional
-import io
+from typing import Callable, Optional
 from PIL import Image
 import json
 
+import telemetry
+from image_io import encode_image_b64
+from result_cache import ResultCache
+from structured_output import LAB_SCHEMA, IncrementalRowParser, is_complete_row, rows_from_document
+
+
+def encode_image(image: Image.Image, lossless: bool = True) -> str:
+    """Convert PIL Image to base64 string, encoded in memory."""
+    return encode_image_b64(image, lossless)
+
 
 class OllamaClient:
-    def __init__(self, base_url: str = "http://localhost:11434"):
+    def __init__(
+            self,
+            base_url: str = "http://localhost:11434",
+            cache: Optional[ResultCache] = None,
+            model: str = "gemma3:4b"
+    ):
         self.base_url = base_url
+        self.cache = cache
+        self.model = model
         
     def _encode_image(self, image: Image.Image) -> str:
         """Convert PIL Image to base64 string."""
-        buffered = io.BytesIO()
-        image.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
-        return img_str
+        return encode_image(image)
     
     def analyze_image(self, image: Image.Image, prompt: Optional[str] = None) -> str:
         """
-        Analyze an image using Gemma 3B model via Ollama.
+        Analyze an image with the client's vision model (gemma3:4b by default) via Ollama.
         
         Args:
             image: PIL Image object
@@ -28,24 +40,34 @@ class OllamaClient:
         Returns:
             str: Model's response
         """
-        base64_image = self._encode_image(image)
-        
         default_prompt = "Please analyze this image and extract any text you can see. " \
                         "Provide a detailed description of the content and context."
                         
         final_prompt = prompt if prompt else default_prompt
-        
+        model = self.model #gemma3:4b #gemma:2b
+
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.make_key(image, model, final_prompt, "text")
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+
         payload = {
-            "model": "gemma3:4b", #gemma3:4b #gemma:2b
+            "model": model,
             "prompt": final_prompt,
-            "images": [base64_image],
+            "images": [self._encode_image(image)],
             "stream": False
         }
         
         try:
-            response = requests.post(f"{self.base_url}/api/generate", json=payload)
-            response.raise_for_status()
-            return response.json()["response"]
+            with telemetry.span("ollama_http", model=model):
+                response = requests.post(f"{self.base_url}/api/generate", json=payload)
+                response.raise_for_status()
+            result = response.json()["response"]
+            if cache_key is not None:
+                self.cache.put(cache_key, result)
+            return result
         except requests.exceptions.RequestException as e:
             return f"Error communicating with Ollama: {str(e)}"
         except Exception as e:
@@ -53,9 +75,35 @@ class OllamaClient:
 
 
 
-    def analyze_image_json(self, image: Image.Image, prompt: Optional[str] = None) -> dict:
-        base64_image = self._encode_image(image)
+    def analyze_image_json(
+            self,
+            image: Image.Image,
+            prompt: Optional[str] = None,
+            model: Optional[str] = None,
+            schema: Optional[dict] = None,
+            on_row: Optional[Callable[[dict], None]] = None,
+            timeout: float = 300.0
+    ) -> dict:
+        """
+        Extract lab values as JSON using Ollama's structured output.
+
+        The schema is sent as the request "format", so the model can only produce
+        matching JSON. The answer is streamed and parsed as it arrives: on_row is
+        called with each row as soon as it is complete. If the stream stops early
+        the complete part is kept rather than re-running the model.
 
+        Args:
+            image: PIL Image object
+            prompt: Optional custom prompt
+            model: Vision model, defaults to the client's model
+            schema: JSON schema for the answer, defaults to LAB_SCHEMA
+            on_row: Called with every completed row while streaming
+            timeout: Seconds allowed for the whole request
+
+        Returns:
+            dict: {"text_blocks": [...]} with "truncated" and "raw_response" added
+            when the answer had to be repaired, or {"error": ...} if nothing usable came back
+        """
         default_prompt = (
              "Please analyze this image of a blood test report and extract ONLY the following lab tests:\n"
     "- Hemoglobin\n"
@@ -68,29 +116,68 @@ class OllamaClient:
     "Ensure the values are numbers and not strings. Include the unit if present in the image."
         )
         final_prompt = prompt if prompt else default_prompt
+        model = model or self.model
+        schema = schema or LAB_SCHEMA
+
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.make_key(image, model, final_prompt + json.dumps(schema, sort_keys=True), "json-schema")
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return json.loads(cached)
 
         payload = {
-            "model": "gemma3:4b",
+            "model": model,
             "prompt": final_prompt,
-            "images": [base64_image],
-            "stream": False
+            "images": [self._encode_image(image)],
+            "format": schema,
+            "stream": True,
+            # Deterministic decoding: the same report should give the same JSON
+            "options": {"temperature": 0}
         }
 
+        parser = IncrementalRowParser()
+        error = ""
         try:
-            response = requests.post(f"{self.base_url}/api/generate", json=payload)
-            response.raise_for_status()
-            raw_output = response.json()["response"]
+            with telemetry.span("ollama_http", model=model, format="json-schema"), requests.post(
+                    f"{self.base_url}/api/generate", json=payload, stream=True, timeout=timeout
+            ) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if "error" in chunk:
+                        error = chunk["error"]
+                        break
+                    for row in parser.feed(chunk.get("response", "")):
+                        if on_row is not None and is_complete_row(row):
+                            on_row(row)
+                    if chunk.get("done"):
+                        break
+        except requests.exceptions.RequestException as e:
+            error = f"Error communicating with Ollama: {str(e)}"
+        except Exception as e:
+            error = f"An unexpected error occurred: {str(e)}"
 
-            # Try parsing the response as JSON
+        if parser.complete and not error:
             try:
-                return json.loads(raw_output)
+                result = json.loads(parser.text)
             except json.JSONDecodeError:
-                return {"error": "Model response is not valid JSON", "raw_response": raw_output}
-
-        except requests.exceptions.RequestException as e:
-            return {"error": f"Error communicating with Ollama: {str(e)}"}
-        except Exception as e:
-            return {"error": f"An unexpected error occurred: {str(e)}"}
+                result = None
+            if isinstance(result, dict):
+                if cache_key is not None:
+                    self.cache.put(cache_key, parser.text)
+                return result
+
+        # Stream cut short or malformed: keep every complete row instead of re-running the model
+        rows = rows_from_document(parser.repair())
+        if not rows:
+            return {"error": error or "Model response is not valid JSON", "raw_response": parser.text}
+        result = {"text_blocks": rows, "truncated": True, "raw_response": parser.text}
+        if error:
+            result["error"] = error
+        return result
 
 
     def analyze_img_ollama_ocr(self, image: Image.Image, prompt: Optional[str] = None) -> str:
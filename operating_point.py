@@ -0,0 +1,102 @@
+import json
+import os
+from dataclasses import asdict, dataclass, fields, replace
+from functools import lru_cache
+from typing import Optional
+
+from PIL import Image
+
+from preprocessing import ADAPTIVE_CONFIG, DEFAULT_CONFIG, PreprocessConfig, preprocess_image
+
+DEFAULT_OPERATING_POINTS_PATH = os.getenv("LABSNAP_OPERATING_POINTS", "operating_points.json")
+
+
+@dataclass(frozen=True)
+class OperatingPoint:
+    """
+    Preprocessing and encoding settings chosen for one OCR backend by benchmarks.tune.
+
+    Attributes:
+        backend: Backend name, "tesseract" or "ollama:<model>" (as OCRBackend.name)
+        width: Pages are resized to this width; None keeps the upscale rule
+        binarize: Adaptive thresholding, otherwise grayscale is sent unblurred;
+            without a width a binarized point is the default pipeline (global Otsu)
+        lossless: PNG; False sends grayscale pages as JPEG (binarized pages are always 1-bit PNG)
+        f1: Extraction accuracy measured on the sample corpus
+        seconds: Mean preprocessing + encoding + OCR time per sample
+        bytes_sent: Mean encoded request size per sample, 0 for local backends
+    """
+    backend: str
+    width: Optional[int] = None
+    binarize: bool = True
+    lossless: bool = True
+    f1: float = 0.0
+    seconds: float = 0.0
+    bytes_sent: int = 0
+
+    def config(self) -> PreprocessConfig:
+        if self.width is None and self.binarize:
+            # The untuned point, which the sweep compares every other point against
+            return DEFAULT_CONFIG
+        if self.binarize:
+            return replace(ADAPTIVE_CONFIG, target_width=self.width)
+        # Blurring only helps thresholding; models reading grayscale get the sharp page
+        return replace(ADAPTIVE_CONFIG, target_width=self.width, threshold="none", blur=0)
+
+    def label(self) -> str:
+        width = f"{self.width}px" if self.width else "default size"
+        return f"{width}, {'binarized' if self.binarize else 'grayscale'}, {'png' if self.lossless else 'jpeg'}"
+
+
+@lru_cache(maxsize=4)
+def _load(path: str, mtime_ns: int) -> dict[str, OperatingPoint]:
+    with open(path, encoding="utf-8") as handle:
+        entries = json.load(handle)
+    names = {f.name for f in fields(OperatingPoint)}
+    # Entries also keep their sweep for inspection; only the chosen point is loaded
+    return {
+        backend: OperatingPoint(**{key: value for key, value in entry.items() if key in names})
+        for backend, entry in entries.items()
+    }
+
+
+def load_operating_points(path: str = DEFAULT_OPERATING_POINTS_PATH) -> dict[str, OperatingPoint]:
+    """
+    Tuned operating points by backend name, re-read when the file changes.
+
+    Returns an empty dict when nothing has been tuned yet.
+    """
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return {}
+    return _load(path, mtime_ns)
+
+
+def get_operating_point(backend: str, path: str = DEFAULT_OPERATING_POINTS_PATH) -> Optional[OperatingPoint]:
+    return load_operating_points(path).get(backend)
+
+
+def save_operating_point(point: OperatingPoint, sweep: list[dict], path: str = DEFAULT_OPERATING_POINTS_PATH) -> None:
+    """Store the chosen point for its backend, with the measured sweep, keeping other backends' points."""
+    entries = {}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as handle:
+            entries = json.load(handle)
+    entries[point.backend] = {**asdict(point), "sweep": sweep}
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as handle:
+        json.dump(entries, handle, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def preprocess_for(image: Image.Image, backend: str) -> Image.Image:
+    """preprocess_image at the backend's tuned operating point, or with the default settings if it has none."""
+    point = get_operating_point(backend)
+    return preprocess_image(image, point.config() if point else None)
+
+
+def is_lossless(backend: str) -> bool:
+    """Whether images for the backend are encoded as PNG (the default) or, when tuned so, as JPEG."""
+    point = get_operating_point(backend)
+    return point.lossless if point else True
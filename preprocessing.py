@@ -0,0 +1,290 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Iterable, Optional, Union
+
+import cv2
+import numpy as np
+from PIL import Image
+
+import telemetry
+
+
+@dataclass(frozen=True)
+class PreprocessConfig:
+    """
+    Settings for the preprocessing pipeline.
+
+    Attributes:
+        upscale: Resize factor applied before thresholding
+        min_dpi: Images with at least this DPI (from metadata) are not upscaled;
+            None upscales regardless of DPI
+        min_width: Without DPI metadata, images at least this wide are not
+            upscaled; None upscales every image
+        blur: Gaussian kernel size, 0 disables blurring
+        threshold: "otsu" (global), "adaptive", "tiled" (per-tile Otsu) or "none"
+        block_size: Neighbourhood size for adaptive thresholding (odd)
+        offset: Constant subtracted from the adaptive mean
+        tile_size: Tile edge in pixels for tiled thresholding
+        deskew: Straighten rotated scans before thresholding
+        max_skew: Larger detected angles are treated as noise and ignored
+        crop_table: Crop to the largest detected text/table region
+        crop_margin: Padding in pixels kept around the cropped region
+        target_width: Resize to this width, down or up, instead of the upscale
+            rule; set from a tuned operating point (see operating_point.py)
+    """
+    upscale: float = 2.0
+    min_dpi: Optional[int] = None
+    min_width: Optional[int] = None
+    blur: int = 5
+    threshold: str = "otsu"
+    block_size: int = 31
+    offset: int = 10
+    tile_size: int = 256
+    deskew: bool = False
+    max_skew: float = 15.0
+    crop_table: bool = False
+    crop_margin: int = 20
+    target_width: Optional[int] = None
+
+
+# The original preprocess_image: always 2x cubic upscale, 5x5 blur, global Otsu
+DEFAULT_CONFIG = PreprocessConfig()
+
+# Opt-in: deskew, adaptive thresholding, and no upscale for pages that are already large
+ADAPTIVE_CONFIG = PreprocessConfig(min_dpi=200, min_width=1600, threshold="adaptive", deskew=True)
+
+# Work buffers are reused across calls, one set per thread
+_local = threading.local()
+
+
+def _buffer(name: str, shape: tuple) -> np.ndarray:
+    buffers = getattr(_local, "buffers", None)
+    if buffers is None:
+        buffers = _local.buffers = {}
+    buf = buffers.get(name)
+    if buf is None or buf.shape != shape:
+        buf = buffers[name] = np.empty(shape, dtype=np.uint8)
+    return buf
+
+
+def _to_gray(image: Union[Image.Image, np.ndarray]) -> np.ndarray:
+    if isinstance(image, Image.Image):
+        return np.asarray(image.convert("L"))
+    if image.ndim == 3:
+        return cv2.cvtColor(image, cv2.COLOR_RGB2GRAY if image.shape[2] == 3 else cv2.COLOR_RGBA2GRAY)
+    return image
+
+
+def _needs_upscale(image: Union[Image.Image, np.ndarray], width: int, config: PreprocessConfig) -> bool:
+    if config.upscale <= 1:
+        return False
+    if isinstance(image, Image.Image):
+        dpi = image.info.get("dpi")
+        if dpi and config.min_dpi is not None and min(dpi) >= config.min_dpi:
+            return False
+    return config.min_width is None or width < config.min_width
+
+
+def estimate_skew(gray: np.ndarray, max_skew: float = 15.0) -> float:
+    """
+    Estimate the rotation of the text in degrees.
+
+    Works on a downsampled, inverted Otsu mask so it stays cheap on large pages.
+    Returns 0.0 when no reliable angle is found.
+    """
+    scale = min(1.0, 800 / max(gray.shape))
+    small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else gray
+    _, mask = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    # Merge characters into text lines so the rectangle follows the line direction
+    mask = cv2.dilate(mask, cv2.getStructuringElement(cv2.MORPH_RECT, (15, 3)))
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    angles = []
+    for contour in contours:
+        (_, _), (rw, rh), angle = cv2.minAreaRect(contour)
+        if rw < rh:
+            rw, rh, angle = rh, rw, angle - 90
+        # Only long, thin blobs are text lines; their median angle is the page skew
+        if rw >= 50 and rw >= 5 * rh:
+            angles.append(angle if angle <= 45 else angle - 90)
+    if len(angles) < 5:
+        return 0.0
+    angle = float(np.median(angles))
+    return angle if abs(angle) <= max_skew else 0.0
+
+
+def _rotate(gray: np.ndarray, angle: float) -> np.ndarray:
+    h, w = gray.shape
+    matrix = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+    return cv2.warpAffine(
+        gray, matrix, (w, h),
+        dst=_buffer("rotated", (h, w)),
+        flags=cv2.INTER_LINEAR,
+        borderMode=cv2.BORDER_CONSTANT,
+        borderValue=255
+    )
+
+
+def find_table_region(binary: np.ndarray, margin: int = 20) -> Optional[tuple[int, int, int, int]]:
+    """
+    Locate the main text/table block of a binarized page.
+
+    Dark content is joined into blocks with a wide closing, and the bounding box
+    of all blocks bigger than 1% of the largest one is returned as (x, y, w, h).
+    Returns None when nothing usable is found.
+    """
+    inverted = cv2.bitwise_not(binary)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(15, binary.shape[1] // 60), 5))
+    blocks = cv2.morphologyEx(inverted, cv2.MORPH_CLOSE, kernel)
+    contours, _ = cv2.findContours(blocks, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return None
+    boxes = np.array([cv2.boundingRect(c) for c in contours])
+    areas = boxes[:, 2] * boxes[:, 3]
+    keep = boxes[areas >= areas.max() * 0.01]
+    x0 = max(int(keep[:, 0].min()) - margin, 0)
+    y0 = max(int(keep[:, 1].min()) - margin, 0)
+    x1 = min(int((keep[:, 0] + keep[:, 2]).max()) + margin, binary.shape[1])
+    y1 = min(int((keep[:, 1] + keep[:, 3]).max()) + margin, binary.shape[0])
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def _tiled_otsu(gray: np.ndarray, tile_size: int, out: np.ndarray) -> np.ndarray:
+    global_level, _ = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    h, w = gray.shape
+    for y in range(0, h, tile_size):
+        for x in range(0, w, tile_size):
+            tile = gray[y:y + tile_size, x:x + tile_size]
+            # Blank or nearly blank tiles have no meaningful Otsu split
+            if tile.std() < 8:
+                level = global_level
+            else:
+                level, _ = cv2.threshold(tile, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+            cv2.threshold(tile, level, 255, cv2.THRESH_BINARY, dst=out[y:y + tile_size, x:x + tile_size])
+    return out
+
+
+def preprocess_array(
+        image: Union[Image.Image, np.ndarray],
+        config: PreprocessConfig = DEFAULT_CONFIG
+) -> np.ndarray:
+    """
+    Run the preprocessing pipeline and return a new uint8 grayscale array.
+
+    Args:
+        image: PIL Image or numpy array (grayscale, RGB or RGBA)
+        config: Pipeline settings
+
+    Returns:
+        np.ndarray: Binarized (or grayscale, with threshold="none") image
+    """
+    gray = _to_gray(image)
+    h, w = gray.shape
+
+    # Deskew at the original resolution, where the rotation touches 4x fewer pixels
+    if config.deskew:
+        angle = estimate_skew(gray, config.max_skew)
+        if abs(angle) > 0.5:
+            gray = _rotate(gray, angle)
+
+    if config.target_width:
+        if w != config.target_width:
+            size = (config.target_width, max(1, int(round(h * config.target_width / w))))
+            # Area averaging keeps thin strokes when shrinking, cubic interpolation when enlarging
+            interpolation = cv2.INTER_AREA if config.target_width < w else cv2.INTER_CUBIC
+            gray = cv2.resize(gray, size, dst=_buffer("resized", size[::-1]), interpolation=interpolation)
+    elif _needs_upscale(image, w, config):
+        size = (int(round(w * config.upscale)), int(round(h * config.upscale)))
+        gray = cv2.resize(gray, size, dst=_buffer("resized", size[::-1]), interpolation=cv2.INTER_CUBIC)
+
+    if config.blur:
+        blurred = _buffer("blurred", gray.shape)
+        gray = cv2.GaussianBlur(gray, (config.blur, config.blur), 0, dst=blurred)
+
+    # The result gets its own allocation; everything before it lives in reused buffers
+    out = np.empty(gray.shape, dtype=np.uint8)
+    if config.threshold == "otsu":
+        cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU, dst=out)
+    elif config.threshold == "adaptive":
+        cv2.adaptiveThreshold(
+            gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY,
+            config.block_size, config.offset, dst=out
+        )
+    elif config.threshold == "tiled":
+        _tiled_otsu(gray, config.tile_size, out)
+    elif config.threshold == "none":
+        np.copyto(out, gray)
+    else:
+        raise ValueError(f"Unknown threshold mode: {config.threshold}")
+
+    if config.crop_table:
+        region = find_table_region(out, config.crop_margin)
+        if region is not None:
+            x, y, rw, rh = region
+            out = out[y:y + rh, x:x + rw].copy()
+    return out
+
+
+def preprocess_image(pil_image: Image.Image, config: Optional[PreprocessConfig] = None) -> Image.Image:
+    """Grayscale, upscale, blur and binarize a report image before OCR (see PreprocessConfig)."""
+    with telemetry.span("preprocess") as s:
+        processed = Image.fromarray(preprocess_array(pil_image, config or DEFAULT_CONFIG))
+        s.set("pixels", processed.width * processed.height)
+    return processed
+
+
+class BatchPreprocessor:
+    """
+    Preprocess stacks of images on a thread pool created once.
+
+    OpenCV releases the GIL, so threads keep every core busy without the
+    pickling cost of a process pool, and long-lived threads keep their work
+    buffers between batches. OpenCV's own, process-wide thread count is left
+    alone; size workers with it in mind when both run at full width.
+
+    Args:
+        config: Pipeline settings shared by every image
+        workers: Number of threads, defaults to the CPU count
+    """
+
+    def __init__(self, config: Optional[PreprocessConfig] = None, workers: Optional[int] = None):
+        self.config = config or DEFAULT_CONFIG
+        self.workers = workers or os.cpu_count() or 1
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="preprocess")
+
+    def run(self, images: Iterable[Union[Image.Image, np.ndarray]]) -> list[Image.Image]:
+        """Preprocessed images in input order."""
+        arrays = list(self._pool.map(lambda image: preprocess_array(image, self.config), images))
+        return [Image.fromarray(array) for array in arrays]
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True)
+
+    def __enter__(self) -> "BatchPreprocessor":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def preprocess_batch(
+        images: Iterable[Union[Image.Image, np.ndarray]],
+        config: Optional[PreprocessConfig] = None,
+        workers: Optional[int] = None
+) -> list[Image.Image]:
+    """
+    Preprocess a stack of images once, on a BatchPreprocessor of its own.
+
+    Callers with many batches should keep one BatchPreprocessor instead.
+
+    Args:
+        images: PIL Images or numpy arrays
+        config: Pipeline settings shared by every image
+        workers: Number of threads, defaults to the CPU count
+
+    Returns:
+        list[Image.Image]: Preprocessed images in input order
+    """
+    with BatchPreprocessor(config, workers) as batch:
+        return batch.run(images)
@@ -0,0 +1,211 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from PIL import Image
+
+import telemetry
+from image_hash import HashIndex, context_id, dhash, phash
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "labsnap", "results.sqlite")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# Index entries written since the last save before the index is saved again
+_SAVE_EVERY = 64
+
+
+def image_digest(image: Image.Image) -> str:
+    """SHA-256 of the decoded pixels, so the same image hashes equally regardless of file encoding."""
+    digest = hashlib.sha256()
+    digest.update(f"{image.mode}:{image.size[0]}x{image.size[1]}:".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Persistent OCR/LLM result cache backed by SQLite.
+
+    Entries are keyed on the preprocessed image hash, model, prompt and format
+    type. When the stored values exceed max_bytes, the least recently used
+    entries are evicted. The size is tracked as a running total, re-read from
+    the database only after another process sharing the file wrote to it.
+
+    With near_duplicates, a perceptual-hash index (saved next to the database
+    as <path>.phash.npz) maps re-photographed or re-compressed copies of a page
+    to the key of the first copy, so they reuse its result. Only enable this
+    where that is safe: two reports on the same lab template that differ in a
+    few numbers hash alike and would share a result too.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES, near_duplicates: bool = False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.near_hits = 0
+        self._lock = threading.Lock()
+
+        self.hash_index: Optional[HashIndex] = None
+        self._index_path = None if path == ":memory:" else path + ".phash.npz"
+        # Hashes of keys handed out by make_key, indexed once their result is stored
+        self._pending: dict[str, tuple[int, int, int]] = {}
+        self._unsaved = 0
+        if near_duplicates:
+            self.hash_index = HashIndex.load(self._index_path) if self._index_path else HashIndex()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access)")
+        self._conn.commit()
+        self._version = self._data_version()
+        self._total = self._stored_bytes()
+
+    def make_key(self, image: Image.Image, model: str, prompt: Optional[str], format_type: str) -> str:
+        """
+        Build the cache key for a preprocessed image and request parameters.
+
+        With near-duplicate lookup on, an image close to one seen before with
+        the same parameters gets that image's key instead of its own.
+        """
+        digest = hashlib.sha256()
+        for part in (image_digest(image), model, prompt or "", format_type):
+            digest.update(part.encode())
+            digest.update(b"\0")
+        key = digest.hexdigest()
+        if self.hash_index is None:
+            return key
+
+        with telemetry.span("near_duplicate_lookup") as s:
+            p, d = phash(image), dhash(image)
+            context = context_id(model, prompt or "", format_type)
+            match = self.hash_index.search(p, d, context)
+            s.set("match", match is not None)
+        if match is not None:
+            ref, _ = match
+            if ref.hex() != key:
+                with self._lock:
+                    self.near_hits += 1
+                telemetry.inc("labsnap_cache_near_duplicates_total")
+            return ref.hex()
+        with self._lock:
+            self._pending[key] = (p, d, context)
+            if len(self._pending) > 1024:
+                # Keys whose model call never finished
+                self._pending.pop(next(iter(self._pending)))
+        return key
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached value for key, or None on a miss."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                telemetry.inc("labsnap_cache_lookups_total", result="miss")
+                return None
+            self._conn.execute("UPDATE results SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+            telemetry.inc("labsnap_cache_lookups_total", result="hit")
+            return row[0]
+
+    def put(self, key: str, value: str) -> None:
+        """Store a value and evict least recently used entries above max_bytes."""
+        size = len(value.encode())
+        save = False
+        with self._lock:
+            self._sync_total()
+            replaced = self._conn.execute("SELECT size FROM results WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, size, time.time())
+            )
+            self._total += size - (replaced[0] if replaced else 0)
+            self._evict()
+            self._conn.commit()
+            pending = self._pending.pop(key, None)
+            if pending is not None:
+                self.hash_index.add(*pending, bytes.fromhex(key))
+                self._unsaved += 1
+                save = self._unsaved >= _SAVE_EVERY
+        if save:
+            self.save_index()
+
+    def save_index(self) -> None:
+        """Write the near-duplicate index to disk (no-op without one or for :memory:)."""
+        if self.hash_index is None or self._index_path is None:
+            return
+        with self._lock:
+            self._unsaved = 0
+            index = self.hash_index
+        index.save(self._index_path)
+
+    def _stored_bytes(self) -> int:
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+
+    def _data_version(self) -> int:
+        # Changes whenever another connection commits to the file, never for this connection's own writes
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _sync_total(self) -> None:
+        version = self._data_version()
+        if version != self._version:
+            self._version = version
+            self._total = self._stored_bytes()
+
+    def _evict(self) -> None:
+        if self._total <= self.max_bytes:
+            return
+        total = self._total
+        rows = self._conn.execute("SELECT key, size FROM results ORDER BY last_access").fetchall()
+        stale = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM results WHERE key = ?", stale)
+        self._total = total
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+            self._conn.commit()
+            self._total = 0
+            self._pending.clear()
+            if self.hash_index is not None:
+                self.hash_index = HashIndex()
+        self.save_index()
+
+    def stats(self) -> dict:
+        """Hit/miss counters for this instance plus current size on disk."""
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results"
+            ).fetchone()
+        stats = {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": entries,
+            "size_bytes": size,
+            "max_bytes": self.max_bytes
+        }
+        if self.hash_index is not None:
+            stats.update(
+                near_hits=self.near_hits,
+                hash_entries=len(self.hash_index),
+                hash_index_bytes=self.hash_index.nbytes
+            )
+        return stats
+
+    def close(self) -> None:
+        self.save_index()
+        self._conn.close()
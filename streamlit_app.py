@@ -1,60 +1,160 @@
 #in terminal: streamlit run streamlit_app.py
 
 import streamlit as st
-from PIL import Image
-import io
+import logging
+import os
+import asyncio
+import time
 
-from ollama_utils import OllamaClient
+import telemetry
 
-from ollama_ocr import OCRProcessor
-import tempfile
+# Everything heavy (OpenCV, numpy, pandas, aiohttp, PyMuPDF, the OCR engines) is
+# imported where it is first needed, so the upload page renders without it.
+# Python keeps imported modules, so only the first use pays the import.
 
-import cv2
-import numpy as np
-import pandas as pd
+logger = logging.getLogger(__name__)
 
-import re
-
-import requests
+# Start the service with: python extraction_service.py
+SERVICE_URL = os.getenv("EXTRACTION_SERVICE_URL", "http://127.0.0.1:8765")
+HISTORY_DIR = os.getenv("LABSNAP_HISTORY_DIR", "history")
 
 def get_installed_ollama_models(base_url="http://localhost:11434"):
+    # Cached with a TTL by the registry, so reruns do not hit /api/tags every time
+    from model_registry import get_registry
+
     try:
-        response = requests.get(f"{base_url}/api/tags")
-        response.raise_for_status()
-        models = response.json().get("models", [])
-        return [model["name"] for model in models]
+        return get_registry(base_url).installed_models()
     except Exception as e:
         return [f"Errore: {str(e)}"]
 
-#help(OCRProcessor.process_image)
-
-def preprocess_image(pil_image):
-    img = np.array(pil_image.convert("L"))  # Convert to grayscale
-    img = cv2.resize(img, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
-    img = cv2.GaussianBlur(img, (5, 5), 0)
-    _, img = cv2.threshold(img, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-    return Image.fromarray(img)
-
-
-def extract_values(text):
-    lines = text.split("\n")
-    results = []
-    pattern = r"([A-Za-z0-9 #\(\)/%µ\^\-]+?)\s+([\d.,]+)\s*([a-zA-Z/µ^%³]+)?"
-
-    for line in lines:
-        match = re.match(pattern, line.strip())
-        if match:
-            test, value, unit = match.groups()
-            try:
-                value_float = float(value.replace(",", "."))
-                results.append({
-                    "Test": test.strip(),
-                    "Value": value_float,
-                    "Unit": unit or ""
-                })
-            except:
-                continue
-    return results
+
+@st.cache_resource
+def get_result_cache():
+    from result_cache import ResultCache
+
+    # Opt-in: LABSNAP_NEAR_DUPLICATES=1 lets re-uploaded copies of a page reuse its result
+    return ResultCache(near_duplicates=os.getenv("LABSNAP_NEAR_DUPLICATES", "").lower() in ("1", "true", "yes"))
+
+
+@st.cache_resource
+def start_metrics_endpoint():
+    # Prometheus scrape target, only when asked for: LABSNAP_METRICS_PORT=9464 streamlit run ...
+    port = os.getenv("LABSNAP_METRICS_PORT")
+    return telemetry.serve_metrics(int(port)) if port else None
+
+
+@st.cache_resource
+def get_history_store():
+    from history_store import HistoryStore
+
+    return HistoryStore(HISTORY_DIR)
+
+
+def show_history_trends():
+    """Trend charts straight from the history store; nothing here runs OCR."""
+    store = get_history_store()
+    patient = st.selectbox("Patient:", [""] + store.patients(), format_func=lambda p: p or "(no patient ID)")
+    counts = store.tests(patient)
+    if counts.empty:
+        st.info("No stored values for this patient yet.")
+        return
+    tests = st.multiselect("Tests:", list(counts.index), default=list(counts.index[:3]),
+                           format_func=lambda code: f"{code} ({counts[code]} values)")
+    for code in tests:
+        trend = store.trend(code, patient)
+        units = [u for u in trend["unit"].unique() if u]
+        st.caption(f"{code}" + (f" ({', '.join(units)})" if units else ""))
+        st.line_chart(trend.set_index("ts")["value"])
+
+
+def show_debug_panel():
+    import pandas as pd
+
+    with st.expander("🔧 Debug: stage timings"):
+        st.dataframe(pd.DataFrame(telemetry.stage_summary()))
+        st.caption("Latest spans")
+        st.dataframe(pd.DataFrame(telemetry.recent_spans(50)))
+        st.code(telemetry.render_prometheus(), language="text")
+
+
+@st.cache_resource
+def get_service_client():
+    from extraction_service import ExtractionClient
+
+    return ExtractionClient(SERVICE_URL)
+
+
+def extract_with_service(client, data, model_name, prompt):
+    """Hand the upload to the extraction service and wait for its job; reruns of the same upload reuse the job."""
+    job = client.submit(data, model_name, prompt)
+    status = st.empty()
+    while job["status"] not in ("done", "error"):
+        status.caption(f"Job {job['id'][:8]}: {job['status']}")
+        job = client.job(job["id"], wait=5)
+    status.empty()
+    if job["status"] == "error":
+        raise RuntimeError(job["error"])
+    return job["text"], job["values"]
+
+
+def stream_ollama_markdown(image, model_name, prompt, cache):
+    """
+    Call Ollama directly and render the markdown, and the values parsed so far, as tokens arrive.
+
+    Returns:
+        tuple[str, list[dict]]: The whole answer and its values
+    """
+    from async_ollama import AsyncOllamaClient
+    from extraction import StreamingValueParser, extract_values
+    from ollama_scheduler import get_scheduler
+
+    cache_key = cache.make_key(image, model_name, prompt, "markdown-stream")
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return cached, extract_values(cached)
+
+    placeholder = st.empty()
+    live_caption = st.empty()
+    live_table = st.empty()
+    parser = StreamingValueParser()
+    first_row = None
+
+    def show_rows():
+        import pandas as pd
+
+        live_caption.caption(f"{len(parser.values)} values so far, first after {first_row:.1f} s")
+        live_table.dataframe(pd.DataFrame(parser.values))
+
+    async def consume():
+        nonlocal first_row
+        parts = []
+        last_render = 0.0
+        start = time.perf_counter()
+        # The scheduler is shared by all sessions, so concurrent uploads queue up per model instead of thrashing Ollama
+        async with AsyncOllamaClient(scheduler=get_scheduler()) as stream_client:
+            async for token in stream_client.stream_image(image, prompt, model=model_name):
+                parts.append(token)
+                # New rows are shown right away; the markdown itself is re-rendered at most every 0.1 s
+                if parser.feed(token):
+                    if first_row is None:
+                        first_row = time.perf_counter() - start
+                        telemetry.observe("labsnap_stream_first_row_seconds", first_row, model=model_name)
+                    show_rows()
+                if time.perf_counter() - last_render > 0.1:
+                    placeholder.markdown("".join(parts))
+                    last_render = time.perf_counter()
+        parser.finish()
+        text = "".join(parts)
+        placeholder.markdown(text)
+        return text
+
+    result = asyncio.run(consume())
+    # The final table and the CSV download are rendered with the results below
+    live_caption.empty()
+    live_table.empty()
+    cache.put(cache_key, result)
+    return result, parser.values
+
 
 # Page configuration
 
@@ -88,15 +188,28 @@ st.markdown("""
 st.markdown(
     "Upload or photograph a lab report: the app will extract **Test Name**, **Value**, and **Unit of Measure**.")
 
-uploaded_file = st.file_uploader("📷 Upload image (JPG/PNG)", type=["jpg", "jpeg", "png"])
+uploaded_file = st.file_uploader("📷 Upload report (JPG/PNG/PDF/TIFF)", type=["jpg", "jpeg", "png", "pdf", "tif", "tiff"])
 
 
 if uploaded_file:
+    from extraction import extract_values
+    from ingestion import count_pages, iter_pages, merge_results, process_document
+    from layout import DEFAULT_LAYOUT
+    from model_registry import get_registry
+    from ocr_backends import LAB_PROMPT, MARKDOWN_PROMPT, run_ollama_ocr
+    from ollama_scheduler import BATCH
+    from operating_point import get_operating_point, preprocess_for
+    from preprocessing import preprocess_image
+
+    page_count = 1
     try:
-        image = Image.open(uploaded_file).convert("RGB")
-        st.image(image, caption="Uploaded Report", use_container_width=True)# use_container_width=True)
-        image = preprocess_image(Image.open(uploaded_file))
-        st.image(image, caption="Uploaded Report", use_container_width=True)  # use_container_width=True)
+        # Only the first page is rasterized for the preview; the rest stream during analysis
+        page_count = count_pages(uploaded_file.getvalue())
+        first_page = next(iter_pages(uploaded_file.getvalue())).image
+        caption = "Uploaded Report" if page_count == 1 else f"Uploaded Report (page 1 of {page_count})"
+        st.image(first_page.convert("RGB"), caption=caption, use_container_width=True)# use_container_width=True)
+        image = preprocess_image(first_page)
+        st.image(image, caption=caption, use_container_width=True)  # use_container_width=True)
 
 
     except Exception as e:
@@ -119,19 +232,63 @@ if uploaded_file:
             )
 
         elif prompt_choice == "Lab Prompt":
-            custom_prompt = """Using default prompt: Extract all blood count values content from this image **exactly as it appears**, without modification, summarization, or omission.
-            Format the output in markdown table:
-            - output always a table with columns test name, value and unit
-            - Use headers (#, ##, ###) **only if they appear in the image**
-            - Preserve original lists (-, *, numbered lists) as they are
-            - Maintain all text formatting (bold, italics, underlines) exactly as seen
-            - **Do not add, interpret, or restructure any content**
-                """
+            custom_prompt = LAB_PROMPT
 
         st.title("🔍 Select an Ollama Model")
         model_list = get_installed_ollama_models()
         selected_model = st.selectbox("Available Models:", model_list)
         st.write(f"You selected the model: `{selected_model}`")
+        # Load the model in the background while the user is still choosing a prompt
+        if selected_model and not selected_model.startswith("Errore"):
+            get_registry().prewarm([selected_model])
+        # Re-prepared at the size and encoding tuned for this model, if benchmarks.tune has chosen one
+        backend = f"ollama:{selected_model}"
+        operating_point = get_operating_point(backend)
+        if operating_point is not None and image is not None:
+            image = preprocess_for(first_page, backend)
+            st.caption(f"Prepared for `{selected_model}`: {operating_point.label()} "
+                       f"(f1 {operating_point.f1:.2f} on the sample corpus)")
+
+        ensemble_mode = st.checkbox(
+            "Ensemble: ask several models and vote",
+            value=False,
+            help="Sends the page to the chosen models at once and keeps, per row, the value most of them agree on. "
+                 "Stops waiting as soon as they agree. Single-page uploads only."
+        )
+        ensemble_models = []
+        if ensemble_mode:
+            choices = [m for m in model_list if not m.startswith("Errore")]
+            ensemble_models = st.multiselect("Ensemble models:", choices, default=choices[:3])
+            get_registry().prewarm(ensemble_models)
+
+        stream_output = st.checkbox(
+            "Stream output as it is generated",
+            value=True,
+            help="Without the extraction service, sends the image straight to Ollama and shows the answer, "
+                 "and the values read so far, while it is being written."
+        )
+        tile_page = st.checkbox(
+            "Crop and tile the page",
+            value=True,
+            help="Sends only the text area, split into strips for tall reports. Not used while streaming."
+        )
+        layout = DEFAULT_LAYOUT if tile_page else None
+
+        save_history = st.checkbox(
+            "Save values to history",
+            value=True,
+            help="Appends the extracted values to the local history store, for the trend charts below."
+        )
+        patient_id = st.text_input("Patient ID (optional)", help="Stored with the values, so trends can be shown per patient.")
+
+        start_metrics_endpoint()
+        debug_panel = st.checkbox(
+            "Show debug panel",
+            value=telemetry.is_enabled(),
+            help="Times every pipeline stage (for all sessions of this server) and shows the results below."
+        )
+        if debug_panel:
+            telemetry.enable()
 
 
         if st.button("Analyze Image"):
@@ -140,13 +297,6 @@ if uploaded_file:
 
                 try:
 
-                    # Save uploaded PIL image to a temp file
-                    with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as tmp:
-                        image.save(tmp.name)
-                        temp_path = tmp.name
-
-                    ocr = OCRProcessor(model_name=selected_model)  # llama3.2-vision:11b #gemma3:4b
-
                     if prompt_choice != "Ollama-OCR Default Prompt":
                         prompt = custom_prompt
 
@@ -154,34 +304,95 @@ if uploaded_file:
                         prompt = None
 
 
-                    result = ocr.process_image(
-                            image_path=temp_path,
-                            preprocess=False,
-                            format_type="markdown",  # Options: markdown, text, json, structured, key_value
-                            # language="en",
-                            custom_prompt=prompt
-                        )
+                    service = get_service_client()
+                    if ensemble_mode and ensemble_models and page_count == 1:
+                        from ensemble import run_ensemble
+                        from ollama_scheduler import get_scheduler
+
+                        ensemble = run_ensemble(image, ensemble_models, prompt, cache=get_result_cache(),
+                                                scheduler=get_scheduler())
+                        result, data = ensemble.text, ensemble.values
+                        agreed = sum(row["Agreed"] for row in data)
+                        st.caption(f"Ensemble of {len(ensemble_models)} models, quorum {ensemble.quorum}: "
+                                   f"{agreed} of {len(data)} rows agreed in {ensemble.seconds:.1f} s"
+                                   + (" (stopped early)" if ensemble.early_exit else ""))
+                        st.dataframe(ensemble.report())
+
+                    elif service.is_available():
+                        # OCR runs in the extraction service, off this session's script thread
+                        result, data = extract_with_service(service, uploaded_file.getvalue(), selected_model, prompt)
+
+                    # Same preprocessed image, model and prompt are served from the result cache
+                    elif stream_output and page_count == 1:
+                        # Without the service, values appear in a live table while the model is still writing
+                        result, data = stream_ollama_markdown(image, selected_model, prompt or MARKDOWN_PROMPT, get_result_cache())
+
+                    elif page_count > 1:
+                        # Pages are rasterized, recognized and parsed one at a time
+                        progress = st.progress(0.0, text=f"Page 1 of {page_count}")
+                        page_results = []
+                        for page_result in process_document(
+                                uploaded_file.getvalue(),
+                                # Whole documents yield to single-image uploads of other sessions
+                                lambda page: run_ollama_ocr(page, selected_model, prompt, get_result_cache(), layout,
+                                                            priority=BATCH),
+                                preprocess=lambda page: preprocess_for(page, backend)
+                        ):
+                            page_results.append(page_result)
+                            progress.progress(page_result.number / page_count,
+                                              text=f"Page {page_result.number} of {page_count}")
+                            if page_result.error:
+                                st.warning(f"Page {page_result.number}: {page_result.error}")
+                        result = "\n\n".join(f"<!-- page {r.number} -->\n{r.text}" for r in page_results)
+                        data = merge_results(page_results).to_dict("records")
 
-                    print('#####################')
-                    print(result)
+                    else:
+                        result = run_ollama_ocr(
+                                image,
+                                model_name=selected_model,  # llama3.2-vision:11b #gemma3:4b
+                                prompt=prompt,
+                                cache=get_result_cache(),
+                                layout=layout
+                            )
+                        data = extract_values(result)
+
+                    logger.debug("Recognized text:\n%s", result)
 
                     st.subheader("📝 Results:")
                     st.text_area("Recognized Text", result, height=200)
 
-                    data = extract_values(result)
-
                     if data:
-                        df = pd.DataFrame(data)
+                        import pandas as pd
+
+                        with telemetry.span("dataframe", rows=len(data)):
+                            df = pd.DataFrame(data)
                         st.success("✅ Values extracted successfully")
                         st.dataframe(df)
-                        csv = df.to_csv(index=False).encode('utf-8')
+                        with telemetry.span("csv") as s:
+                            csv = df.to_csv(index=False).encode('utf-8')
+                            s.set("bytes", len(csv))
                         st.download_button("📥 Download as CSV", data=csv, file_name="lab_report_values.csv", mime="text/csv")
+                        if save_history:
+                            from result_cache import image_digest
+
+                            model_label = ("ensemble:" + "+".join(ensemble_models)
+                                           if ensemble_mode and ensemble_models and page_count == 1 else selected_model)
+                            stored = get_history_store().append(df, model=model_label, image_hash=image_digest(image),
+                                                                patient=patient_id.strip(), source=uploaded_file.name)
+                            if not stored:
+                                st.caption("These values are already in the history.")
                     else:
                         st.warning("No values were recognized.")
 
                 except Exception as e:
                     st.error(f"Error during analysis: {str(e)}")
 
+            if debug_panel:
+                show_debug_panel()
+
+if st.checkbox("📈 Show trends from history"):
+    show_history_trends()
+
 # Footer
 st.markdown("---")
 st.markdown("*Powered by Breeflee and Ollama*")
\ No newline at end of file
@@ -0,0 +1,187 @@
+import json
+from typing import Any, Iterable, Optional
+
+from extraction import LabValue, parse_number
+
+# JSON schema passed as Ollama's "format", so decoding is constrained to this shape
+LAB_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "text_blocks": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "test_name": {"type": "string"},
+                    "value": {"type": "number"},
+                    "unit": {"type": "string"}
+                },
+                "required": ["test_name", "value", "unit"]
+            }
+        }
+    },
+    "required": ["text_blocks"]
+}
+
+ROW_KEYS = ("test_name", "value")
+
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+class IncrementalRowParser:
+    """
+    Pull complete rows out of a JSON document while it is still being streamed.
+
+    Every object that is an element of an array (e.g. each entry of
+    "text_blocks") is decoded as soon as its closing brace arrives, so rows
+    can be shown before the model has finished. The scanner also remembers
+    where the document could be cut cleanly, which repair() uses when the
+    stream ends early.
+    """
+
+    def __init__(self):
+        # Chunks are kept as received and only joined when the whole text is asked for,
+        # so feeding a long stream stays linear
+        self._chunks: list[str] = []
+        self._length = 0
+        self._nonblank = False
+        # Text from the start of the outermost open row, enough to decode any row that closes
+        self._window = ""
+        self._window_start = 0
+        self._open_rows = 0
+        self._stack: list[str] = []
+        self._starts: list[Optional[int]] = []
+        self._in_string = False
+        self._escaped = False
+        # (offset, open containers) after which the document is valid once closed
+        self._safe_points: list[tuple[int, tuple]] = []
+
+    @property
+    def text(self) -> str:
+        """Everything fed so far."""
+        if len(self._chunks) > 1:
+            self._chunks = ["".join(self._chunks)]
+        return self._chunks[0] if self._chunks else ""
+
+    def feed(self, chunk: str) -> list[dict]:
+        """Add streamed text and return the rows completed by it."""
+        base = self._length
+        self._chunks.append(chunk)
+        self._length += len(chunk)
+        self._nonblank = self._nonblank or bool(chunk.strip())
+        if self._open_rows:
+            self._window += chunk
+        rows = []
+        for offset, char in enumerate(chunk):
+            i = base + offset
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                # Objects directly inside an array are the rows
+                is_row = char == "{" and self._stack[-1:] == ["["]
+                if is_row:
+                    if not self._open_rows:
+                        self._window, self._window_start = chunk[offset:], i
+                    self._open_rows += 1
+                self._starts.append(i if is_row else None)
+                self._stack.append(char)
+                self._safe_points.append((i + 1, tuple(self._stack)))
+            elif char in "}]" and self._stack:
+                self._stack.pop()
+                start = self._starts.pop()
+                if start is not None:
+                    self._open_rows -= 1
+                    try:
+                        row = json.loads(self._window[start - self._window_start:i + 1 - self._window_start])
+                    except json.JSONDecodeError:
+                        row = None
+                    if isinstance(row, dict):
+                        rows.append(row)
+                self._safe_points.append((i + 1, tuple(self._stack)))
+            elif char == "," and self._stack:
+                self._safe_points.append((i, tuple(self._stack)))
+        return rows
+
+    @property
+    def complete(self) -> bool:
+        return not self._stack and not self._in_string and self._nonblank
+
+    def repair(self) -> Optional[Any]:
+        """
+        Best-effort parse of a truncated document.
+
+        The text is cut back to the last point where every value so far was
+        complete and the open brackets are closed. Returns None when nothing
+        usable was received.
+        """
+        text = self.text
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            pass
+        for offset, stack in reversed(self._safe_points):
+            candidate = text[:offset] + "".join(_CLOSERS[c] for c in reversed(stack))
+            try:
+                return json.loads(candidate)
+            except json.JSONDecodeError:
+                continue
+        return None
+
+
+def _number(value) -> Optional[float]:
+    """The value as a float, or None when it is not numeric (e.g. "N/A", "neg", "<0.5 (see note)")."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return parse_number(value.strip())
+        except ValueError:
+            return None
+    return None
+
+
+def is_complete_row(row: dict) -> bool:
+    """Whether a row has a test name and a value; non-numeric values count, they are kept as text."""
+    if not all(key in row for key in ROW_KEYS):
+        return False
+    value = row["value"]
+    return _number(value) is not None or (isinstance(value, str) and value.strip() != "")
+
+
+def rows_to_values(rows: Iterable[dict]) -> list[dict]:
+    """
+    Convert schema rows to the Test/Value/Unit/Reference/Flag dicts used everywhere else.
+
+    Values that are not numbers keep the model's text, which normalization reads as missing.
+    """
+    values = []
+    for row in rows:
+        if not is_complete_row(row):
+            continue
+        number = _number(row["value"])
+        value = LabValue(str(row["test_name"]).strip(), number or 0.0, str(row.get("unit") or "").strip()).as_dict()
+        if number is None:
+            value["Value"] = str(row["value"]).strip()
+        values.append(value)
+    return values
+
+
+def rows_from_document(document: Any) -> list[dict]:
+    """The complete rows of a parsed (or repaired) response."""
+    if isinstance(document, dict):
+        rows = document.get("text_blocks", [])
+    elif isinstance(document, list):
+        rows = document
+    else:
+        return []
+    return [row for row in rows if isinstance(row, dict) and is_complete_row(row)]
@@ -0,0 +1,294 @@
+import bisect
+import contextvars
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+# Seconds; covers everything from a regex pass to a slow vision-model call
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+DEFAULT_METRICS_PORT = 9464
+
+_enabled = os.getenv("LABSNAP_TRACING", "").lower() in ("1", "true", "yes")
+_lock = threading.Lock()
+_counters: dict[tuple, float] = {}
+_histograms: dict[tuple, "Histogram"] = {}
+_gauges: dict[tuple, float] = {}
+_help: dict[str, tuple[str, str]] = {}
+_recent: deque = deque(maxlen=500)
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+_span_ids = itertools.count(1)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style."""
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th observation, e.g. q=0.95 for p95."""
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+def enable(on: bool = True) -> None:
+    """Turn tracing on or off for the whole process."""
+    global _enabled
+    _enabled = on
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return (name, tuple(sorted(labels.items())))
+
+
+def describe(name: str, kind: str, text: str) -> None:
+    _help[name] = (kind, text)
+
+
+def inc(name: str, value: float = 1.0, **labels) -> None:
+    """Add to a counter. No-op while tracing is disabled."""
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0.0) + value
+
+
+def observe(name: str, value: float, **labels) -> None:
+    """Record a histogram observation. No-op while tracing is disabled."""
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram()
+        histogram.observe(value)
+
+
+def set_gauge(name: str, value: float, **labels) -> None:
+    """Set a gauge to its current value. No-op while tracing is disabled."""
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = value
+
+
+class Span:
+    """
+    A timed stage. Attributes set on it (bytes, rows, model...) end up in the
+    recent-span log; its duration goes to the labsnap_stage_seconds histogram.
+    """
+
+    __slots__ = ("name", "attributes", "span_id", "parent_id", "start", "seconds", "error", "_token")
+
+    def __init__(self, name: str, attributes: dict):
+        self.name = name
+        self.attributes = attributes
+        self.span_id = next(_span_ids)
+        parent = _current_span.get()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.seconds = 0.0
+        self.error = ""
+
+    def set(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def __enter__(self) -> "Span":
+        self._token = _current_span.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.seconds = time.perf_counter() - self.start
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # Closed from another context, e.g. an async generator finalized by the event loop
+            pass
+        if exc_type is not None:
+            self.error = exc_type.__name__
+            inc("labsnap_stage_errors_total", stage=self.name)
+        observe("labsnap_stage_seconds", self.seconds, stage=self.name)
+        with _lock:
+            _recent.append(self)
+
+
+class _NullSpan:
+    """Shared stand-in returned while tracing is disabled; every method is a no-op."""
+
+    __slots__ = ()
+
+    def set(self, key: str, value) -> None:
+        pass
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name: str, **attributes):
+    """
+    Time a pipeline stage:
+
+        with telemetry.span("preprocess") as s:
+            ...
+            s.set("pixels", w * h)
+
+    While tracing is disabled this returns a shared no-op object, so the cost
+    is one function call and a flag check.
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return Span(name, attributes)
+
+
+def recent_spans(limit: int = 100) -> list[dict]:
+    """The last finished spans, newest first, as plain dicts for display."""
+    with _lock:
+        spans = list(_recent)[-limit:]
+    return [
+        {
+            "id": s.span_id,
+            "parent": s.parent_id,
+            "stage": s.name,
+            "ms": round(s.seconds * 1000, 2),
+            "error": s.error,
+            **s.attributes
+        }
+        for s in reversed(spans)
+    ]
+
+
+def stage_summary() -> list[dict]:
+    """Count, mean and approximate p50/p95 per stage, for the debug panel."""
+    with _lock:
+        items = [(dict(labels).get("stage", ""), h) for (name, labels), h in _histograms.items()
+                 if name == "labsnap_stage_seconds"]
+    return [
+        {
+            "stage": stage,
+            "count": h.count,
+            "mean_ms": round(h.sum / h.count * 1000, 2) if h.count else 0.0,
+            "p50_le_ms": h.quantile(0.5) * 1000,
+            "p95_le_ms": h.quantile(0.95) * 1000
+        }
+        for stage, h in sorted(items, key=lambda item: item[0])
+    ]
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+        _gauges.clear()
+        _recent.clear()
+
+
+def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v)}"' for k, v in pairs) + "}"
+
+
+def render_prometheus() -> str:
+    """All counters, gauges and histograms in the Prometheus text exposition format."""
+    with _lock:
+        counters = sorted(_counters.items())
+        gauges = sorted(_gauges.items())
+        histograms = sorted(_histograms.items(), key=lambda item: item[0])
+    lines, described = [], set()
+
+    def header(name: str, kind: str) -> None:
+        if name not in described:
+            described.add(name)
+            lines.append(f"# HELP {name} {_help.get(name, (kind, name))[1]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), value in counters:
+        header(name, "counter")
+        lines.append(f"{name}{_format_labels(labels)} {value:g}")
+    for (name, labels), value in gauges:
+        header(name, "gauge")
+        lines.append(f"{name}{_format_labels(labels)} {value:g}")
+    for (name, labels), h in histograms:
+        header(name, "histogram")
+        cumulative = 0
+        for bound, count in zip(h.buckets + (float("inf"),), h.counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else f"{bound:g}"
+            lines.append(f"{name}_bucket{_format_labels(labels, (('le', le),))} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {h.sum:.6f}")
+        lines.append(f"{name}_count{_format_labels(labels)} {h.count}")
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+def serve_metrics(port: int = DEFAULT_METRICS_PORT, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve /metrics from a daemon thread and enable tracing. Returns the server so it can be shut down."""
+    enable()
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+
+describe("labsnap_stage_seconds", "histogram", "Wall time per pipeline stage")
+describe("labsnap_stage_errors_total", "counter", "Stages that raised")
+describe("labsnap_ollama_ttft_seconds", "histogram", "Time from request to first Ollama token")
+describe("labsnap_ollama_bytes_sent_total", "counter", "Request bytes sent to Ollama")
+describe("labsnap_ollama_requests_total", "counter", "Ollama requests by outcome")
+describe("labsnap_cache_lookups_total", "counter", "Result cache lookups by hit/miss")
+describe("labsnap_cache_near_duplicates_total", "counter", "Cache keys redirected to a near-duplicate image seen before")
+describe("labsnap_service_job_seconds", "histogram", "Extraction service job latency, submit to finish")
+describe("labsnap_service_queue_wait_seconds", "histogram", "Time jobs spend queued before a worker takes them")
+describe("labsnap_stream_first_row_seconds", "histogram", "Time from request to the first value parsed from a streamed answer")
+describe("labsnap_ensemble_model_seconds", "histogram", "Ensemble time per model, by outcome (done, error, cancelled)")
+describe("labsnap_scheduler_queue_depth", "gauge", "Ollama requests waiting in the scheduler, by model and priority")
+describe("labsnap_scheduler_in_flight", "gauge", "Ollama requests the scheduler let through that are still running")
+describe("labsnap_scheduler_wait_seconds", "histogram", "Time requests wait in the scheduler before being sent to Ollama")
+describe("labsnap_scheduler_concurrency_limit", "gauge", "Measured concurrency cap per model")
+describe("labsnap_scheduler_model_loads_total", "counter", "Models the scheduler switched Ollama to")
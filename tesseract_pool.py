@@ -0,0 +1,250 @@
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Iterator, Optional
+
+import numpy as np
+from PIL import Image
+
+import telemetry
+from layout import Box, find_text_blocks
+
+logger = logging.getLogger(__name__)
+
+# A band should hold a few text lines, so Tesseract's own layout analysis still has context
+MIN_LINES_PER_BAND = 4
+BAND_MARGIN = 8
+
+
+@dataclass
+class Word:
+    """One recognized word with its confidence (0-100) and (x, y, w, h) box on the page."""
+    text: str
+    confidence: float
+    box: Box
+
+
+@dataclass
+class PageText:
+    """Text of a page together with its words, in reading order."""
+    text: str
+    words: list[Word] = field(default_factory=list)
+    bands: int = 1
+    seconds: float = 0.0
+
+    @property
+    def confidences(self) -> list[float]:
+        return [word.confidence for word in self.words]
+
+
+def has_tesserocr() -> bool:
+    """Whether the tesserocr binding (persistent in-process engines) is installed."""
+    try:
+        import tesserocr  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def default_workers() -> int:
+    # Inside a process-pool worker the pages are already spread over the cores
+    if multiprocessing.parent_process() is not None:
+        return 1
+    return max(1, min(4, os.cpu_count() or 1))
+
+
+def split_bands(binary: np.ndarray, parts: int, margin: int = BAND_MARGIN) -> list[tuple[int, int]]:
+    """
+    Group the detected text blocks of a page into full-width horizontal bands.
+
+    Blocks that overlap vertically form one text line, and bands are only cut
+    between lines, so a test name is never separated from its value and unit.
+    Each band gets about the same number of lines and at least MIN_LINES_PER_BAND.
+
+    Args:
+        binary: Preprocessed page as a grayscale array
+        parts: Bands wanted; fewer are returned for short pages
+        margin: Rows of padding kept above and below each band
+
+    Returns:
+        list[tuple[int, int]]: (top, bottom) row spans, top to bottom
+    """
+    h = binary.shape[0]
+    blocks = sorted(find_text_blocks(binary), key=lambda box: box[1])
+    lines: list[list[int]] = []
+    for _, y, _, bh in blocks:
+        if lines and y < lines[-1][1]:
+            lines[-1][1] = max(lines[-1][1], y + bh)
+        else:
+            lines.append([y, y + bh])
+    parts = min(parts, len(lines) // MIN_LINES_PER_BAND)
+    if parts <= 1:
+        return [(0, h)]
+
+    cuts = [round(i * len(lines) / parts) for i in range(parts + 1)]
+    spans = []
+    for first, last in zip(cuts, cuts[1:]):
+        top, bottom = lines[first][0], lines[last - 1][1]
+        spans.append((max(top - margin, 0), min(bottom + margin, h)))
+    # The first and last bands reach the page edges, so nothing outside the detected blocks is lost
+    spans[0] = (0, spans[0][1])
+    spans[-1] = (spans[-1][0], h)
+    return spans
+
+
+class TesseractPool:
+    """
+    Tesseract engines that stay loaded between pages, recognizing bands of a page in parallel.
+
+    With tesserocr installed every engine is a TessBaseAPI that loads its
+    languages once, so a page costs only the recognition itself; tesserocr
+    releases the GIL while recognizing, so threads use all cores. Without it
+    pages go through pytesseract, which spawns a tesseract process and
+    reloads the languages per call; a page is then recognized whole, in one
+    call, so it costs no more spawns than before the pool.
+
+    Args:
+        lang: Tesseract languages, e.g. "eng+ita"
+        workers: Engines, and bands recognized at once. Defaults to the cores
+            (at most 4), or 1 inside a process-pool worker
+        psm: Page segmentation mode applied to every band
+    """
+
+    def __init__(self, lang: str, workers: Optional[int] = None, psm: int = 3):
+        self.lang = lang
+        self.workers = workers or default_workers()
+        self.psm = psm
+        self.persistent = has_tesserocr()
+        if not self.persistent:
+            logger.info("tesserocr is not installed; Tesseract falls back to one process per page")
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def engines(self) -> int:
+        """Engines loaded so far; they are created on first use, up to workers."""
+        return self._created
+
+    def _new_engine(self):
+        from tesserocr import PyTessBaseAPI
+
+        with telemetry.span("tesseract_engine_load", lang=self.lang):
+            return PyTessBaseAPI(lang=self.lang, psm=self.psm)
+
+    @contextmanager
+    def _engine(self) -> Iterator:
+        try:
+            engine = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.workers
+                if create:
+                    self._created += 1
+            if not create:
+                engine = self._idle.get()
+            else:
+                try:
+                    engine = self._new_engine()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+        try:
+            yield engine
+        finally:
+            self._idle.put(engine)
+
+    def _recognize_band(self, band: Image.Image, top: int) -> tuple[str, list[Word]]:
+        if not self.persistent:
+            return _run_pytesseract(band, self.lang, self.psm, top)
+        from tesserocr import RIL, iterate_level
+
+        with self._engine() as api:
+            api.SetImage(band)
+            api.Recognize()
+            text = api.GetUTF8Text()
+            words = []
+            iterator = api.GetIterator()
+            for word in iterate_level(iterator, RIL.WORD) if iterator is not None else ():
+                value = word.GetUTF8Text(RIL.WORD)
+                box = word.BoundingBox(RIL.WORD)
+                if not value or not value.strip() or box is None:
+                    continue
+                x0, y0, x1, y1 = box
+                words.append(Word(value, float(word.Confidence(RIL.WORD)), (x0, y0 + top, x1 - x0, y1 - y0)))
+        return text, words
+
+    def recognize(self, image: Image.Image) -> PageText:
+        """
+        Recognize a preprocessed page.
+
+        Args:
+            image: Preprocessed (binarized or grayscale) page
+
+        Returns:
+            PageText: Text, band by band from top to bottom, and word confidences
+        """
+        start = time.perf_counter()
+        gray = image if image.mode == "L" else image.convert("L")
+        with telemetry.span("tesseract", lang=self.lang, persistent=self.persistent) as s:
+            spans = [(0, gray.height)]
+            # Every pytesseract call is a process spawn and a language load, more than a band saves
+            if self.persistent and self.workers > 1:
+                spans = split_bands(np.asarray(gray), self.workers * 2)
+            s.set("bands", len(spans))
+            bands = [gray.crop((0, top, gray.width, bottom)) for top, bottom in spans]
+            if len(bands) == 1:
+                results = [self._recognize_band(bands[0], 0)]
+            else:
+                with self._lock:
+                    if self._executor is None:
+                        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="tesseract")
+                results = list(self._executor.map(self._recognize_band, bands, [top for top, _ in spans]))
+        text = "\n".join(band_text.strip("\n") for band_text, _ in results if band_text.strip())
+        words = [word for _, band_words in results for word in band_words]
+        return PageText(text, words, len(spans), time.perf_counter() - start)
+
+    def close(self) -> None:
+        """Free the engines and stop the band threads."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        while True:
+            try:
+                engine = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            engine.End()
+            self._created -= 1
+
+
+def _run_pytesseract(band: Image.Image, lang: str, psm: int, top: int) -> tuple[str, list[Word]]:
+    import pytesseract
+
+    data = pytesseract.image_to_data(band, lang=lang, config=f"--psm {psm}", output_type=pytesseract.Output.DICT)
+    lines: dict[tuple, list[str]] = {}
+    words = []
+    for i, value in enumerate(data["text"]):
+        confidence = float(data["conf"][i])
+        if confidence < 0 or not value.strip():
+            continue
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        lines.setdefault(key, []).append(value)
+        box = (data["left"][i], data["top"][i] + top, data["width"][i], data["height"][i])
+        words.append(Word(value, confidence, box))
+    return "\n".join(" ".join(line) for line in lines.values()), words
+
+
+@lru_cache(maxsize=None)
+def get_pool(lang: str, workers: Optional[int] = None) -> TesseractPool:
+    """Shared pool per language set (and per process), so engines are loaded once and reused."""
+    return TesseractPool(lang, workers)
@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+
+import fake_ollama
+from async_ollama import AsyncOllamaClient, OllamaError, OllamaResponseError
+
+
+async def _serve(app: web.Application) -> tuple[web.AppRunner, str]:
+    # Ephemeral port, so tests never collide with a real Ollama or each other
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+def _run(app: web.Application, scenario, **client_options):
+    async def main():
+        runner, url = await _serve(app)
+        try:
+            async with AsyncOllamaClient(url, backoff=0.01, **client_options) as client:
+                return await scenario(client)
+        finally:
+            await runner.cleanup()
+    return asyncio.run(main())
+
+
+def test_stream_reproduces_the_response():
+    app = fake_ollama.create_app(token_delay=0.001)
+
+    async def scenario(client):
+        return [token async for token in client.stream_generate("gemma3:4b", "read")]
+
+    tokens = _run(app, scenario)
+    assert len(tokens) > 1
+    assert "".join(tokens) == fake_ollama.DEFAULT_RESPONSE
+
+
+def test_requests_in_flight_stay_within_the_limit():
+    app = fake_ollama.create_app(token_delay=0.002)
+
+    async def scenario(client):
+        return await asyncio.gather(*(client.generate("gemma3:4b", f"read {i}") for i in range(6)))
+
+    results = _run(app, scenario, max_in_flight=2)
+    assert results == [fake_ollama.DEFAULT_RESPONSE] * 6
+    assert app["stats"]["requests"] == 6
+    assert app["stats"]["max_in_flight"] == 2
+
+
+def test_unavailable_server_is_retried():
+    app = fake_ollama.create_app(token_delay=0.001, fail_first=2)
+
+    async def scenario(client):
+        return await client.generate("gemma3:4b", "read")
+
+    assert _run(app, scenario) == fake_ollama.DEFAULT_RESPONSE
+    assert app["stats"]["requests"] == 3
+
+
+def test_retries_give_up_with_an_ollama_error():
+    app = fake_ollama.create_app(token_delay=0.001, fail_first=5)
+
+    async def scenario(client):
+        return await client.generate("gemma3:4b", "read")
+
+    with pytest.raises(OllamaError, match="HTTP 503"):
+        _run(app, scenario, max_retries=1)
+
+
+def test_malformed_line_is_a_typed_error():
+    app = fake_ollama.create_app(token_delay=0.001, malformed_after=3)
+    received = []
+
+    async def scenario(client):
+        async for token in client.stream_generate("gemma3:4b", "read"):
+            received.append(token)
+
+    with pytest.raises(OllamaResponseError, match="Malformed line"):
+        _run(app, scenario)
+    assert "".join(received) == "".join(fake_ollama._tokenize(fake_ollama.DEFAULT_RESPONSE)[:3])
@@ -0,0 +1,49 @@
+import pytest
+
+from extraction import extract_values, parse_number
+
+
+def test_dotted_date_line_is_skipped():
+    text = "Data prelievo 12.03.2024\nHemoglobin 13,5 g/dL 12.0-16.0 L"
+    assert extract_values(text) == [
+        {"Test": "Hemoglobin", "Value": 13.5, "Unit": "g/dL", "Reference": "12-16", "Flag": "L"}
+    ]
+
+
+def test_thousands_grouped_value():
+    values = extract_values("Glucose 1,234,567 mg/dL\nPLT 1.234.567,5 /µL")
+    assert [(row["Test"], row["Value"], row["Unit"]) for row in values] == [
+        ("Glucose", 1234567.0, "mg/dL"),
+        ("PLT", 1234567.5, "/µL")
+    ]
+
+
+@pytest.mark.parametrize("token", ["12.03.2024", "192.168.0.1", "1,23,4", "1,2.3"])
+def test_repeated_separators_that_are_not_thousands_groups(token):
+    with pytest.raises(ValueError):
+        parse_number(token)
+
+
+@pytest.mark.parametrize("line, expected", [
+    ("HCT 42%", ("HCT", 42.0, "%")),
+    ("MCV 88fL", ("MCV", 88.0, "fL")),
+    ("Hemoglobin 13.5g/dL", ("Hemoglobin", 13.5, "g/dL")),
+    ("Glucose 95mg/dL", ("Glucose", 95.0, "mg/dL")),
+    ("Neutrofili 55,2%", ("Neutrofili", 55.2, "%")),
+])
+def test_unit_glued_to_value_in_line(line, expected):
+    [row] = extract_values(line)
+    assert (row["Test"], row["Value"], row["Unit"]) == expected
+
+
+def test_unit_glued_to_value_in_table():
+    text = "| Test | Value | Reference |\n|---|---|---|\n| HCT | 42% | 36-46 |\n| MCV | 88fL H | 80-100 |"
+    assert extract_values(text) == [
+        {"Test": "HCT", "Value": 42.0, "Unit": "%", "Reference": "36-46", "Flag": ""},
+        {"Test": "MCV", "Value": 88.0, "Unit": "fL", "Reference": "80-100", "Flag": "H"}
+    ]
+
+
+def test_letters_after_digits_are_not_always_a_unit():
+    [row] = extract_values("Vitamina D 25OH 30 ng/mL")
+    assert (row["Test"], row["Value"], row["Unit"]) == ("Vitamina D 25OH", 30.0, "ng/mL")
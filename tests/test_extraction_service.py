@@ -0,0 +1,70 @@
+import asyncio
+
+from aiohttp.test_utils import TestClient, TestServer
+
+import fake_ollama
+from benchmarks.service import synthetic_upload
+from extraction_service import ExtractionService
+
+
+def _two_page_pdf() -> bytes:
+    import pymupdf
+
+    doc = pymupdf.open()
+    for number in (1, 2):
+        doc.new_page(width=300, height=400).insert_text((40, 60), f"Page {number}")
+    return doc.tobytes()
+
+
+def _run(scenario):
+    async def main():
+        async with TestServer(fake_ollama.create_app(token_delay=0.001)) as ollama:
+            service = ExtractionService(str(ollama.make_url("")).rstrip("/"), workers=2, default_model="gemma3:4b")
+            async with TestClient(TestServer(service.create_app())) as client:
+                return await scenario(client)
+    return asyncio.run(main())
+
+
+async def _result(client: TestClient, data: bytes) -> tuple[int, dict]:
+    response = await client.post("/extract", data=data)
+    submitted = await response.json()
+    job = submitted
+    while job["status"] not in ("done", "error"):
+        job = await (await client.get(f"/jobs/{submitted['id']}", params={"wait": 5})).json()
+    return response.status, job
+
+
+def test_submitted_job_is_extracted():
+    async def scenario(client):
+        upload = synthetic_upload(0)
+        first = await _result(client, upload)
+        # The same upload is answered from the existing job
+        second = await _result(client, upload)
+        return first, second
+
+    (status, job), (again_status, again) = _run(scenario)
+    assert status == 202 and again_status == 200
+    assert job["status"] == "done", job["error"]
+    assert job["text"] == fake_ollama.DEFAULT_RESPONSE
+    assert [(row["Page"], row["Test"], row["Value"]) for row in job["values"]] == [
+        (1, "Hemoglobin", 13.5), (1, "WBC", 6.2), (1, "Platelets", 250.0), (1, "MCV", 88.0)
+    ]
+    assert again["id"] == job["id"]
+
+
+def test_pages_of_concurrent_documents_are_all_extracted():
+    async def scenario(client):
+        pdf = _two_page_pdf()
+        return await asyncio.gather(*(_result(client, data) for data in (pdf, pdf + b"\n%second copy\n")))
+
+    for _, job in _run(scenario):
+        assert job["status"] == "done", job["error"]
+        assert job["pages"] == 2
+        assert sorted({row["Page"] for row in job["values"]}) == [1, 2]
+
+
+def test_unknown_job_is_404():
+    async def scenario(client):
+        return (await client.get("/jobs/missing")).status
+
+    assert _run(scenario) == 404
@@ -0,0 +1,56 @@
+import pytest
+
+from history_store import HistoryStore
+
+REPORT = [
+    {"Test": "Hemoglobin", "Value": 13.5, "Unit": "g/dL", "Reference": "12-16", "Flag": ""},
+    {"Test": "Glucose", "Value": 95.0, "Unit": "mg/dL", "Reference": "70-99", "Flag": ""},
+]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return HistoryStore(str(tmp_path / "history"))
+
+
+def test_appended_values_read_back(store):
+    assert store.append(REPORT, model="gemma3:4b", image_hash="abc", patient="P1", source="report.png",
+                        timestamp="2025-06-02 08:30") == 2
+    df = store.query(patient="P1")
+    assert list(df["test"]) == ["Glucose", "Hemoglobin"]
+    assert list(df["value"]) == [95.0, 13.5]
+    assert list(df["unit"]) == ["mg/dL", "g/dL"]
+    assert set(df["model"]) == {"gemma3:4b"} and set(df["source"]) == {"report.png"}
+    assert str(df["ts"].iloc[0]) == "2025-06-02 08:30:00+00:00"
+    assert list(store.trend("Hemoglobin", patient="P1")["value"]) == pytest.approx([13.5], rel=0.1)
+    assert store.query(patient="P2").empty
+
+
+def test_same_report_is_stored_once_a_month(store):
+    store.append(REPORT, model="gemma3:4b", image_hash="abc", patient="P1", timestamp="2025-06-02")
+    # Analyzing the same image again, e.g. a rerun answered from the result cache, adds nothing
+    assert store.append(REPORT, model="gemma3:4b", image_hash="abc", patient="P1", timestamp="2025-06-20") == 0
+    # Reports are only looked up in the month they belong to
+    assert store.append(REPORT, model="gemma3:4b", image_hash="abc", patient="P1", timestamp="2025-07-02") == 2
+    assert len(store.query()) == 4
+
+
+def test_other_model_image_or_patient_is_a_new_report(store):
+    store.append(REPORT, model="gemma3:4b", image_hash="abc", patient="P1")
+    assert store.append(REPORT, model="llama3.2-vision:11b", image_hash="abc", patient="P1") == 2
+    assert store.append(REPORT, model="gemma3:4b", image_hash="def", patient="P1") == 2
+    assert store.append(REPORT, model="gemma3:4b", image_hash="abc", patient="P2") == 2
+    assert len(store.query()) == 8
+
+
+def test_values_without_image_hash_are_always_appended(store):
+    store.append(REPORT, model="tesseract")
+    assert store.append(REPORT, model="tesseract") == 2
+    assert len(store.query()) == 4
+
+
+def test_only_stored_rows_of_a_mixed_append_are_skipped(store):
+    store.append(REPORT, model="gemma3:4b", image_hash="abc")
+    rows = [dict(row, ImageHash=image_hash) for image_hash in ("abc", "def") for row in REPORT]
+    assert store.append(rows, model="gemma3:4b") == 2
+    assert sorted(store.query()["image_hash"]) == ["abc", "abc", "def", "def"]
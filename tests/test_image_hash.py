@@ -0,0 +1,111 @@
+import threading
+
+import numpy as np
+import pytest
+
+from image_hash import MAX_DISTANCE, HashIndex
+
+DHASH_DISTANCE = 10
+
+
+def _flip(value: int, bits: int, rng: np.random.Generator) -> int:
+    for bit in rng.choice(64, size=bits, replace=False):
+        value ^= 1 << int(bit)
+    return value
+
+
+def _entries(rng: np.random.Generator, clusters: int = 300, size: int = 10) -> list[tuple[int, int, int, bytes]]:
+    # Clusters of hashes a few bits apart, so lookups have several candidates at different distances
+    entries = []
+    for _ in range(clusters):
+        p, d = (int(h) for h in rng.integers(0, 2 ** 64, size=2, dtype=np.uint64))
+        for _ in range(size):
+            entries.append((_flip(p, int(rng.integers(0, 6)), rng), _flip(d, int(rng.integers(0, 8)), rng),
+                            int(rng.integers(0, 2)), rng.bytes(32)))
+    return entries
+
+
+def _brute_force(entries, p: int, d: int, context: int) -> list:
+    """search() for every max_distance from 0 to MAX_DISTANCE, by comparing with every entry."""
+    distances = [((ep ^ p).bit_count(), (ed ^ d).bit_count(), position, ref)
+                 for position, (ep, ed, econtext, ref) in enumerate(entries) if econtext == context]
+    results = []
+    for max_distance in range(MAX_DISTANCE + 1):
+        # Closest in pHash plus dHash distance, and among equals the most recent entry
+        matches = [(p_dist + d_dist, -position, ref, p_dist) for p_dist, d_dist, position, ref in distances
+                   if p_dist <= max_distance and d_dist <= DHASH_DISTANCE]
+        results.append(min(matches)[2:] if matches else None)
+    return results
+
+
+def _check(index: HashIndex, entries, rng: np.random.Generator, queries: int = 200) -> None:
+    for _ in range(queries):
+        p, d, context, _ = entries[int(rng.integers(0, len(entries)))]
+        p, d = _flip(p, int(rng.integers(0, MAX_DISTANCE + 2)), rng), _flip(d, int(rng.integers(0, 6)), rng)
+        found = [index.search(p, d, context, max_distance, DHASH_DISTANCE) for max_distance in range(MAX_DISTANCE + 1)]
+        assert found == _brute_force(entries, p, d, context)
+
+
+def _index(entries) -> HashIndex:
+    index = HashIndex()
+    for entry in entries:
+        index.add(*entry)
+    return index
+
+
+def test_search_matches_brute_force_before_and_after_rebuild():
+    rng = np.random.default_rng(0)
+    entries = _entries(rng)
+    index = _index(entries)
+    # Fewer entries than the tail limit: everything is scanned linearly
+    assert index._indexed == 0
+    _check(index, entries, rng)
+
+    index._rebuild()
+    _check(index, entries, rng)
+
+    # Bucketed entries plus a tail added since the rebuild
+    more = _entries(rng, clusters=20)
+    for entry in more:
+        index.add(*entry)
+    assert 0 < index._indexed < len(index)
+    _check(index, entries + more, rng)
+
+
+def test_search_matches_brute_force_after_save_and_load(tmp_path):
+    rng = np.random.default_rng(1)
+    entries = _entries(rng)
+    path = str(tmp_path / "index.npz")
+    _index(entries).save(path)
+    loaded = HashIndex.load(path)
+    assert len(loaded) == len(entries)
+    _check(loaded, entries, rng)
+
+
+def test_distance_above_the_exact_limit_is_refused():
+    with pytest.raises(ValueError):
+        HashIndex().search(0, 0, max_distance=MAX_DISTANCE + 1)
+
+
+def test_concurrent_saves_leave_a_complete_file(tmp_path):
+    rng = np.random.default_rng(2)
+    entries = _entries(rng, clusters=50)
+    index = _index(entries)
+    path = str(tmp_path / "index.npz")
+    errors = []
+
+    def save() -> None:
+        try:
+            for _ in range(10):
+                index.save(path)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=save) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert len(HashIndex.load(path)) == len(entries)
+    assert [name.name for name in tmp_path.iterdir()] == ["index.npz"]
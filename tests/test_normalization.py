@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from normalization import convert_value, normalize_frame
+
+
+@pytest.mark.parametrize("test, value, unit, expected", [
+    # Mass concentrations
+    ("Hemoglobin", 13.5, "g/dL", ("HGB", 13.5, "g/dL")),
+    ("Emoglobina", 135, "g/L", ("HGB", 13.5, "g/dL")),
+    ("Hemoglobina", 13.5, "g/100mL", ("HGB", 13.5, "g/dL")),
+    ("CRP", 0.5, "mg/dL", ("CRP", 5.0, "mg/L")),
+    ("Ferritin", 80, "µg/L", ("FERR", 80.0, "ng/mL")),
+    # Molar to mass through the molar mass
+    ("Glucose", 5.5, "mmol/L", ("GLU", 5.5 * 180.16 / 10, "mg/dL")),
+    ("Glicemia", 99, "mg/dL", ("GLU", 99.0, "mg/dL")),
+    ("Colesterolo totale", 5.0, "mmol/L", ("CHOL", 5.0 * 386.65 / 10, "mg/dL")),
+    ("Creatinine", 88.4, "µmol/L", ("CREA", 88.4 * 113.12 / 1e4, "mg/dL")),
+    ("Ferro", 17.9, "umol/L", ("FE", 17.9 * 55.845 / 10, "µg/dL")),
+    # Equivalents through the valence
+    ("Sodium", 140, "mEq/L", ("NA", 140.0, "mmol/L")),
+    ("Calcio", 5, "mEq/L", ("CA", 2.5 * 40.078 / 10, "mg/dL")),
+    # Counts, fractions, hormone units and the affine HbA1c conversion
+    ("WBC", 6.2, "10^3/µL", ("WBC", 6.2, "10^9/L")),
+    ("Leucociti", 6.2, "x10⁹/L", ("WBC", 6.2, "10^9/L")),
+    ("Platelets", 250000, "/mmc", ("PLT", 250.0, "10^9/L")),
+    ("Hematocrit", 0.42, "L/L", ("HCT", 42.0, "%")),
+    ("TSH", 2.1, "µUI/mL", ("TSH", 2.1, "mIU/L")),
+    ("HbA1c", 48, "mmol/mol", ("HBA1C", 48 * 0.09148 + 2.152, "%")),
+])
+def test_conversion_factors(test, value, unit, expected):
+    code, converted, target = convert_value(test, value, unit)
+    assert (code, target) == (expected[0], expected[2])
+    assert converted == pytest.approx(expected[1])
+
+
+@pytest.mark.parametrize("test, unit, code", [
+    ("Hemoglobin", "furlongs", "HGB"),    # unknown unit
+    ("Hemoglobin", "", "HGB"),            # no unit
+    ("Platelets", "mg/dL", "PLT"),        # known unit of the wrong kind
+    ("Unobtainium", "mg/dL", None),       # unknown test
+])
+def test_values_that_cannot_be_converted(test, unit, code):
+    assert convert_value(test, 13.5, unit) == (code, None, "")
+
+
+def test_frame_converts_values_and_references():
+    df = pd.DataFrame({
+        "Test": ["Emoglobina", "Glucose", "WBC"],
+        "Value": [135.0, 5.5, 6.2],
+        "Unit": ["g/L", "mmol/L", "10^3/µL"],
+        "Reference": ["120-160", "3.9-5.5", "< 11"],
+    })
+    out = normalize_frame(df)
+    assert list(out["Code"]) == ["HGB", "GLU", "WBC"]
+    assert list(out["NormUnit"]) == ["g/dL", "mg/dL", "10^9/L"]
+    assert out["NormValue"].to_numpy() == pytest.approx([13.5, 99.088, 6.2])
+    assert out["NormLow"].to_numpy() == pytest.approx([12.0, 3.9 * 18.016, np.nan], nan_ok=True)
+    assert out["NormHigh"].to_numpy() == pytest.approx([16.0, 99.088, 11.0])
+
+
+@pytest.mark.parametrize("value, reference, expected, low, high", [
+    ("13,5", "12,0-16,0", 13.5, 12.0, 16.0),
+    ("13.5", "12.0-16.0", 13.5, 12.0, 16.0),
+    ("1.350,5", "> 1.000,5", 1350.5, 1000.5, np.nan),
+    ("1,350.5", "< 1,234.5", 1350.5, np.nan, 1234.5),
+    (13.5, "", 13.5, np.nan, np.nan),
+])
+def test_decimal_comma(value, reference, expected, low, high):
+    out = normalize_frame(pd.DataFrame({"Test": ["Hemoglobin"], "Value": [value], "Unit": ["g/dL"],
+                                        "Reference": [reference]}))
+    assert out["NormValue"].iloc[0] == pytest.approx(expected)
+    assert out["NormLow"].iloc[0] == pytest.approx(low, nan_ok=True)
+    assert out["NormHigh"].iloc[0] == pytest.approx(high, nan_ok=True)
+
+
+def test_unknown_units_and_tests_pass_through_unchanged():
+    df = pd.DataFrame({
+        "Test": ["Hemoglobin", "Unobtainium", "Hemoglobin"],
+        "Value": ["13,5", "7", "n/a"],
+        "Unit": ["furlongs", "mg/dL", "g/dL"],
+    })
+    out = normalize_frame(df)
+    # The input columns are left as they were
+    pd.testing.assert_frame_equal(out[df.columns], df)
+    assert list(out["Code"]) == ["HGB", "", "HGB"]
+    assert out["NormValue"].isna().all()
+    assert list(out["NormUnit"]) == ["", "", "g/dL"]
@@ -0,0 +1,81 @@
+import pytest
+from PIL import Image
+
+import ocr_backends
+from ocr_backends import OCRResult, OCRRouter, run_ollama_ocr
+from result_cache import ResultCache
+
+GOOD = "| Hemoglobin | 13.5 | g/dL |\n| WBC | 6.2 | 10^3/µL |\n| Platelets | 250 | 10^3/µL |"
+POOR = "Hemoglobin 13.5 g/dL\nWBC ??\nPlatelets ??"
+
+
+class FakeBackend:
+    def __init__(self, name: str, text: str = "", error: bool = False):
+        self.name = name
+        self.text = text
+        self.error = error
+        self.calls = 0
+
+    def recognize(self, image: Image.Image) -> OCRResult:
+        self.calls += 1
+        if self.error:
+            raise RuntimeError("backend down")
+        return OCRResult(self.name, self.text, 0.0)
+
+
+def _image() -> Image.Image:
+    return Image.new("L", (64, 64), 255)
+
+
+def test_router_needs_a_backend():
+    with pytest.raises(ValueError, match="at least one backend"):
+        OCRRouter([])
+
+
+def test_router_stops_at_the_first_good_result():
+    cheap, expensive = FakeBackend("cheap", GOOD), FakeBackend("expensive", GOOD)
+    routed = OCRRouter([cheap, expensive]).route(_image())
+    assert routed.result.backend == "cheap"
+    assert expensive.calls == 0
+
+
+def test_router_escalates_and_keeps_the_best_result():
+    poor, failing, good = FakeBackend("poor", POOR), FakeBackend("failing", error=True), FakeBackend("good", GOOD)
+    routed = OCRRouter([poor, failing, good]).route(_image())
+    assert routed.result.backend == "good"
+    assert [attempt.backend for attempt in routed.attempts] == ["poor", "failing", "good"]
+    assert routed.attempts[1].error == "RuntimeError: backend down"
+
+    # Nothing good enough: the best-scoring attempt without an error wins
+    routed = OCRRouter([FakeBackend("poor", POOR), FakeBackend("failing", error=True)], min_rows=5).route(_image())
+    assert routed.result.backend == "poor"
+
+
+def test_router_reports_the_error_when_every_backend_fails():
+    routed = OCRRouter([FakeBackend("a", error=True), FakeBackend("b", error=True)]).route(_image())
+    assert routed.result.backend == "b" and routed.result.error
+
+
+def test_router_skips_the_backend_that_already_ran():
+    cheap, expensive = FakeBackend("cheap", GOOD), FakeBackend("expensive", GOOD)
+    first = ocr_backends.score_result(OCRResult("cheap", POOR, 0.0))
+    routed = OCRRouter([cheap, expensive]).route(_image(), first=first)
+    assert (cheap.calls, expensive.calls) == (0, 1)
+    assert routed.result.backend == "expensive"
+
+
+def test_cache_keeps_png_and_jpeg_answers_apart(monkeypatch):
+    calls = []
+
+    def process(image, model_name, prompt, priority, lossless):
+        calls.append(lossless)
+        return "png answer" if lossless else "jpeg answer"
+
+    monkeypatch.setattr(ocr_backends, "_process_with_ollama_ocr", process)
+    cache = ResultCache(":memory:")
+    image = _image()
+    assert run_ollama_ocr(image, "gemma3:4b", cache=cache, lossless=True) == "png answer"
+    assert run_ollama_ocr(image, "gemma3:4b", cache=cache, lossless=False) == "jpeg answer"
+    assert run_ollama_ocr(image, "gemma3:4b", cache=cache, lossless=True) == "png answer"
+    assert run_ollama_ocr(image, "gemma3:4b", cache=cache, lossless=False) == "jpeg answer"
+    assert calls == [True, False]
@@ -0,0 +1,103 @@
+import heapq
+import types
+
+import ollama_scheduler
+from ollama_scheduler import OllamaScheduler
+
+MODEL = "gemma3:4b"
+TOKENS = 100
+
+
+class FakeOllama:
+    """
+    Discrete-event stand-in for Ollama behind the scheduler, on a fake clock.
+
+    A request takes latency(running) seconds, where running counts the
+    requests generating alongside it when it starts, and produces TOKENS
+    tokens. A backlog of requests is always queued, so the scheduler is
+    saturated and measures every window.
+    """
+
+    def __init__(self, monkeypatch, scheduler: OllamaScheduler, latency, backlog: int = 16):
+        self.now = 0.0
+        monkeypatch.setattr(ollama_scheduler, "time", types.SimpleNamespace(perf_counter=lambda: self.now))
+        self.scheduler = scheduler
+        self.latency = latency
+        self.backlog = backlog
+        self.queued: list = []
+        self.running: list = []
+        self.overload_next = 0
+        self.order = 0
+        # (completion within its run, limit before, limit after) for every request answered 503
+        self.errors: list[tuple[int, int, int]] = []
+
+    def _start_granted(self) -> None:
+        for slot in [slot for slot in self.queued if slot.granted is not None]:
+            self.queued.remove(slot)
+            self.order += 1
+            if self.overload_next:
+                # Answered 503 right away
+                self.overload_next -= 1
+                slot.overload()
+                finish = self.now
+            else:
+                finish = self.now + self.latency(len(self.running) + 1)
+            heapq.heappush(self.running, (finish, self.order, slot))
+
+    def run(self, requests: int) -> list[int]:
+        """Complete requests, keeping the backlog full; returns the limit after each completion."""
+        limits = []
+        for _ in range(requests):
+            while len(self.queued) < self.backlog:
+                self.queued.append(self.scheduler._enqueue(MODEL, 0, ollama_scheduler.INTERACTIVE, lambda: None))
+            self._start_granted()
+            finish, _, slot = heapq.heappop(self.running)
+            self.now = max(self.now, finish)
+            before = self.scheduler.models[MODEL].limit
+            if not slot.overloaded:
+                slot.add_work(TOKENS)
+            self.scheduler._release(slot)
+            if slot.overloaded:
+                self.errors.append((len(limits), before, self.scheduler.models[MODEL].limit))
+            self._start_granted()
+            limits.append(self.scheduler.models[MODEL].limit)
+        return limits
+
+
+def _parallel(slots: int, seconds: float = 1.0):
+    """Latency of a server generating up to slots requests side by side; beyond that they take turns."""
+    return lambda running: seconds * max(1, running / slots)
+
+
+def _first_decrease(limits: list[int]) -> int:
+    return next((i for i in range(1, len(limits)) if limits[i] < limits[i - 1]), len(limits))
+
+
+def test_limit_grows_while_latency_stays_flat(monkeypatch):
+    ollama = FakeOllama(monkeypatch, OllamaScheduler(max_limit=8), _parallel(4))
+    limits = ollama.run(200)
+    # Climbs straight to the server's parallelism, then only probes one above it
+    assert limits[0] == 1
+    assert limits[_first_decrease(limits) - 1] == 5
+    assert set(limits[100:]) <= {4, 5}
+
+
+def test_limit_shrinks_after_a_latency_regression(monkeypatch):
+    ollama = FakeOllama(monkeypatch, OllamaScheduler(max_limit=8), _parallel(4))
+    before = ollama.run(100)[-1]
+    # Every request now takes three times as long, whatever the concurrency
+    ollama.latency = _parallel(4, seconds=3.0)
+    after = ollama.run(100)
+    assert before >= 4
+    assert min(after) < before
+
+
+def test_limit_shrinks_after_a_server_error(monkeypatch):
+    ollama = FakeOllama(monkeypatch, OllamaScheduler(max_limit=8), _parallel(4))
+    ollama.run(100)
+    ollama.overload_next = 1
+    limits = ollama.run(20)
+    [(at, before, after)] = ollama.errors
+    assert after == before - 1
+    # Held below the failing limit for a few windows before probing again
+    assert max(limits[at:]) == after
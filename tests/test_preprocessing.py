@@ -0,0 +1,44 @@
+import cv2
+import numpy as np
+from PIL import Image
+
+from preprocessing import ADAPTIVE_CONFIG, BatchPreprocessor, preprocess_array, preprocess_batch
+
+
+def _page(width: int, height: int, seed: int = 0) -> np.ndarray:
+    # Light paper with dark text-like strokes, plus noise so thresholds have something to split
+    rng = np.random.default_rng(seed)
+    page = np.full((height, width), 230, dtype=np.uint8)
+    for y in range(40, height - 40, 30):
+        page[y:y + 6, 40:width - 40] = 30
+    noise = rng.integers(-20, 20, size=page.shape)
+    return np.clip(page.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+
+def test_default_matches_original_pipeline():
+    page = _page(1800, 600)
+    upscaled = cv2.resize(page, (3600, 1200), interpolation=cv2.INTER_CUBIC)
+    blurred = cv2.GaussianBlur(upscaled, (5, 5), 0)
+    _, expected = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    np.testing.assert_array_equal(preprocess_array(page), expected)
+
+
+def test_adaptive_skips_upscale_for_large_pages():
+    assert preprocess_array(_page(1800, 600), ADAPTIVE_CONFIG).shape == (600, 1800)
+    assert preprocess_array(_page(800, 600), ADAPTIVE_CONFIG).shape == (1200, 1600)
+    dpi_tagged = Image.fromarray(_page(800, 600))
+    dpi_tagged.info["dpi"] = (300, 300)
+    assert preprocess_array(dpi_tagged, ADAPTIVE_CONFIG).shape == (600, 800)
+
+
+def test_batch_matches_sequential_and_leaves_opencv_threads():
+    pages = [_page(600, 400, seed) for seed in range(6)]
+    threads = cv2.getNumThreads()
+    with BatchPreprocessor(ADAPTIVE_CONFIG, workers=3) as batch:
+        first, second = batch.run(pages), batch.run(pages)
+    assert cv2.getNumThreads() == threads
+    for page, a, b in zip(pages, first, second):
+        expected = preprocess_array(page, ADAPTIVE_CONFIG)
+        np.testing.assert_array_equal(np.asarray(a), expected)
+        np.testing.assert_array_equal(np.asarray(b), expected)
+    assert [np.asarray(image).shape for image in preprocess_batch(pages, workers=2)] == [(800, 1200)] * 6
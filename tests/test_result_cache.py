@@ -0,0 +1,128 @@
+import io
+import itertools
+import threading
+import types
+
+import pytest
+from PIL import Image
+
+import result_cache
+from benchmarks.service import synthetic_upload
+from result_cache import ResultCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Every call is a later time, so least-recently-used order never depends on timer resolution
+    ticks = itertools.count()
+    monkeypatch.setattr(result_cache, "time", types.SimpleNamespace(time=lambda: float(next(ticks))))
+
+
+def _page(seed: int) -> Image.Image:
+    return Image.open(io.BytesIO(synthetic_upload(seed, size=(400, 500)))).convert("L")
+
+
+def _stored(cache: ResultCache) -> int:
+    return cache.stats()["size_bytes"]
+
+
+def test_hit_and_miss_by_key():
+    cache = ResultCache(":memory:")
+    key = cache.make_key(_page(0), "gemma3:4b", None, "markdown")
+    assert cache.make_key(_page(0), "gemma3:4b", None, "markdown") == key
+    others = {
+        cache.make_key(_page(1), "gemma3:4b", None, "markdown"),
+        cache.make_key(_page(0), "llama3.2-vision:11b", None, "markdown"),
+        cache.make_key(_page(0), "gemma3:4b", "Only the table", "markdown"),
+        cache.make_key(_page(0), "gemma3:4b", None, "markdown-stream"),
+    }
+    assert key not in others and len(others) == 4
+
+    assert cache.get(key) is None
+    cache.put(key, "| Hemoglobin | 13.5 | g/dL |")
+    assert cache.get(key) == "| Hemoglobin | 13.5 | g/dL |"
+    assert all(cache.get(other) is None for other in others)
+    assert (cache.hits, cache.misses) == (1, 5)
+
+
+def test_least_recently_used_entries_are_evicted(clock):
+    cache = ResultCache(":memory:", max_bytes=100)
+    for key in "abcd":
+        cache.put(key, key * 30)
+    # 120 bytes: the oldest entry goes
+    assert cache.get("a") is None
+    assert _stored(cache) == cache._total == 90
+
+    # Reading b makes c the least recently used
+    cache.get("b")
+    cache.put("e", "e" * 30)
+    assert [key for key in "bcde" if cache.get(key) is not None] == ["b", "d", "e"]
+    assert _stored(cache) == cache._total == 90
+
+
+def test_running_total_follows_replacements_and_clear(clock):
+    cache = ResultCache(":memory:", max_bytes=100)
+    cache.put("a", "a" * 60)
+    cache.put("a", "a" * 10)
+    cache.put("b", "b" * 80)
+    assert cache.get("a") == "a" * 10 and cache.get("b") == "b" * 80
+    assert _stored(cache) == cache._total == 90
+    cache.clear()
+    assert _stored(cache) == cache._total == 0
+
+
+def test_total_counts_entries_written_by_another_process(tmp_path, clock):
+    path = str(tmp_path / "results.sqlite")
+    cache, other = ResultCache(path, max_bytes=100), ResultCache(path, max_bytes=100)
+    cache.put("a", "a" * 40)
+    other.put("b", "b" * 40)
+    # This instance's running total has not seen b yet, but the eviction re-reads the sum
+    cache.put("c", "c" * 40)
+    assert cache.get("a") is None
+    assert _stored(cache) == cache._total == 80
+    cache.close()
+    other.close()
+
+
+def test_concurrent_puts_and_gets(tmp_path):
+    cache = ResultCache(str(tmp_path / "results.sqlite"), max_bytes=5000)
+    errors = []
+
+    def worker(thread: int) -> None:
+        try:
+            for i in range(200):
+                key = f"{thread}-{i}"
+                cache.put(key, key * 10)
+                assert cache.get(key) == key * 10
+                cache.get(f"{(thread + 1) % 4}-{i}")
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(thread,)) for thread in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert cache.hits >= 800 and cache.hits + cache.misses == 1600
+    assert _stored(cache) == cache._total <= cache.max_bytes
+    cache.close()
+
+
+def test_near_duplicate_reuses_the_first_copy(tmp_path):
+    path = str(tmp_path / "results.sqlite")
+    cache = ResultCache(path, near_duplicates=True)
+    original = _page(0)
+    key = cache.make_key(original, "gemma3:4b", None, "markdown")
+    cache.put(key, "| MCV | 88 | fL |")
+    buffer = io.BytesIO()
+    original.save(buffer, format="JPEG", quality=70)
+    copy = Image.open(buffer).convert("L")
+    assert cache.make_key(copy, "gemma3:4b", None, "markdown") == key
+    assert cache.make_key(copy, "llama3.2-vision:11b", None, "markdown") != key
+    cache.close()
+
+    # The index is saved next to the database and found again
+    reopened = ResultCache(path, near_duplicates=True)
+    assert reopened.get(reopened.make_key(copy, "gemma3:4b", None, "markdown")) == "| MCV | 88 | fL |"
+    reopened.close()
@@ -0,0 +1,29 @@
+import os
+
+import pytest
+
+from benchmarks.startup import BUDGET_SECONDS, app_imports, probe
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_first_render_imports_stay_light(monkeypatch):
+    # The probes import the app's modules in a fresh interpreter from the repository root
+    monkeypatch.chdir(ROOT)
+    base = probe(["streamlit"])
+    app = probe(app_imports()["first_render"])
+    assert not {"cv2", "torch", "ollama_ocr"} & set(app["heavy"])
+    assert app["seconds"] - base["seconds"] <= BUDGET_SECONDS
+
+
+def test_first_render_runs(monkeypatch, tmp_path):
+    pytest.importorskip("streamlit")
+    from streamlit.testing.v1 import AppTest
+
+    monkeypatch.chdir(ROOT)
+    monkeypatch.setenv("LABSNAP_HISTORY_DIR", str(tmp_path / "history"))
+    app = AppTest.from_file(os.path.join(ROOT, "streamlit_app.py"), default_timeout=30).run()
+    assert not app.exception
+    # Nothing uploaded yet: only the uploader and the history toggle are shown
+    assert [box.label for box in app.checkbox] == ["📈 Show trends from history"]
+    assert not app.error
@@ -0,0 +1,41 @@
+import json
+
+import pytest
+
+from structured_output import IncrementalRowParser, is_complete_row, rows_from_document, rows_to_values
+
+DOCUMENT = {"text_blocks": [
+    {"test_name": "Hemoglobin", "value": 13.5, "unit": "g/dL"},
+    {"test_name": "HCV Ab", "value": "neg", "unit": ""},
+    {"test_name": "CRP", "value": "<0.5 (see note)", "unit": "mg/L"},
+    {"test_name": "Glucose", "value": "95", "unit": "mg/dL"},
+    {"test_name": "Ferritin", "value": "N/A", "unit": "ng/mL"}
+]}
+
+
+@pytest.mark.parametrize("value", ["N/A", "neg", "<0.5 (see note)"])
+def test_non_numeric_value_keeps_its_text(value):
+    row = {"test_name": "X", "value": value, "unit": ""}
+    assert is_complete_row(row)
+    assert rows_to_values([row])[0]["Value"] == value
+
+
+def test_non_numeric_values_do_not_break_a_document():
+    values = rows_to_values(rows_from_document(DOCUMENT))
+    assert [row["Value"] for row in values] == [13.5, "neg", "<0.5 (see note)", 95.0, "N/A"]
+
+
+def test_rows_streamed_one_character_at_a_time():
+    text = json.dumps(DOCUMENT)
+    parser = IncrementalRowParser()
+    rows = [row for char in text for row in parser.feed(char)]
+    assert rows == DOCUMENT["text_blocks"]
+    assert parser.complete and parser.text == text
+
+
+def test_truncated_stream_is_repaired_to_its_complete_rows():
+    text = json.dumps(DOCUMENT)
+    parser = IncrementalRowParser()
+    parser.feed(text[:text.index("Glucose") + 20])
+    assert not parser.complete
+    assert rows_from_document(parser.repair()) == DOCUMENT["text_blocks"][:3]